@@ -9,21 +9,17 @@ from dataclasses import dataclass
 from typing import Dict, List, Optional
 import sqlite3
 from threading import Lock
-import requests
-from selenium.webdriver.common.proxy import Proxy, ProxyType
-from selenium.common.exceptions import WebDriverException
+from http_client import EgressIPCache
+
+from event_log import setup_event_log, get_logger
 
-# ログ設定
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('tiktok_bot_monitor.log'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
+def setup_logging():
+    """ログ設定（インポート時ではなく監視システム利用時に一度だけ行う）"""
+    # 書き込みは event_log のキューと書き込みスレッド経由（呼び出し元でファイルI/Oを行わない）
+    setup_event_log()
+
 @dataclass
 class DetectionEvent:
     """検出イベントの記録"""
@@ -38,14 +34,19 @@ class BotDetectionMonitor:
     """Bot検出の監視と対策システム"""
     
     def __init__(self, db_path="bot_detection.db"):
+        setup_logging()
         self.db_path = db_path
         self.lock = Lock()
-        self.setup_database()
+        self.database_ready = False
         self.proxy_pool = ProxyManager()
         self.user_agent_pool = UserAgentPool()
         
     def setup_database(self):
-        """データベースの初期化"""
+        """データベースの初期化（初回アクセス時に実行）"""
+        if self.database_ready:
+            return
+        self.database_ready = True
+        
         with sqlite3.connect(self.db_path) as conn:
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS detection_events (
@@ -68,9 +69,20 @@ class BotDetectionMonitor:
                     status TEXT DEFAULT 'active'
                 )
             """)
+            
+            # セッション別・期間別の検索とキーセットページングに使う索引
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_detection_events_session_time
+                ON detection_events (session_id, timestamp, id)
+            """)
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_detection_events_time
+                ON detection_events (timestamp, id)
+            """)
 
     def record_event(self, event: DetectionEvent):
         """イベントの記録"""
+        self.setup_database()
         with self.lock:
             with sqlite3.connect(self.db_path) as conn:
                 conn.execute("""
@@ -88,6 +100,7 @@ class BotDetectionMonitor:
 
     def calculate_risk_score(self, session_id: str) -> float:
         """セッションのリスクスコア計算"""
+        self.setup_database()
         with sqlite3.connect(self.db_path) as conn:
             cursor = conn.execute("""
                 SELECT event_type, timestamp FROM detection_events 
@@ -123,6 +136,110 @@ class BotDetectionMonitor:
         risk_score = self.calculate_risk_score(session_id)
         return risk_score > 5.0
 
+    @staticmethod
+    def _event_filters(session_id=None, since=None, until=None):
+        """検索条件のWHERE句とパラメーター"""
+        clauses, params = [], []
+        if session_id:
+            clauses.append("session_id = ?")
+            params.append(session_id)
+        if since:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        if until:
+            clauses.append("timestamp < ?")
+            params.append(until)
+        return clauses, params
+
+    def query_events(self, session_id=None, since=None, until=None, cursor=None, limit=100):
+        """イベントの検索（(timestamp, id) によるキーセットページング）
+
+        cursor は前ページの next_cursor（"timestamp,id"）。OFFSET を使わないため、
+        ページが進んでも索引の範囲走査だけで済む。
+        """
+        self.setup_database()
+        clauses, params = self._event_filters(session_id, since, until)
+        if cursor:
+            last_timestamp, last_id = cursor.rsplit(',', 1)
+            clauses.append("(timestamp, id) > (?, ?)")
+            params.extend([last_timestamp, int(last_id)])
+        
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            rows = conn.execute(f"""
+                SELECT id, timestamp, event_type, ip_address, user_agent, session_id, details
+                FROM detection_events {where}
+                ORDER BY timestamp, id
+                LIMIT ?
+            """, params + [limit]).fetchall()
+        finally:
+            conn.close()
+        
+        columns = ("id", "timestamp", "event_type", "ip_address", "user_agent", "session_id", "details")
+        events = [dict(zip(columns, row)) for row in rows]
+        next_cursor = f"{events[-1]['timestamp']},{events[-1]['id']}" if len(events) == limit else None
+        return events, next_cursor
+
+    def iter_events(self, session_id=None, since=None, until=None, batch_size=1000):
+        """全件の逐次取得（バッチごとに問い合わせ、結果全体をメモリに載せない）"""
+        cursor = None
+        while True:
+            events, cursor = self.query_events(session_id, since, until, cursor, batch_size)
+            yield from events
+            if cursor is None:
+                return
+
+    def aggregate_events(self, bucket_seconds=3600, session_id=None, since=None, until=None):
+        """時間バケット・イベント種別ごとの件数（集計はSQLite側で行う）"""
+        self.setup_database()
+        clauses, params = self._event_filters(session_id, since, until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            rows = conn.execute(f"""
+                SELECT datetime(CAST(strftime('%s', timestamp) AS INTEGER) / ? * ?, 'unixepoch') AS bucket,
+                       event_type, COUNT(*)
+                FROM detection_events {where}
+                GROUP BY bucket, event_type
+                ORDER BY bucket
+            """, [bucket_seconds, bucket_seconds] + params).fetchall()
+        finally:
+            conn.close()
+        
+        buckets = {}
+        for bucket, event_type, count in rows:
+            buckets.setdefault(bucket, {})[event_type] = count
+        return [{"bucket": bucket, "counts": counts} for bucket, counts in buckets.items()]
+
+    def query_session_health(self, status=None, cursor=None, limit=100):
+        """セッション状態の一覧（session_id によるキーセットページング）"""
+        self.setup_database()
+        clauses, params = [], []
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        if cursor:
+            clauses.append("session_id > ?")
+            params.append(cursor)
+        
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            rows = conn.execute(f"""
+                SELECT session_id, last_success, failure_count, risk_score, status
+                FROM session_health {where}
+                ORDER BY session_id
+                LIMIT ?
+            """, params + [limit]).fetchall()
+        finally:
+            conn.close()
+        
+        columns = ("session_id", "last_success", "failure_count", "risk_score", "status")
+        sessions = [dict(zip(columns, row)) for row in rows]
+        next_cursor = sessions[-1]["session_id"] if len(sessions) == limit else None
+        return sessions, next_cursor
+
 class ProxyManager:
     """プロキシ管理システム"""
     
@@ -275,6 +392,8 @@ class EnhancedTikTokDriverV2:
         self.delay_manager = AdaptiveDelayManager()
         self.current_proxy = None
         self.driver = None
+        self.log = get_logger(__name__, session=session_id)
+        self.egress_ip = EgressIPCache()
         
     def setup_driver_with_proxy(self, proxy_config=None):
         """プロキシ付きドライバーの設定"""
@@ -307,6 +426,9 @@ class EnhancedTikTokDriverV2:
         
         self.driver = webdriver.Chrome(options=options)
         self.apply_stealth_techniques()
+        
+        # 送信元IPはプロキシ経由で確認する（ドライバー再作成のたびに取り直す）
+        self.egress_ip.invalidate({"http": proxy_url, "https": proxy_url} if proxy_config else None)
     
     def apply_random_browser_settings(self, options):
         """ランダムなブラウザ設定"""
@@ -394,7 +516,7 @@ class EnhancedTikTokDriverV2:
             try:
                 self.driver.execute_script(script)
             except Exception as e:
-                logger.warning(f"ステルススクリプト実行失敗: {e}")
+                self.log.warning(f"ステルススクリプト実行失敗: {e}")
     
     def detect_bot_detection(self) -> bool:
         """Bot検出の有無をチェック"""
@@ -455,7 +577,7 @@ class EnhancedTikTokDriverV2:
             return success
             
         except Exception as e:
-            logger.error(f"アクション実行エラー: {e}")
+            self.log.error(f"アクション実行エラー: {e}")
             self.delay_manager.report_result(False)
             return False
     
@@ -496,23 +618,23 @@ class EnhancedTikTokDriverV2:
     
     def handle_captcha(self):
         """Captcha対応"""
-        logger.warning("Captcha検出 - 手動解決が必要です")
+        self.log.warning("Captcha検出 - 手動解決が必要です")
         if not self.headless:
             input("Captchaを解決してEnterを押してください...")
     
     def handle_block(self):
         """ブロック対応"""
-        logger.warning("ブロック検出 - 戦略変更が必要です")
+        self.log.warning("ブロック検出 - 戦略変更が必要です")
         self.switch_strategy()
     
     def switch_strategy(self):
         """戦略変更"""
-        logger.info("戦略変更を実行")
+        self.log.info("戦略変更を実行")
         
         # 新しいプロキシに変更
         new_proxy = self.monitor.proxy_pool.get_best_proxy()
         if new_proxy and new_proxy != self.current_proxy:
-            logger.info("プロキシ変更")
+            self.log.info("プロキシ変更")
             self.driver.quit()
             self.setup_driver_with_proxy(new_proxy)
         
@@ -523,12 +645,8 @@ class EnhancedTikTokDriverV2:
         time.sleep(random.uniform(300, 600))  # 5-10分待機
     
     def get_current_ip(self) -> str:
-        """現在のIPアドレス取得"""
-        try:
-            response = requests.get("https://httpbin.org/ip", timeout=5)
-            return response.json().get('origin', 'unknown')
-        except:
-            return 'unknown'
+        """現在のIPアドレス取得（キャッシュ値を返し、期限切れならバックグラウンドで再取得）"""
+        return self.egress_ip.get()
     
     def execute_action(self, action_type: str, **kwargs) -> bool:
         """具体的なアクション実行"""
@@ -1,117 +1,745 @@
 # api_server.py - 既存のAPIサーバーを拡張
 import os
+import re
 import json
 import time
+import signal
 import threading
-from flask import Flask, request, jsonify
-from enhanced_tiktok_driver import EnhancedTikTokDriver
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests
+from flask import Flask, Response, request, jsonify, redirect
+from session_store import create_session_store
+from cluster import cluster_from_env
+from deadline import Deadline
+from clock import interrupt_all
+from metrics import REGISTRY
+from profiles import ProfileManager
+from http_client import get_session
+from connection_registry import ConnectionRecord, ConnectionRegistry
+from cookie_export import CookieExporter
+from profiler import PROFILER, ProfilerBusy
+from fair_scheduler import FairScheduler, ApiClient, ANONYMOUS_CLIENT, clients_from_env, API_KEY_REQUIRED, SCHEDULER_CONNECT_CONCURRENCY
+from settings import PoolSettings, SettingsError
+from teardown import DriverTeardown, SHUTDOWN_TIMEOUT, SHUTDOWN_KILLED
+from process_tree import executable, snapshot_descendants, kill_remaining
+from traffic_capture import TRAFFIC_CAPTURE_PATH, CAPTURED_PATHS, TrafficRecorder
 
 app = Flask(__name__)
 
+# プール状態のスナップショット保存先と起動時の並列復元数
+POOL_STATE_PATH = os.getenv('POOL_STATE_PATH', './sessions/pool_state.json')
+RESTORE_CONCURRENCY = int(os.getenv('RESTORE_CONCURRENCY', '4'))
+
+# 一括接続・切断の並列数（リクエストの concurrency で上限まで変更可能）と1回の最大件数
+BULK_CONCURRENCY = int(os.getenv('BULK_CONCURRENCY', '4'))
+BULK_MAX_CONCURRENCY = int(os.getenv('BULK_MAX_CONCURRENCY', '16'))
+BULK_MAX_IDS = int(os.getenv('BULK_MAX_IDS', '1000'))
+
+# 管理用エンドポイントの認証トークン（未設定なら管理APIは無効）
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+
+# ドライバーを動かすワーカープロセス数（0ならAPIプロセス内で実行）
+DRIVER_WORKERS = int(os.getenv('DRIVER_WORKERS', '2'))
+
+# Chromeプロファイルの保存先（軽量プロファイルではtmpfs上に置いてディスクI/Oを避ける）
+if os.getenv('DRIVER_PROFILE') == 'lean' and os.path.isdir('/dev/shm'):
+    PROFILE_ROOT = os.getenv('PROFILE_ROOT', '/dev/shm/tiktok-profiles')
+else:
+    PROFILE_ROOT = os.getenv('PROFILE_ROOT', './profiles')
+
+# 他ノードへの転送タイムアウト（秒）
+CLUSTER_FORWARD_TIMEOUT = float(os.getenv('CLUSTER_FORWARD_TIMEOUT', '300'))
+
+# ノード自身が発行する転送（メンバー変更時の接続移行）に付けるAPIキー
+# 全ノードで同じ値を設定する。API_CLIENTS に未登録なら cluster クライアントとして扱う
+CLUSTER_API_KEY = os.getenv('CLUSTER_API_KEY')
+
+# リクエスト全体の処理期限（秒、X-Request-Timeout ヘッダーで上書き可能）
+REQUEST_TIMEOUT = float(os.getenv('REQUEST_TIMEOUT', '300'))
+
+# Bot検出イベントのDB（advanced_monitoring.BotDetectionMonitor と共有）
+MONITOR_DB_PATH = os.getenv('MONITOR_DB_PATH', 'bot_detection.db')
+MONITOR_PAGE_LIMIT = int(os.getenv('MONITOR_PAGE_LIMIT', '1000'))
+
+# 接続整理（アイドル切断・最大接続数の超過分の切断）の間隔（秒）
+# 最大接続数を下げた時は POOL_EVICTION_INTERVAL ごとに POOL_EVICTION_BATCH 件ずつ切断する
+POOL_MAINTENANCE_INTERVAL = float(os.getenv('POOL_MAINTENANCE_INTERVAL', '30'))
+POOL_EVICTION_INTERVAL = float(os.getenv('POOL_EVICTION_INTERVAL', '1'))
+POOL_EVICTION_BATCH = int(os.getenv('POOL_EVICTION_BATCH', '1'))
+
+POOL_CONNECTIONS = REGISTRY.gauge(
+    "tiktok_pool_connections", "Connections in the pool by status", ("status",)
+)
+POOL_EVICTIONS = REGISTRY.counter(
+    "tiktok_pool_evictions_total", "Connections closed by the pool itself", ("reason",)
+)
+
+def publish_pool_gauges(snapshot):
+    """状態別の接続数をメトリクスに反映（共有メトリクスファイルなら他プロセスからも読める）"""
+    counts = {"connecting": 0, "connected": 0}
+    for connection in snapshot.values():
+        counts[connection.status] = counts.get(connection.status, 0) + 1
+    for status_name, count in counts.items():
+        POOL_CONNECTIONS.labels(status=status_name).set(count)
+
+# uniqueIdはファイル名・プロファイルのディレクトリ名に使うため、TikTokのユーザー名に使える文字に限る
+UNIQUE_ID_PATTERN = re.compile(r'[A-Za-z0-9_.\-]{1,64}')
+
+def valid_unique_id(unique_id):
+    """パス区切りや '..' を含まないuniqueIdか"""
+    return (
+        isinstance(unique_id, str) and UNIQUE_ID_PATTERN.fullmatch(unique_id) is not None
+        and unique_id.strip('.') != ''
+    )
+
+def acquire_until(lock, deadline):
+    """処理期限までロックを待つ（取得できればTrue）"""
+    remaining = deadline.remaining()
+    return lock.acquire(timeout=-1 if remaining is None else remaining)
+
+def load_driver_class():
+    """ドライバークラスの遅延インポート（Seleniumの読み込みを起動後に回す）"""
+    from enhanced_tiktok_driver import EnhancedTikTokDriver
+    return EnhancedTikTokDriver
+
 class TikTokConnectionPool:
-    def __init__(self):
-        self.connections = {}
+    def __init__(self, state_path=POOL_STATE_PATH):
+        # 接続状態（書き込みはself.lock下、読み取りはconnections.snapshotをロックなしで参照）
+        self.connections = ConnectionRegistry(on_publish=publish_pool_gauges)
         self.drivers = {}
+        # 接続ごとのドライバー操作のロック（プールのロックを持たずに送信を直列化する）
+        self.driver_locks = {}
+        # uniqueId -> 起動処理中の接続の完了イベント（切断直後の再接続は先行する起動の完了を待つ）
+        self.connect_attempts = {}
         self.lock = threading.Lock()
+        self.state_path = state_path
+        self.session_store = create_session_store()
+        self.profiles = ProfileManager(PROFILE_ROOT)
+        # Node側（src/conn/manager.ts）が参照する cookies.json への書き出し
+        self.cookie_exporter = CookieExporter()
+        # driver.quit() は数秒かかるため、ロック外のバックグラウンドスレッドで行う
+        self.teardown = DriverTeardown()
+        # 実行中に管理APIから変更できる設定（変更は次の処理から反映）
+        self.settings = PoolSettings.from_env()
+        self.settings.on_change(self._apply_settings)
+        self.launch_condition = threading.Condition()
+        self.launching = 0
+        self.maintenance_wakeup = threading.Event()
+        self.worker_pool = None
+        self.ready = False
+        self.restore_progress = {
+            "state": "idle",
+            "total": 0,
+            "restored": 0,
+            "failed": 0
+        }
     
-    def create_connection(self, unique_id):
+    def create_connection(self, unique_id, deadline=None):
         """接続作成（拡張版）"""
         with self.lock:
-            if unique_id in self.connections:
+            existing = self.connections.get(unique_id)
+            if existing is not None:
+                if existing.status == "connecting":
+                    return {"status": "connecting"}
                 return {"status": "already_connected"}
             
-            try:
-                # 拡張ドライバーの使用
-                driver = EnhancedTikTokDriver(
-                    headless=True,
-                    user_data_dir=f"./profiles/{unique_id}"
-                )
+            max_connections = self.settings.max_connections
+            if max_connections and len(self.connections) >= max_connections:
+                return {"status": "pool_full", "message": f"接続数が上限（{max_connections}件）に達しています"}
+            
+            # ドライバー起動中もエントリを確保し、重複起動を防ぐ
+            now = time.time()
+            record = ConnectionRecord(unique_id, "connecting", created_at=now, last_used=now)
+            self.connections.add(record)
+            previous = self.connect_attempts.get(unique_id)
+            attempt = self.connect_attempts[unique_id] = threading.Event()
+        
+        try:
+            return self._connect(unique_id, record, previous, deadline or Deadline())
+        finally:
+            with self.lock:
+                if self.connect_attempts.get(unique_id) is attempt:
+                    del self.connect_attempts[unique_id]
+            attempt.set()
+    
+    def _connect(self, unique_id, record, previous, deadline):
+        """create_connection の本体（record が切断・再接続で置き換わっていれば結果を捨てる）"""
+        # 切断後に再接続された場合は、先行する起動がドライバーを手放すまで待つ
+        if previous is not None and not previous.wait(deadline.remaining()):
+            self._drop_record(unique_id, record)
+            return {"status": "timeout", "message": "前回の接続処理の完了待ちで処理期限を超過しました"}
+        
+        # 直前に切断した同じuniqueIdのChromeがプロファイルを使い終わるまで待つ
+        if not self.teardown.wait(unique_id, deadline.remaining()):
+            self._drop_record(unique_id, record)
+            return {"status": "timeout", "message": "前回の接続の終了待ちで処理期限を超過しました"}
+        
+        if not self._acquire_launch_slot(deadline):
+            self._drop_record(unique_id, record)
+            return {"status": "timeout", "message": "Chrome起動の順番待ちで処理期限を超過しました"}
+        
+        # 待っている間に切断された場合は起動しない
+        with self.lock:
+            cancelled = self.connections.get(unique_id) is not record
+        if cancelled:
+            self._release_launch_slot()
+            return {"status": "disconnected"}
+        
+        # Chrome起動やログインはロック外で実行し、他の接続をブロックしない
+        try:
+            result, driver = self._open_driver(unique_id, deadline)
+        finally:
+            self._release_launch_slot()
+        
+        with self.lock:
+            current = self.connections.get(unique_id) is record
+            if result["status"] != "connected":
+                if current:
+                    self.connections.pop(unique_id)
+                return result
+            
+            if not current:
+                # 起動中に切断要求（とその後の再接続）が来た場合は破棄する
+                self.teardown.close(unique_id, driver, on_closed=lambda: self._prune_profile(unique_id))
+                return {"status": "disconnected"}
+            
+            self.drivers[unique_id] = driver
+            self.driver_locks[unique_id] = threading.Lock()
+            self.connections.update(
+                unique_id, status="connected", session_info=result["session_info"], session_checked_at=time.time()
+            )
+        
+        self.cookie_exporter.update(result["session_info"], unique_id)
+        return result
+    
+    def _drop_record(self, unique_id, record):
+        """接続処理中のエントリを外す（切断後に作られた別のエントリは残す）"""
+        with self.lock:
+            if self.connections.get(unique_id) is record:
+                self.connections.pop(unique_id)
+    
+    def _acquire_launch_slot(self, deadline):
+        """Chrome起動の同時実行枠（connect_concurrency）を期限まで待って取得"""
+        with self.launch_condition:
+            while self.launching >= self.settings.connect_concurrency:
+                remaining = deadline.remaining()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.launch_condition.wait(remaining)
+            self.launching += 1
+            return True
+    
+    def _release_launch_slot(self):
+        with self.launch_condition:
+            self.launching -= 1
+            self.launch_condition.notify_all()
+    
+    def _apply_settings(self, changed):
+        """設定変更の反映（起動枠の待機を再判定し、接続整理をすぐに行う）"""
+        if "connect_concurrency" in changed:
+            with self.launch_condition:
+                self.launch_condition.notify_all()
+        if "max_connections" in changed or "idle_timeout" in changed:
+            self.maintenance_wakeup.set()
+    
+    def _new_driver(self, unique_id, deadline):
+        """ドライバー生成（ワーカー有効時はワーカープロセス上に作成）"""
+        options = {
+            "headless": True,
+            "user_data_dir": self.profiles.prepare(unique_id)
+        }
+        if self.worker_pool:
+            return self.worker_pool.create_driver(unique_id, deadline=deadline, **options)
+        return load_driver_class()(session_store=self.session_store, unique_id=unique_id, **options)
+    
+    def _handle_lost_drivers(self, unique_ids):
+        """ワーカー再起動で失われた接続をプールから除外"""
+        with self.lock:
+            for unique_id in unique_ids:
+                self.drivers.pop(unique_id, None)
+                self.driver_locks.pop(unique_id, None)
+                self.connections.pop(unique_id)
+        for unique_id in unique_ids:
+            self.cookie_exporter.forget(unique_id)
+        print(f"ワーカー再起動により接続を破棄: {', '.join(unique_ids)}")
+    
+    def _open_driver(self, unique_id, deadline):
+        """ドライバー起動とセッション確立（ロック外で実行）"""
+        driver = None
+        try:
+            # 拡張ドライバーの使用
+            driver = self._new_driver(unique_id, deadline)
+            deadline.check("ドライバー起動")
+            
+            # セッション復元または新規ログイン（他のレプリカが保存したCookieも利用）
+            session_restored = driver.load_session(unique_id, deadline=deadline)
+            
+            if not session_restored:
+                # 環境変数から認証情報取得
+                username = os.getenv('TIKTOK_USERNAME')
+                password = os.getenv('TIKTOK_PASSWORD')
                 
-                # セッション復元または新規ログイン
-                session_restored = driver.load_session(f"./sessions/{unique_id}_session.json")
+                if not username or not password:
+                    driver.close()
+                    return {"status": "error", "message": "認証情報が設定されていません"}, None
                 
-                if not session_restored:
-                    # 環境変数から認証情報取得
-                    username = os.getenv('TIKTOK_USERNAME')
-                    password = os.getenv('TIKTOK_PASSWORD')
-                    
-                    if not username or not password:
-                        return {"status": "error", "message": "認証情報が設定されていません"}
-                    
-                    # 安全なナビゲーションとログイン
-                    if driver.safe_navigate_to_tiktok():
-                        if driver.enhanced_login(username, password):
-                            # セッション保存
-                            os.makedirs("./sessions", exist_ok=True)
-                            driver.save_session(f"./sessions/{unique_id}_session.json")
-                        else:
-                            driver.close()
-                            return {"status": "error", "message": "ログインに失敗しました"}
+                # 安全なナビゲーションとログイン
+                if driver.safe_navigate_to_tiktok(deadline=deadline):
+                    if driver.enhanced_login(username, password, deadline=deadline):
+                        # セッション保存
+                        driver.save_session(unique_id, deadline=deadline)
                     else:
                         driver.close()
-                        return {"status": "error", "message": "TikTokアクセスに失敗しました"}
-                
-                # セッション情報取得
-                session_info = driver.get_session_info()
-                
-                # 接続情報保存
-                self.drivers[unique_id] = driver
-                self.connections[unique_id] = {
-                    "status": "connected",
-                    "session_info": session_info,
-                    "created_at": time.time()
-                }
-                
+                        return {"status": "error", "message": "ログインに失敗しました"}, None
+                else:
+                    driver.close()
+                    return {"status": "error", "message": "TikTokアクセスに失敗しました"}, None
+            
+            # セッション情報取得
+            session_info = driver.get_session_info(deadline=deadline)
+            if session_restored:
+                # 復元後にCookieが更新されていればストアに書き戻す
+                driver.sync_session(unique_id, session_info, deadline=deadline)
+            
+            return {
+                "status": "connected",
+                "session_info": session_info
+            }, driver
+            
+        except Exception as e:
+            if driver:
+                try:
+                    driver.close()
+                except Exception:
+                    pass
+            # 処理期限切れ・ワーカー呼び出しのタイムアウトはタイムアウトとして返す
+            status = "timeout" if isinstance(e, TimeoutError) else "error"
+            return {"status": status, "message": str(e)}, None
+    
+    def send_message(self, unique_id, message, deadline=None):
+        """メッセージ送信（拡張版）
+
+        プールのロックは接続の確認と記録の更新の間だけ持ち、ドライバー操作はロック外で行う。
+        同じ接続への送信は接続ごとのロックで直列化する。
+        """
+        deadline = deadline or Deadline()
+        if not acquire_until(self.lock, deadline):
+            return {"status": "timeout", "message": "接続プールのロック待ちで処理期限を超過しました"}
+        try:
+            connection = self.connections.get(unique_id)
+            if connection is None:
+                return {"status": "error", "message": "接続が存在しません"}
+            
+            if connection.status != "connected":
+                return {"status": "error", "message": "接続処理中です"}
+            
+            now = time.time()
+            send_rate = self.settings.send_rate
+            if send_rate and now - connection.last_sent < 1.0 / send_rate:
                 return {
-                    "status": "connected",
-                    "session_info": session_info
+                    "status": "rate_limited",
+                    "message": f"送信レートの上限（{send_rate}件/秒）を超えています",
+                    "retry_after": round(connection.last_sent + 1.0 / send_rate - now, 3)
                 }
-                
+            
+            driver = self.drivers[unique_id]
+            driver_lock = self.driver_locks[unique_id]
+            self.connections.update(unique_id, last_used=now, last_sent=now)
+        finally:
+            self.lock.release()
+        
+        if not acquire_until(driver_lock, deadline):
+            return {"status": "timeout", "message": "同じ接続の送信待ちで処理期限を超過しました"}
+        try:
+            # 人間らしい行動パターンを追加
+            driver.simulate_human_behavior(deadline=deadline)
+            
+            # 既存のメッセージ送信ロジック
+            # （元のプロジェクトのsendMessage実装をここに統合）
+            
+            # セッション情報の更新（cookie_cache_ttl 以内に取得済みなら再取得しない）
+            if now - connection.session_checked_at < self.settings.cookie_cache_ttl:
+                session_info = connection.session_info
+            else:
+                session_info = driver.get_session_info(deadline=deadline)
+                if session_info != connection.session_info:
+                    # 更新されたCookieを他のレプリカと共有する
+                    driver.sync_session(unique_id, session_info, deadline=deadline)
+                # 送信中に切断・再接続された場合は新しい接続の記録を上書きしない
+                with self.lock:
+                    if self.drivers.get(unique_id) is driver:
+                        self.connections.update(unique_id, session_info=session_info, session_checked_at=time.time())
+                self.cookie_exporter.update(session_info, unique_id)
+            
+            return {
+                "status": "sent",
+                "message": message,
+                "session_info": session_info
+            }
+            
+        except TimeoutError as e:
+            return {"status": "timeout", "message": str(e)}
+        except Exception as e:
+            return {"status": "error", "message": str(e)}
+        finally:
+            driver_lock.release()
+    
+    def disconnect(self, unique_id):
+        """接続切断（エントリを外して即時に応答し、Chromeの終了はバックグラウンドで行う）"""
+        with self.lock:
+            driver = self.drivers.pop(unique_id, None)
+            self.driver_locks.pop(unique_id, None)
+            self.connections.pop(unique_id)
+        self.cookie_exporter.forget(unique_id)
+        
+        # Chrome終了後にキャッシュを削除（ディスク走査も終了処理のスレッドで行う）
+        if driver is not None:
+            self.teardown.close(unique_id, driver, on_closed=lambda: self._prune_profile(unique_id))
+        
+        return {"status": "disconnected"}
+    
+    def _prune_profile(self, unique_id):
+        try:
+            self.profiles.prune(unique_id)
+        except OSError as e:
+            print(f"プロファイルのキャッシュ削除エラー ({unique_id}): {e}")
+    
+    def _maintenance_loop(self):
+        """設定に合わせた接続の整理（アイドル接続と最大接続数の超過分を切断）"""
+        while True:
+            try:
+                over_limit = self._evict_connections()
             except Exception as e:
-                return {"status": "error", "message": str(e)}
+                print(f"接続整理エラー: {e}")
+                over_limit = False
+            # 超過分は一度に切断せず、短い間隔で少しずつ減らす
+            self.maintenance_wakeup.wait(POOL_EVICTION_INTERVAL if over_limit else POOL_MAINTENANCE_INTERVAL)
+            self.maintenance_wakeup.clear()
+    
+    def _evict_connections(self):
+        """アイドル接続をすべて、超過分を最終利用の古い順に POOL_EVICTION_BATCH 件切断（まだ超過していればTrue）"""
+        now = time.time()
+        connected = sorted(
+            (c for c in self.connections.snapshot.values() if c.status == "connected"),
+            key=lambda c: c.last_used or c.created_at
+        )
+        
+        idle_timeout = self.settings.idle_timeout
+        if idle_timeout:
+            for connection in list(connected):
+                if now - (connection.last_used or connection.created_at) > idle_timeout:
+                    if self._evict(connection, "idle"):
+                        connected.remove(connection)
+        
+        max_connections = self.settings.max_connections
+        if not max_connections:
+            return False
+        for connection in connected[:POOL_EVICTION_BATCH]:
+            if len(self.connections.snapshot) <= max_connections:
+                break
+            self._evict(connection, "max_connections")
+        return len(self.connections.snapshot) > max_connections
     
-    def send_message(self, unique_id, message):
-        """メッセージ送信（拡張版）"""
+    def _evict(self, connection, reason):
+        """選んだ時点から使われていなければ切断"""
+        unique_id = connection.unique_id
         with self.lock:
-            if unique_id not in self.connections:
-                return {"status": "error", "message": "接続が存在しません"}
-            
+            current = self.connections.get(unique_id)
+            if current is None or current.last_used != connection.last_used:
+                return False
+            driver = self.drivers.pop(unique_id, None)
+            self.driver_locks.pop(unique_id, None)
+            self.connections.pop(unique_id)
+        self.cookie_exporter.forget(unique_id)
+        
+        if driver is not None:
+            self.teardown.close(unique_id, driver, reason="evict", on_closed=lambda: self._prune_profile(unique_id))
+        POOL_EVICTIONS.labels(reason=reason).inc()
+        print(f"接続を切断 ({reason}): {unique_id}")
+        return True
+    
+    def close_all(self, timeout=SHUTDOWN_TIMEOUT):
+        """全ドライバーを並列に終了（期限までに終わらなかったuniqueId一覧を返す）"""
+        with self.lock:
+            drivers, self.drivers = self.drivers, {}
+            self.driver_locks = {}
+        return self.teardown.close_all(drivers, timeout)
+    
+    def resource_usage(self):
+        """接続ごとのブラウザの資源使用量と起動プロファイル別の平均（ドライバーへの問い合わせはロック外）"""
+        with self.lock:
+            drivers = dict(self.drivers)
+        
+        connections = {}
+        for unique_id, driver in drivers.items():
             try:
-                driver = self.drivers[unique_id]
-                
-                # 人間らしい行動パターンを追加
-                driver.simulate_human_behavior()
-                
-                # 既存のメッセージ送信ロジック
-                # （元のプロジェクトのsendMessage実装をここに統合）
-                
-                # セッション情報の更新
-                session_info = driver.get_session_info()
-                self.connections[unique_id]["session_info"] = session_info
-                
-                return {
-                    "status": "sent",
-                    "message": message,
-                    "session_info": session_info
-                }
-                
+                connections[unique_id] = driver.resource_usage()
             except Exception as e:
-                return {"status": "error", "message": str(e)}
+                connections[unique_id] = {"error": str(e)}
+        
+        profiles = {}
+        for usage in connections.values():
+            if "profile" not in usage:
+                continue
+            summary = profiles.setdefault(usage["profile"], {"count": 0, "rss_bytes": 0, "launch_seconds": 0.0})
+            summary["count"] += 1
+            summary["rss_bytes"] += usage["rss_bytes"]
+            summary["launch_seconds"] += usage["launch_seconds"] or 0.0
+        for summary in profiles.values():
+            summary["rss_bytes_avg"] = summary.pop("rss_bytes") // summary["count"]
+            summary["launch_seconds_avg"] = summary.pop("launch_seconds") / summary["count"]
+        
+        return {"connections": connections, "profiles": profiles}
     
-    def disconnect(self, unique_id):
-        """接続切断"""
+    def active_ids(self):
+        """接続中・接続処理中のuniqueId一覧"""
+        return list(self.connections.snapshot)
+    
+    def save_state(self):
+        """接続中のuniqueIdと最終利用時刻をスナップショットとして保存"""
+        state = {
+            "saved_at": time.time(),
+            "connections": {
+                unique_id: {"last_used": connection.last_used or connection.created_at}
+                for unique_id, connection in self.connections.snapshot.items()
+            }
+        }
+        
+        directory = os.path.dirname(self.state_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        # 書き込み途中のクラッシュで壊れないよう一時ファイル経由で置き換える
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.state_path)
+        
+        print(f"プール状態保存完了: {len(state['connections'])}件")
+        return state
+    
+    def restore_state(self, max_workers=RESTORE_CONCURRENCY):
+        """保存済みスナップショットから接続を並列に復元"""
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                saved = json.load(f).get("connections", {})
+        except FileNotFoundError:
+            saved = {}
+        except Exception as e:
+            print(f"プール状態読み込みエラー: {e}")
+            saved = {}
+        
+        # セッションファイルが残っているものだけ復元対象にする（最近使われた順）
+        unique_ids = [
+            unique_id for unique_id, _ in sorted(
+                saved.items(), key=lambda item: item[1].get("last_used", 0), reverse=True
+            )
+            if self.session_store.exists(unique_id)
+        ]
+        
+        # 進捗は更新のたびに新しい辞書へ差し替え、/health はロックなしで読む
         with self.lock:
-            if unique_id in self.drivers:
-                self.drivers[unique_id].close()
-                del self.drivers[unique_id]
-            
-            if unique_id in self.connections:
-                del self.connections[unique_id]
+            self.restore_progress = {
+                "state": "restoring",
+                "total": len(unique_ids),
+                "restored": 0,
+                "failed": 0
+            }
+        
+        for unique_id, result in self.run_bulk(self.create_connection, unique_ids, max_workers):
+            ok = result["status"] in ("connected", "already_connected")
             
-            return {"status": "disconnected"}
+            with self.lock:
+                key = "restored" if ok else "failed"
+                self.restore_progress = {**self.restore_progress, key: self.restore_progress[key] + 1}
+                # 復元した接続の最終利用時刻を引き継ぐ
+                connection = self.connections.get(unique_id)
+                if ok and connection is not None:
+                    self.connections.update(
+                        unique_id, last_used=saved[unique_id].get("last_used", connection.last_used)
+                    )
+        
+        with self.lock:
+            self.restore_progress = {**self.restore_progress, "state": "done"}
+            progress = self.restore_progress
+        
+        print(f"プール復元完了: {progress['restored']}/{progress['total']}件 (失敗 {progress['failed']}件)")
+        return progress
+    
+    def run_bulk(self, operation, unique_ids, max_workers):
+        """uniqueIdごとの処理を最大 max_workers 並列で実行し、完了した順に (uniqueId, 結果) を返す"""
+        if not unique_ids:
+            return
+        
+        executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+        try:
+            futures = {executor.submit(operation, unique_id): unique_id for unique_id in unique_ids}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {"status": "error", "message": str(e)}
+                yield futures[future], result
+        finally:
+            # 呼び出し側が途中で読み取りをやめた場合（クライアント切断など）は未開始の処理を取り消す
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    def initialize(self):
+        """重いモジュールの読み込み後にready化し、続けて前回の接続を復元"""
+        if DRIVER_WORKERS > 0:
+            # Selenium はワーカープロセス側でのみ読み込む
+            from driver_workers import DriverWorkerPool
+            self.worker_pool = DriverWorkerPool(DRIVER_WORKERS, on_lost=self._handle_lost_drivers)
+            self.worker_pool.start()
+        else:
+            load_driver_class()
+        self.ready = True
+        print("接続プール初期化完了")
+        
+        # 長期間接続されていないuniqueIdのプロファイルを定期的に削除
+        self.profiles.start_cleanup(self.active_ids)
+        threading.Thread(target=self._maintenance_loop, daemon=True).start()
+        
+        self.restore_state()
 
+# 以下は initialize_services() でサーバー起動時に生成する
+# （ワーカープロセスは spawn 時に起動スクリプトを __mp_main__ として読み込み直すため、
+#   インポートしただけでは接続プールやスレッドを作らない）
 # グローバル接続プール
-connection_pool = TikTokConnectionPool()
+connection_pool = None
+# クラスタ構成（CLUSTER_NODES未設定なら単体ノード）
+cluster = None
+# APIクライアント（X-API-Key）と、クライアント間で実行枠を公平に配分するスケジューラー
+# （操作ごとに別の枠。/disconnect はリソースを解放する処理のため枠を待たせない）
+api_clients = {}
+schedulers = {}
+# リクエスト記録（TRAFFIC_CAPTURE_PATH 設定時のみ、replay.py で再生できる）
+traffic_recorder = None
+
+def initialize_services():
+    """接続プール・クラスタ構成・APIクライアント・スケジューラー・リクエスト記録を生成（2回目以降は何もしない）"""
+    global connection_pool, cluster, api_clients, schedulers, traffic_recorder
+    if connection_pool is not None:
+        return
+    
+    connection_pool = TikTokConnectionPool()
+    cluster = cluster_from_env()
+    
+    api_clients = clients_from_env()
+    if CLUSTER_API_KEY:
+        api_clients.setdefault(CLUSTER_API_KEY, ApiClient("cluster"))
+    elif cluster is not None and API_KEY_REQUIRED:
+        print("警告: API_KEY_REQUIRED ですが CLUSTER_API_KEY が未設定のため、メンバー変更時の接続移行は拒否されます")
+    schedulers = {
+        'connect': FairScheduler(SCHEDULER_CONNECT_CONCURRENCY, name='connect'),
+        'send': FairScheduler(name='send')
+    }
+    
+    traffic_recorder = TrafficRecorder(TRAFFIC_CAPTURE_PATH) if TRAFFIC_CAPTURE_PATH else None
+
+def request_client():
+    """X-API-Key からクライアントを特定（未登録キーは anonymous、キー必須の設定ならNone）"""
+    client = api_clients.get(request.headers.get('X-API-Key', ''))
+    if client is None and API_KEY_REQUIRED:
+        return None
+    return client or ANONYMOUS_CLIENT
+
+def unknown_client():
+    return jsonify({"error": "valid X-API-Key is required"}), 401
+
+def require_admin():
+    """管理APIの認証（失敗時はエラーレスポンスを返す）"""
+    if not ADMIN_TOKEN:
+        return jsonify({"error": "admin API is disabled"}), 403
+    if request.headers.get('X-Admin-Token') != ADMIN_TOKEN:
+        return jsonify({"error": "unauthorized"}), 401
+    return None
+
+def request_deadline():
+    """X-Request-Timeout ヘッダー（秒）または REQUEST_TIMEOUT から処理期限を生成"""
+    seconds = REQUEST_TIMEOUT
+    header = request.headers.get('X-Request-Timeout')
+    if header:
+        try:
+            seconds = float(header)
+        except ValueError:
+            pass
+    return Deadline(seconds if seconds > 0 else None)
+
+def error_status(result):
+    """結果ステータスに対応するHTTPステータス"""
+    if result["status"] == "rate_limited":
+        return 429
+    if result["status"] == "pool_full":
+        return 503
+    return 504 if result["status"] == "timeout" else 500
+
+def forward_to_node(node_url, path, payload, deadline=None, api_key=None):
+    """担当ノードへリクエストを転送（残り時間とAPIキーを転送先に引き継ぐ）"""
+    headers = {"X-Cluster-Forwarded": cluster.self_url}
+    if api_key:
+        headers["X-API-Key"] = api_key
+    timeout = CLUSTER_FORWARD_TIMEOUT
+    if deadline is not None and deadline.remaining() is not None:
+        headers["X-Request-Timeout"] = f"{deadline.remaining():.3f}"
+        timeout = min(timeout, deadline.remaining() + 5.0)
+    
+    response = get_session().post(
+        f"{node_url}{path}",
+        json=payload,
+        headers=headers,
+        timeout=timeout
+    )
+    return Response(
+        response.content,
+        status=response.status_code,
+        content_type=response.headers.get('Content-Type', 'application/json')
+    )
+
+@app.before_request
+def capture_start():
+    """記録開始時刻（担当ノードへの転送より先に記録する）"""
+    if traffic_recorder:
+        request.environ['capture.started'] = time.monotonic()
+
+@app.after_request
+def capture_request(response):
+    """対象エンドポイントのリクエストと結果ステータスを記録"""
+    if traffic_recorder and request.path in CAPTURED_PATHS:
+        traffic_recorder.record(
+            request.environ.get('capture.started', time.monotonic()),
+            request.method,
+            request.path,
+            request.get_json(silent=True),
+            response.status_code
+        )
+    return response
+
+@app.before_request
+def route_to_owner():
+    """担当外のuniqueIdへのリクエストを担当ノードへ転送またはリダイレクト"""
+    if cluster is None or request.path not in ('/connect', '/send', '/disconnect'):
+        return None
+    
+    # 転送済みリクエストは再転送しない（メンバー構成の不一致によるループ防止）
+    if request.headers.get('X-Cluster-Forwarded'):
+        return None
+    
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({"error": "request body must be a JSON object"}), 400
+    unique_id = data.get('uniqueId')
+    if not isinstance(unique_id, str) or not unique_id or cluster.is_local(unique_id):
+        return None
+    
+    owner = cluster.owner(unique_id)
+    if cluster.mode == 'redirect':
+        return redirect(f"{owner}{request.path}", code=307)
+    
+    try:
+        return forward_to_node(owner, request.path, data, request_deadline(), request.headers.get('X-API-Key'))
+    except requests.RequestException as e:
+        return jsonify({"status": "error", "message": f"担当ノードへの転送に失敗しました: {e}", "node": owner}), 502
 
 @app.route('/connect', methods=['POST'])
 def connect():
@@ -121,11 +749,18 @@ def connect():
     
     if not unique_id:
         return jsonify({"error": "uniqueId is required"}), 400
+    if not valid_unique_id(unique_id):
+        return jsonify({"error": "invalid uniqueId"}), 400
+    
+    client = request_client()
+    if client is None:
+        return unknown_client()
     
-    result = connection_pool.create_connection(unique_id)
+    deadline = request_deadline()
+    result = schedulers['connect'].run(client, 'connect', connection_pool.create_connection, unique_id, deadline, deadline=deadline)
     
-    if result["status"] == "error":
-        return jsonify(result), 500
+    if result["status"] in ("error", "timeout", "rate_limited", "pool_full"):
+        return jsonify(result), error_status(result)
     
     return jsonify(result)
 
@@ -138,11 +773,18 @@ def send():
     
     if not unique_id or not message:
         return jsonify({"error": "uniqueId and message are required"}), 400
+    if not valid_unique_id(unique_id):
+        return jsonify({"error": "invalid uniqueId"}), 400
+    
+    client = request_client()
+    if client is None:
+        return unknown_client()
     
-    result = connection_pool.send_message(unique_id, message)
+    deadline = request_deadline()
+    result = schedulers['send'].run(client, 'send', connection_pool.send_message, unique_id, message, deadline, deadline=deadline)
     
-    if result["status"] == "error":
-        return jsonify(result), 500
+    if result["status"] in ("error", "timeout", "rate_limited"):
+        return jsonify(result), error_status(result)
     
     return jsonify(result)
 
@@ -154,42 +796,392 @@ def disconnect():
     
     if not unique_id:
         return jsonify({"error": "uniqueId is required"}), 400
+    if not valid_unique_id(unique_id):
+        return jsonify({"error": "invalid uniqueId"}), 400
+    
+    client = request_client()
+    if client is None:
+        return unknown_client()
     
     result = connection_pool.disconnect(unique_id)
     return jsonify(result)
 
+def bulk_response(path, operation):
+    """一括処理の共通部分（uniqueIdごとの結果を完了順にNDJSONで返し、最後に集計行を付ける）
+
+    body: {"uniqueIds": [...], "concurrency": 4, "timeout": 300}
+    timeout は各uniqueIdの処理開始からの期限（秒）。担当外のuniqueIdは担当ノードへ転送する。
+    """
+    client = request_client()
+    if client is None:
+        return unknown_client()
+    api_key = request.headers.get('X-API-Key')
+    operation_name = path.strip('/')
+    
+    data = request.get_json(silent=True) or {}
+    unique_ids = data.get('uniqueIds')
+    if not isinstance(unique_ids, list) or not unique_ids or not all(isinstance(u, str) and u for u in unique_ids):
+        return jsonify({"error": "uniqueIds must be a non-empty list of strings"}), 400
+    invalid = [unique_id for unique_id in unique_ids if not valid_unique_id(unique_id)]
+    if invalid:
+        return jsonify({"error": f"invalid uniqueIds: {', '.join(invalid[:10])}"}), 400
+    
+    unique_ids = list(dict.fromkeys(unique_ids))
+    if len(unique_ids) > BULK_MAX_IDS:
+        return jsonify({"error": f"too many uniqueIds (max {BULK_MAX_IDS})"}), 400
+    
+    try:
+        concurrency = min(int(data.get('concurrency', BULK_CONCURRENCY)), BULK_MAX_CONCURRENCY)
+        timeout = float(data.get('timeout', REQUEST_TIMEOUT))
+    except (TypeError, ValueError):
+        return jsonify({"error": "concurrency and timeout must be numbers"}), 400
+    
+    def run(unique_id):
+        deadline = Deadline(timeout if timeout > 0 else None)
+        if cluster is not None and not cluster.is_local(unique_id):
+            owner = cluster.owner(unique_id)
+            try:
+                response = forward_to_node(owner, path, {"uniqueId": unique_id}, deadline, api_key)
+                return json.loads(response.get_data())
+            except (requests.RequestException, ValueError) as e:
+                return {"status": "error", "message": f"担当ノードへの転送に失敗しました: {e}", "node": owner}
+        # 一括処理の各uniqueIdも通常のリクエストと同じ実行枠を使う（切断は枠を待たない）
+        if operation_name not in schedulers:
+            return operation(unique_id, deadline)
+        return schedulers[operation_name].run(client, operation_name, operation, unique_id, deadline, deadline=deadline)
+    
+    def generate():
+        failed = 0
+        for unique_id, result in connection_pool.run_bulk(run, unique_ids, concurrency):
+            if result.get("status") in ("error", "timeout", "rate_limited", "pool_full"):
+                failed += 1
+            yield json.dumps({"uniqueId": unique_id, **result}, ensure_ascii=False) + "\n"
+        yield json.dumps({"summary": {"total": len(unique_ids), "failed": failed}}) + "\n"
+    
+    return Response(generate(), mimetype='application/x-ndjson')
+
+@app.route('/connect/bulk', methods=['POST'])
+def connect_bulk():
+    """一括接続（並列数を制限し、完了したものから結果を返す）"""
+    return bulk_response('/connect', connection_pool.create_connection)
+
+@app.route('/disconnect/bulk', methods=['POST'])
+def disconnect_bulk():
+    """一括切断"""
+    return bulk_response('/disconnect', lambda unique_id, deadline: connection_pool.disconnect(unique_id))
+
+def all_processes_connections():
+    """全サーバープロセスの接続数（共有メトリクスファイル未使用ならNone）"""
+    if not REGISTRY.store.shared:
+        return None
+    prefix = "tiktok_pool_connections{"
+    return int(sum(value for key, value in REGISTRY.snapshot().items() if key.startswith(prefix)))
+
 @app.route('/health', methods=['GET'])
 def health():
     """ヘルスチェック（拡張版）"""
+    # 書き込みロックは取らず、公開済みのスナップショットを読む
     return jsonify({
         "status": "healthy",
-        "active_connections": len(connection_pool.connections),
+        "active_connections": len(connection_pool.connections.snapshot),
+        "restore": connection_pool.restore_progress,
+        "metrics_processes": REGISTRY.store.live_processes() if REGISTRY.store.shared else None,
+        "all_processes_connections": all_processes_connections(),
         "timestamp": time.time()
     })
 
+@app.route('/health/live', methods=['GET'])
+def health_live():
+    """ライブネス（プロセスが応答できれば即時200）"""
+    return jsonify({"status": "alive", "timestamp": time.time()})
+
+@app.route('/health/ready', methods=['GET'])
+def health_ready():
+    """レディネス（接続プール初期化完了まで503）"""
+    if not connection_pool.ready:
+        return jsonify({"status": "initializing", "timestamp": time.time()}), 503
+    
+    return jsonify({"status": "ready", "timestamp": time.time()})
+
 @app.route('/status', methods=['GET'])
 def status():
     """ステータス確認（新機能）"""
-    with connection_pool.lock:
-        connections_status = {}
-        for unique_id, connection in connection_pool.connections.items():
-            connections_status[unique_id] = {
-                "status": connection["status"],
-                "created_at": connection["created_at"],
-                "session_valid": bool(connection["session_info"])
-            }
+    # 書き込みロックは取らず、公開済みのスナップショットを読む（接続処理中でも待たない）
+    connections_status = {}
+    for unique_id, connection in connection_pool.connections.snapshot.items():
+        connections_status[unique_id] = {
+            "status": connection.status,
+            "created_at": connection.created_at,
+            "session_valid": bool(connection.session_info),
+            "profile_bytes": connection_pool.profiles.disk_usage(unique_id)
+        }
     
     return jsonify({
         "connections": connections_status,
-        "total_connections": len(connection_pool.connections)
+        "total_connections": len(connections_status),
+        "scheduler": {name: scheduler.stats() for name, scheduler in schedulers.items()},
+        "teardown_pending": len(connection_pool.teardown.pending),
+        "settings": connection_pool.settings.as_dict(),
+        "profile_bytes_total": sum(c["profile_bytes"] or 0 for c in connections_status.values())
+    })
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus形式のメトリクス（ワーカープロセス分も合算）"""
+    publish_pool_gauges(connection_pool.connections.snapshot)
+    
+    # 共有メトリクスファイル使用時はワーカーの値もファイルから読めるため問い合わせない
+    extra = ()
+    if connection_pool.worker_pool and not REGISTRY.store.shared:
+        extra = connection_pool.worker_pool.collect_metrics()
+    return Response(REGISTRY.render(extra), mimetype='text/plain; version=0.0.4')
+
+@app.route('/cluster', methods=['GET'])
+def cluster_info():
+    """クラスタ構成の確認"""
+    if cluster is None:
+        return jsonify({"enabled": False})
+    
+    return jsonify({
+        "enabled": True,
+        "self": cluster.self_url,
+        "members": cluster.members,
+        "mode": cluster.mode
+    })
+
+@app.route('/cluster/members', methods=['POST'])
+def cluster_members():
+    """メンバー変更（担当が移ったuniqueIdのみ新担当ノードへ移動）"""
+    error = require_admin()
+    if error:
+        return error
+    if cluster is None:
+        return jsonify({"error": "cluster mode is disabled"}), 400
+    
+    nodes = (request.json or {}).get('members')
+    if not nodes:
+        return jsonify({"error": "members is required"}), 400
+    
+    local_ids = list(connection_pool.connections.snapshot)
+    moved = cluster.update_members(nodes, local_ids)
+    
+    def migrate():
+        for unique_id, owner in moved.items():
+            connection_pool.disconnect(unique_id)
+            try:
+                response = forward_to_node(owner, '/connect', {"uniqueId": unique_id}, api_key=CLUSTER_API_KEY)
+            except requests.RequestException as e:
+                print(f"接続移行エラー ({unique_id} -> {owner}): {e}")
+                continue
+            if response.status_code >= 400:
+                print(f"接続移行エラー ({unique_id} -> {owner}): HTTP {response.status_code}")
+    
+    threading.Thread(target=migrate, daemon=True).start()
+    
+    return jsonify({"members": cluster.members, "moved": moved})
+
+_monitor = None
+_monitor_lock = threading.Lock()
+
+def get_monitor():
+    """検出イベント参照用のモニター（初回アクセス時に生成）"""
+    global _monitor
+    with _monitor_lock:
+        if _monitor is None:
+            from advanced_monitoring import BotDetectionMonitor
+            _monitor = BotDetectionMonitor(MONITOR_DB_PATH)
+        return _monitor
+
+def event_filters():
+    """クエリ文字列の検索条件（session_id, since, until はISO形式の時刻）"""
+    return {
+        "session_id": request.args.get('session_id'),
+        "since": request.args.get('since'),
+        "until": request.args.get('until')
+    }
+
+@app.route('/monitor/events', methods=['GET'])
+def monitor_events():
+    """検出イベントのページング取得（next_cursor を cursor に渡して次ページ）"""
+    error = require_admin()
+    if error:
+        return error
+    
+    limit = min(request.args.get('limit', 100, type=int), MONITOR_PAGE_LIMIT)
+    try:
+        events, next_cursor = get_monitor().query_events(
+            cursor=request.args.get('cursor'), limit=max(1, limit), **event_filters()
+        )
+    except ValueError:
+        return jsonify({"error": "invalid cursor"}), 400
+    
+    return jsonify({"events": events, "next_cursor": next_cursor})
+
+@app.route('/monitor/events/aggregate', methods=['GET'])
+def monitor_events_aggregate():
+    """時間バケット（bucket 秒）・イベント種別ごとの件数"""
+    error = require_admin()
+    if error:
+        return error
+    
+    bucket = request.args.get('bucket', 3600, type=int)
+    if bucket <= 0:
+        return jsonify({"error": "bucket must be positive"}), 400
+    
+    return jsonify({
+        "bucket_seconds": bucket,
+        "buckets": get_monitor().aggregate_events(bucket, **event_filters())
     })
 
+@app.route('/monitor/events/export', methods=['GET'])
+def monitor_events_export():
+    """検出イベントの全件エクスポート（NDJSONで逐次送信）"""
+    error = require_admin()
+    if error:
+        return error
+    
+    events = get_monitor().iter_events(**event_filters())
+    
+    def generate():
+        for event in events:
+            yield json.dumps(event, ensure_ascii=False) + "\n"
+    
+    return Response(generate(), mimetype='application/x-ndjson')
+
+@app.route('/monitor/sessions', methods=['GET'])
+def monitor_sessions():
+    """セッション状態（session_health）のページング取得"""
+    error = require_admin()
+    if error:
+        return error
+    
+    limit = min(request.args.get('limit', 100, type=int), MONITOR_PAGE_LIMIT)
+    sessions, next_cursor = get_monitor().query_session_health(
+        status=request.args.get('status'), cursor=request.args.get('cursor'), limit=max(1, limit)
+    )
+    return jsonify({"sessions": sessions, "next_cursor": next_cursor})
+
+@app.route('/admin/settings', methods=['GET', 'PATCH'])
+def admin_settings():
+    """接続プールの実行時設定の参照・変更（PATCHは変更する項目だけを送る）
+
+    body: {"max_connections": 20, "connect_concurrency": 4, "idle_timeout": 3600,
+           "cookie_cache_ttl": 60, "send_rate": 0.5}
+    """
+    error = require_admin()
+    if error:
+        return error
+    
+    if request.method == 'GET':
+        return jsonify(connection_pool.settings.as_dict())
+    
+    try:
+        return jsonify(connection_pool.settings.update(request.get_json(silent=True)))
+    except SettingsError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route('/admin/resources', methods=['GET'])
+def admin_resources():
+    """接続ごとのブラウザの起動プロファイル・起動時間・常駐メモリ（lean / default の比較用）"""
+    error = require_admin()
+    if error:
+        return error
+    return jsonify(connection_pool.resource_usage())
+
+@app.route('/admin/profile', methods=['POST'])
+def admin_profile():
+    """指定秒数だけサンプリングプロファイラーを動かし、集約スタックとスレッド状態を返す
+
+    body: {"seconds": 10, "interval": 0.005, "format": "json" | "collapsed"}
+    ワーカープロセスも同時に計測する（collapsed ではプロセス名がスタックの根になる）。
+    """
+    error = require_admin()
+    if error:
+        return error
+    
+    data = request.get_json(silent=True) or {}
+    try:
+        seconds = float(data.get('seconds', 10))
+        interval = float(data['interval']) if data.get('interval') else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "seconds and interval must be numbers"}), 400
+    if seconds <= 0:
+        return jsonify({"error": "seconds must be positive"}), 400
+    
+    # APIプロセスとワーカープロセスを同じ区間で計測する
+    workers = {}
+    worker_thread = None
+    if connection_pool.worker_pool:
+        def collect():
+            workers.update(connection_pool.worker_pool.collect_profiles(seconds, interval))
+        worker_thread = threading.Thread(target=collect, daemon=True)
+        worker_thread.start()
+    
+    try:
+        result = PROFILER.run(seconds, interval)
+    except ProfilerBusy as e:
+        return jsonify({"error": str(e)}), 409
+    finally:
+        if worker_thread:
+            worker_thread.join()
+    
+    if data.get('format') == 'collapsed':
+        lines = [f"api;{line}" for line in result["collapsed"].splitlines()]
+        for name, worker_result in workers.items():
+            lines.extend(f"{name};{line}" for line in worker_result.get("collapsed", "").splitlines())
+        return Response("\n".join(lines) + "\n", mimetype='text/plain')
+    
+    result["workers"] = workers
+    return jsonify(result)
+
+def shutdown(signum=None, frame=None):
+    """グレースフルシャットダウン（接続状態を保存し、全ドライバーを終了して終了）"""
+    try:
+        connection_pool.save_state()
+    except Exception as e:
+        print(f"プール状態保存エラー: {e}")
+    if traffic_recorder:
+        traffic_recorder.close()
+    try:
+        connection_pool.cookie_exporter.stop()
+    except Exception as e:
+        print(f"cookies.json 書き込みエラー: {e}")
+    
+    # 人間らしさのための待機を打ち切り、接続・送信中のスレッドを早く終わらせる
+    interrupt_all()
+    
+    # 終了処理の前に子孫のブラウザプロセス（chromedriver・Chrome）を記録しておく
+    # （ワーカー等のPythonプロセスは worker_pool.shutdown で停止する）
+    processes = snapshot_descendants(os.getpid(), executable(os.getpid()))
+    started = time.monotonic()
+    remaining = connection_pool.close_all(SHUTDOWN_TIMEOUT)
+    if remaining:
+        print(f"ドライバー終了待ちがタイムアウト: {', '.join(remaining)}")
+    if connection_pool.worker_pool:
+        connection_pool.worker_pool.shutdown()
+    
+    # 期限内に終わらなかったChromeやワーカーから切り離されたChromeを強制終了
+    killed = kill_remaining(processes)
+    if killed:
+        SHUTDOWN_KILLED.inc(killed)
+        print(f"残っていたブラウザプロセスを強制終了: {killed}件")
+    print(f"シャットダウン完了 ({time.monotonic() - started:.1f}秒)")
+    raise SystemExit(0)
+
 if __name__ == '__main__':
+    initialize_services()
+    
     # 必要なディレクトリ作成
-    os.makedirs("./profiles", exist_ok=True)
+    os.makedirs(PROFILE_ROOT, exist_ok=True)
     os.makedirs("./sessions", exist_ok=True)
     
-    app.run(host='0.0.0.0', port=3000, debug=False)
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    
+    # 初期化と前回接続の並列復元はバックグラウンドで行い、/health/liveは即時応答させる
+    threading.Thread(target=connection_pool.initialize, daemon=True).start()
+    
+    app.run(host='0.0.0.0', port=int(os.getenv('PORT', '3000')), debug=False)
 
 # Dockerfile
 dockerfile_content = '''
@@ -286,14 +1278,27 @@ env_example_content = '''
 TIKTOK_USERNAME=your_username_here
 TIKTOK_PASSWORD=your_password_here
 
-# オプション設定
+# セッション保存先（複数レプリカで共有する場合は redis://redis:6379/0 など）
+SESSION_STORE_URL=file://./sessions
+
+# Node側と共有するCookieファイル（Cookieが変わった時だけ更新、空文字で無効）
+COOKIE_CACHE_PATH=./cookies.json
+
+# オプション設定（MAX_CONNECTIONS以下は実行中に PATCH /admin/settings で変更可能）
 HEADLESS_MODE=true
 MAX_CONNECTIONS=10
-SESSION_TIMEOUT=3600
+CONNECT_CONCURRENCY=4
+IDLE_TIMEOUT=3600
+COOKIE_CACHE_TTL=0
+SEND_RATE=0
+
+# 複数プロセスで共有するメトリクスファイル（起動前に削除、未設定ならプロセスごとに保持）
+# METRICS_MMAP_PATH=/dev/shm/tiktok-metrics.bin
 '''
 
-print("=== Docker関連ファイル ===")
-print("Dockerfile:", dockerfile_content)
-print("\\nrequirements.txt:", requirements_content)
-print("\\ndocker-compose.yml:", docker_compose_content)
-print("\\n.env.example:", env_example_content)
+if __name__ == '__main__':
+    print("=== Docker関連ファイル ===")
+    print("Dockerfile:", dockerfile_content)
+    print("\\nrequirements.txt:", requirements_content)
+    print("\\ndocker-compose.yml:", docker_compose_content)
+    print("\\n.env.example:", env_example_content)
@@ -0,0 +1,138 @@
+# clock.py - 待機処理の時計抽象化（実時間 / 倍率付き / 仮想時間）
+import os
+import time
+import weakref
+import threading
+from contextlib import contextmanager
+
+# このプロセスで生成した実時間の時計（シャットダウン時に待機中のスレッドをまとめて起こす）
+_real_clocks = weakref.WeakSet()
+_real_clocks_lock = threading.Lock()
+
+# スレッドごとの実行中の枠（WaitSlots.hold() の中でだけ設定され、RealClock の待機中に手放す）
+_current_slots = threading.local()
+
+class RealClock:
+    """実時間の時計（待機は interrupt() / interrupt_all() で中断可能）
+
+    WaitSlots.hold() の中で待機する場合は、待機中だけ実行枠を手放して他の呼び出しに譲る。
+    シャットダウン時は interrupt_all() で待機を打ち切り、ドライバーの終了を待たせない。
+    """
+
+    def __init__(self):
+        self.interrupted = threading.Event()
+        with _real_clocks_lock:
+            _real_clocks.add(self)
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        # time.sleep と異なり、シャットダウン時などに interrupt() で即座に起こせる
+        if seconds <= 0:
+            return
+        slots = getattr(_current_slots, 'slots', None)
+        if slots is None:
+            self.interrupted.wait(seconds)
+            return
+        slots.yield_during(self.interrupted.wait, seconds)
+
+    def interrupt(self):
+        """待機中のスレッドをすべて起こす（以降の待機も即時に戻る）"""
+        self.interrupted.set()
+
+class ScaledClock(RealClock):
+    """待機時間に倍率を掛ける時計（scale=0 で待機なし）"""
+
+    def __init__(self, scale):
+        super().__init__()
+        self.scale = scale
+
+    def sleep(self, seconds):
+        super().sleep(seconds * self.scale)
+
+class VirtualClock:
+    """仮想時間の時計（待機は実際には行わず、時刻だけを進める）"""
+
+    def __init__(self, start=0.0):
+        self.now = start
+        self.slept = 0.0
+        self.lock = threading.Lock()
+
+    def monotonic(self):
+        with self.lock:
+            return self.now
+
+    def sleep(self, seconds):
+        if seconds <= 0:
+            return
+        with self.lock:
+            self.now += seconds
+            self.slept += seconds
+
+    def advance(self, seconds):
+        """待機を伴わずに時刻を進める"""
+        with self.lock:
+            self.now += seconds
+
+    def interrupt(self):
+        pass
+
+class WaitSlots:
+    """処理スレッドの実行枠（RealClock で待機している間は枠を数えない）
+
+    人間らしい操作の待機は1回の呼び出しで数秒〜数十秒続く。待機中の呼び出しが
+    枠を持ったままだと、他のuniqueIdの呼び出しがドライバーを操作できずに待たされる。
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.semaphore = threading.Semaphore(size)
+        self.lock = threading.Lock()
+        self.waiting = 0
+
+    @contextmanager
+    def hold(self):
+        """枠を得て処理する（このスレッドの RealClock の待機中だけ枠を手放す）"""
+        self.semaphore.acquire()
+        _current_slots.slots = self
+        try:
+            yield
+        finally:
+            _current_slots.slots = None
+            self.semaphore.release()
+
+    def yield_during(self, wait, seconds):
+        """枠を手放して wait(seconds) を実行し、終わったら枠を取り直す"""
+        with self.lock:
+            self.waiting += 1
+        self.semaphore.release()
+        try:
+            wait(seconds)
+        finally:
+            self.semaphore.acquire()
+            with self.lock:
+                self.waiting -= 1
+
+def interrupt_all():
+    """このプロセスで生成した実時間の時計の待機をすべて中断（シャットダウン用）"""
+    with _real_clocks_lock:
+        clocks = list(_real_clocks)
+    for clock in clocks:
+        clock.interrupt()
+
+def clock_from_env(value=None):
+    """DRIVER_CLOCK から時計を生成
+
+    real（既定） / scaled:0.01（待機を1%に短縮） / zero（待機なし） / virtual（仮想時間）
+    """
+    value = value if value is not None else os.getenv('DRIVER_CLOCK', 'real')
+    if value == 'real':
+        return RealClock()
+    if value == 'zero':
+        return ScaledClock(0.0)
+    if value == 'virtual':
+        return VirtualClock()
+    if value.startswith('scaled:'):
+        return ScaledClock(float(value.split(':', 1)[1]))
+    raise ValueError(f"未対応の時計: {value}")
@@ -0,0 +1,103 @@
+# cluster.py - 複数api_serverノード間でのuniqueId分散（コンシステントハッシュ）
+import os
+import bisect
+import hashlib
+import threading
+
+class HashRing:
+    """仮想ノード付きコンシステントハッシュリング"""
+
+    def __init__(self, nodes=(), vnodes=128):
+        self.vnodes = vnodes
+        self.nodes = set()
+        self.keys = []
+        self.ring = {}
+        for node in nodes:
+            self.add_node(node)
+
+    @staticmethod
+    def _hash(value):
+        return int.from_bytes(hashlib.md5(value.encode('utf-8')).digest()[:8], 'big')
+
+    def add_node(self, node):
+        """ノード追加（仮想ノード分のポイントをリングに配置）"""
+        if node in self.nodes:
+            return
+        self.nodes.add(node)
+        for i in range(self.vnodes):
+            point = self._hash(f"{node}#{i}")
+            self.ring[point] = node
+            bisect.insort(self.keys, point)
+
+    def remove_node(self, node):
+        """ノード削除"""
+        if node not in self.nodes:
+            return
+        self.nodes.discard(node)
+        for i in range(self.vnodes):
+            point = self._hash(f"{node}#{i}")
+            if self.ring.get(point) == node:
+                del self.ring[point]
+                index = bisect.bisect_left(self.keys, point)
+                if index < len(self.keys) and self.keys[index] == point:
+                    del self.keys[index]
+
+    def get_node(self, key):
+        """キーを担当するノード（時計回りで最初のポイント）"""
+        if not self.keys:
+            return None
+        index = bisect.bisect(self.keys, self._hash(key)) % len(self.keys)
+        return self.ring[self.keys[index]]
+
+class ClusterMembership:
+    """クラスタ構成と担当ノードの判定"""
+
+    def __init__(self, self_url, nodes, vnodes=128, mode="forward"):
+        self.self_url = self_url.rstrip('/')
+        self.vnodes = vnodes
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.ring = HashRing([node.rstrip('/') for node in nodes], vnodes)
+
+    @property
+    def members(self):
+        return sorted(self.ring.nodes)
+
+    def owner(self, unique_id):
+        """uniqueIdを担当するノードURL"""
+        return self.ring.get_node(unique_id)
+
+    def is_local(self, unique_id):
+        return self.owner(unique_id) == self.self_url
+
+    def update_members(self, nodes, unique_ids=()):
+        """メンバー変更（新旧リングで担当が変わったuniqueIdとその新担当を返す）"""
+        new_ring = HashRing([node.rstrip('/') for node in nodes], self.vnodes)
+        with self.lock:
+            old_ring = self.ring
+            self.ring = new_ring
+
+        return {
+            unique_id: new_ring.get_node(unique_id)
+            for unique_id in unique_ids
+            if old_ring.get_node(unique_id) != new_ring.get_node(unique_id)
+        }
+
+def cluster_from_env():
+    """環境変数からクラスタ構成を生成（CLUSTER_NODES未設定なら単体モード）
+
+    CLUSTER_NODES=http://node1:3000,http://node2:3000
+    CLUSTER_SELF=http://node1:3000
+    CLUSTER_MODE=forward | redirect
+    """
+    nodes = [node.strip() for node in os.getenv('CLUSTER_NODES', '').split(',') if node.strip()]
+    if not nodes:
+        return None
+
+    self_url = os.getenv('CLUSTER_SELF') or f"http://localhost:{os.getenv('PORT', '3000')}"
+    return ClusterMembership(
+        self_url,
+        nodes,
+        vnodes=int(os.getenv('CLUSTER_VNODES', '128')),
+        mode=os.getenv('CLUSTER_MODE', 'forward')
+    )
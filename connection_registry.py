@@ -0,0 +1,78 @@
+# connection_registry.py - 接続エントリの管理（書き込みはロック下、読み取りはロック不要のスナップショット）
+from types import MappingProxyType
+
+class ConnectionRecord:
+    """接続1件分の状態（変更時は replace で新しいレコードを作る）"""
+
+    __slots__ = ("unique_id", "status", "session_info", "created_at", "last_used", "session_checked_at", "last_sent")
+
+    def __init__(self, unique_id, status, session_info=None, created_at=0.0, last_used=0.0,
+                 session_checked_at=0.0, last_sent=0.0):
+        self.unique_id = unique_id
+        self.status = status
+        self.session_info = session_info or {}
+        self.created_at = created_at
+        self.last_used = last_used
+        # session_info をドライバーから取得した時刻、最後に送信した時刻
+        self.session_checked_at = session_checked_at
+        self.last_sent = last_sent
+
+    def replace(self, **changes):
+        """一部の項目を変更した新しいレコード"""
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values.update(changes)
+        return ConnectionRecord(**values)
+
+    def __repr__(self):
+        return f"ConnectionRecord({self.unique_id!r}, {self.status!r})"
+
+class ConnectionRegistry:
+    """uniqueId -> ConnectionRecord
+
+    変更系メソッドは呼び出し側（接続プール）のロック下で呼ぶ。変更のたびに
+    読み取り専用のスナップショットを差し替えるため、/status や /health は
+    snapshot 属性を読むだけでロックを取らずに一貫した一覧を得られる。
+    """
+
+    def __init__(self, on_publish=None):
+        self._records = {}
+        self.snapshot = MappingProxyType({})
+        # スナップショット差し替えのたびに呼ぶ（状態別の件数のメトリクス更新など）
+        self.on_publish = on_publish
+
+    def _publish(self):
+        self.snapshot = MappingProxyType(dict(self._records))
+        if self.on_publish is not None:
+            self.on_publish(self.snapshot)
+
+    def __contains__(self, unique_id):
+        return unique_id in self._records
+
+    def __len__(self):
+        return len(self._records)
+
+    def get(self, unique_id):
+        return self._records.get(unique_id)
+
+    def keys(self):
+        return list(self._records)
+
+    def add(self, record):
+        self._records[record.unique_id] = record
+        self._publish()
+
+    def update(self, unique_id, **changes):
+        """レコードを差し替え（存在しなければNone）"""
+        record = self._records.get(unique_id)
+        if record is None:
+            return None
+        record = record.replace(**changes)
+        self._records[unique_id] = record
+        self._publish()
+        return record
+
+    def pop(self, unique_id):
+        record = self._records.pop(unique_id, None)
+        if record is not None:
+            self._publish()
+        return record
@@ -0,0 +1,101 @@
+# cookie_export.py - 接続プールのCookieをNode側（src/conn/manager.ts）向けの cookies.json に書き出す
+import os
+import json
+import time
+import threading
+from session_store import write_session_file
+
+# Node側と同じ環境変数・既定値（空文字なら書き出しを無効化）
+COOKIE_CACHE_PATH = os.getenv('COOKIE_CACHE_PATH', './cookies.json')
+
+# 変更検知から書き込みまでの待ち時間（短時間の連続変更を1回の書き込みにまとめる）
+COOKIE_EXPORT_DEBOUNCE = float(os.getenv('COOKIE_EXPORT_DEBOUNCE', '2'))
+
+# 書き出すCookie（Node側の CookieCache 型と同じ項目）
+EXPORTED_COOKIES = ('sessionid', 'tt-target-idc')
+
+class CookieExporter:
+    """sessionid / tt-target-idc が変わった時だけ cookies.json をアトミックに書き換える
+
+    変化は接続（uniqueId）ごとに前回通知された値と比べて判定する。Cookieの異なる
+    複数の接続が交互に送信しても、どちらかのCookieが更新されない限り書き込まない。
+    """
+
+    def __init__(self, path=COOKIE_CACHE_PATH, debounce=COOKIE_EXPORT_DEBOUNCE):
+        self.path = path
+        self.debounce = debounce
+        self.lock = threading.Lock()
+        self.timer = None
+        self.pending = None
+        self.exported = None
+        # uniqueId -> 最後に通知されたCookie
+        self.last_seen = {}
+        self.version = 0
+        self._load_existing()
+
+    def _load_existing(self):
+        """既存ファイルの内容とversionを引き継ぐ（再起動直後の同一内容の書き込みを避ける）"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                current = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.exported = {name: current.get(name) for name in EXPORTED_COOKIES}
+        self.version = int(current.get('version', 0) or 0)
+
+    def update(self, session_info, unique_id=None):
+        """最新のセッション情報を通知（変化があれば debounce 秒後に書き込む）"""
+        if not self.path or not session_info or not session_info.get('sessionid'):
+            return False
+
+        cookies = {name: session_info.get(name) for name in EXPORTED_COOKIES}
+        with self.lock:
+            if self.last_seen.get(unique_id) == cookies:
+                return False
+            self.last_seen[unique_id] = cookies
+            if cookies == (self.pending or {}).get('cookies', self.exported):
+                return False
+            self.pending = {"cookies": cookies, "uniqueId": unique_id}
+            if self.timer is None:
+                self.timer = threading.Timer(self.debounce, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+        return True
+
+    def forget(self, unique_id):
+        """切断した接続の記録を破棄"""
+        with self.lock:
+            self.last_seen.pop(unique_id, None)
+
+    def flush(self):
+        """保留中の変更を書き込む"""
+        with self.lock:
+            pending, self.pending = self.pending, None
+            self.timer = None
+            if pending is None or pending["cookies"] == self.exported:
+                return False
+            self.version += 1
+            version = self.version
+
+            record = {name: value for name, value in pending["cookies"].items() if value is not None}
+            record.update({
+                "version": version,
+                "updated_at": time.time(),
+                "source": pending["uniqueId"]
+            })
+            # 一時ファイル経由で置き換えるため、Node側が書き込み途中の内容を読むことはない
+            write_session_file(self.path, record)
+            self.exported = pending["cookies"]
+
+        print(f"cookies.json 更新: version {version}")
+        return True
+
+    def stop(self):
+        """保留中の変更を即時に書き込んで停止"""
+        with self.lock:
+            timer = self.timer
+        if timer is not None:
+            timer.cancel()
+        self.flush()
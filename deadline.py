@@ -0,0 +1,49 @@
+# deadline.py - リクエスト全体の処理期限（各待機を残り時間に制限）
+import time
+
+class DeadlineExceeded(TimeoutError):
+    """処理期限を超過した"""
+
+class Deadline:
+    """処理期限（seconds=None なら無期限、clock を渡すとその時計で計測）"""
+
+    def __init__(self, seconds=None, clock=None):
+        self.clock = clock
+        self.expires_at = None if seconds is None else self._now() + seconds
+
+    def _now(self):
+        return self.clock.monotonic() if self.clock else time.monotonic()
+
+    def remaining(self):
+        """残り秒数（無期限ならNone）"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - self._now())
+
+    def expired(self):
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def clamp(self, timeout):
+        """待機時間を残り時間以内に制限"""
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        return min(timeout, remaining)
+
+    def check(self, phase=""):
+        """期限切れなら DeadlineExceeded を送出"""
+        if self.expired():
+            raise DeadlineExceeded(f"処理期限を超過しました{f' ({phase})' if phase else ''}")
+
+    def __getstate__(self):
+        # monotonic時刻はプロセス間で共有できないため残り時間として受け渡す
+        return {"remaining": self.remaining()}
+
+    def __setstate__(self, state):
+        remaining = state["remaining"]
+        self.clock = None
+        self.expires_at = None if remaining is None else time.monotonic() + remaining
+
+    def __repr__(self):
+        return f"Deadline(remaining={self.remaining()})"
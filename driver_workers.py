@@ -0,0 +1,426 @@
+# driver_workers.py - ドライバーをワーカープロセスで実行し、APIプロセスから隔離
+import os
+import time
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from deadline import DeadlineExceeded
+from process_tree import snapshot_descendants, kill_remaining
+
+DRIVER_CALL_TIMEOUT = float(os.getenv('DRIVER_CALL_TIMEOUT', '180'))
+WORKER_HEARTBEAT_INTERVAL = float(os.getenv('WORKER_HEARTBEAT_INTERVAL', '10'))
+
+class WorkerCallTimeout(TimeoutError):
+    """ワーカー呼び出しが期限内に完了しなかった"""
+
+class WorkerCallAbandoned(DeadlineExceeded):
+    """処理期限切れで応答を待つのをやめた（ワーカー側の処理は続いている）"""
+
+class WorkerCrashed(RuntimeError):
+    """ワーカープロセスが終了した"""
+
+class WorkerCallError(RuntimeError):
+    """ワーカー内でドライバーのメソッドが例外を送出した"""
+
+def _worker_main(conn, max_threads):
+    """ワーカープロセス本体（ドライバーを保持し、親からの呼び出しを実行）"""
+    from enhanced_tiktok_driver import EnhancedTikTokDriver
+    from session_store import create_session_store
+    from metrics import REGISTRY
+    from profiler import PROFILER
+    from clock import WaitSlots, interrupt_all
+
+    session_store = create_session_store()
+    drivers = {}
+    send_lock = threading.Lock()
+    # ドライバー処理は呼び出しごとのスレッドで実行し、同時に操作するのは max_threads 件まで
+    # （人間らしい操作の待機中は枠を手放すため、待機中の呼び出しが他の呼び出しを待たせない）
+    slots = WaitSlots(max_threads)
+
+    def reply(request_id, ok, value):
+        with send_lock:
+            conn.send((request_id, ok, value))
+
+    def profile(request_id, seconds, interval):
+        try:
+            reply(request_id, True, PROFILER.run(seconds, interval))
+        except Exception as e:
+            reply(request_id, False, (type(e).__name__, str(e)))
+
+    def handle(request_id, op, unique_id, method, args, kwargs):
+        try:
+            if op == 'create':
+                drivers[unique_id] = EnhancedTikTokDriver(session_store=session_store, unique_id=unique_id, **kwargs)
+                result = None
+            elif op == 'call':
+                result = getattr(drivers[unique_id], method)(*args, **kwargs)
+            elif op == 'close':
+                driver = drivers.pop(unique_id, None)
+                if driver:
+                    driver.close()
+                result = None
+            else:
+                raise ValueError(f"不明な操作: {op}")
+            reply(request_id, True, result)
+        except Exception as e:
+            reply(request_id, False, (type(e).__name__, str(e)))
+
+    def run(*message):
+        with slots.hold():
+            handle(*message)
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        if message is None:
+            break
+
+        # 死活確認とメトリクス取得はドライバー処理と独立して即時応答する
+        if message[1] == 'ping':
+            reply(message[0], True, 'pong')
+        elif message[1] == 'metrics':
+            reply(message[0], True, REGISTRY.snapshot())
+        elif message[1] == 'profile':
+            # ドライバー処理用のスレッドを塞がないよう専用スレッドでサンプリング
+            threading.Thread(target=profile, args=(message[0], *message[4]), daemon=True).start()
+        else:
+            threading.Thread(target=run, args=message, daemon=True).start()
+
+    # 処理中の待機を打ち切ってからドライバーを終了する
+    interrupt_all()
+    for driver in list(drivers.values()):
+        try:
+            driver.close()
+        except Exception:
+            pass
+
+class DriverWorker:
+    """ワーカープロセス1つ分のハンドル（親プロセス側）"""
+
+    def __init__(self, index, max_threads=8):
+        self.index = index
+        self.max_threads = max_threads
+        self.unique_ids = set()
+        self.process = None
+        self.conn = None
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.restart_lock = threading.Lock()
+        self.request_ids = itertools.count()
+        self.generation = 0
+
+    def start(self):
+        context = multiprocessing.get_context('spawn')
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main,
+            args=(child_conn, self.max_threads),
+            name=f"driver-worker-{self.index}",
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.generation += 1
+        threading.Thread(target=self._read_replies, args=(self.conn,), daemon=True).start()
+
+    def _read_replies(self, conn):
+        """応答を受け取り、対応するFutureを完了させる"""
+        while True:
+            try:
+                request_id, ok, value = conn.recv()
+            except (EOFError, OSError):
+                break
+
+            with self.lock:
+                future = self.pending.pop(request_id, None)
+            if future is None:
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                # 処理期限切れは呼び出し元でタイムアウトとして扱えるよう型を復元
+                error_type, message = value
+                if error_type == 'DeadlineExceeded':
+                    future.set_exception(DeadlineExceeded(message))
+                else:
+                    future.set_exception(WorkerCallError(f"{error_type}: {message}"))
+
+        # 再起動後の新しいパイプの待ち合わせには影響させない
+        if conn is self.conn:
+            self._fail_pending(WorkerCrashed(f"ワーカー{self.index}が終了しました"))
+
+    def _fail_pending(self, error):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(error)
+
+    def submit(self, op, unique_id=None, method=None, args=(), kwargs=None):
+        """ワーカーへ操作を送る（応答は返り値のFutureで受け取る）"""
+        future = Future()
+        with self.lock:
+            request_id = next(self.request_ids)
+            self.pending[request_id] = future
+            try:
+                self.conn.send((request_id, op, unique_id, method, tuple(args), kwargs or {}))
+            except (OSError, ValueError) as e:
+                del self.pending[request_id]
+                raise WorkerCrashed(f"ワーカー{self.index}へ送信できません: {e}")
+        return request_id, future
+
+    def forget(self, request_id):
+        """応答を待たなくなった呼び出しを破棄"""
+        with self.lock:
+            self.pending.pop(request_id, None)
+
+    def call(self, op, unique_id=None, method=None, args=(), kwargs=None, timeout=DRIVER_CALL_TIMEOUT):
+        """ワーカーへ操作を送り、期限まで応答を待つ"""
+        request_id, future = self.submit(op, unique_id, method, args, kwargs)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            self.forget(request_id)
+            raise WorkerCallTimeout(f"ワーカー{self.index}の{method or op}が{timeout}秒以内に完了しませんでした")
+
+    def is_alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def stop(self, timeout=5.0):
+        """ワーカー停止（応答しなければ強制終了し、残ったchromedriver・Chromeも終了させる）"""
+        if self.process is None:
+            return
+        # 強制終了するとワーカー配下のブラウザは孤児になるため、先に子孫プロセスを記録する
+        browsers = snapshot_descendants(self.process.pid)
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join(1.0)
+        killed = kill_remaining(browsers)
+        if killed:
+            print(f"ワーカー{self.index}の残ったブラウザプロセスを強制終了: {killed}件")
+        self.conn.close()
+        self._fail_pending(WorkerCrashed(f"ワーカー{self.index}を停止しました"))
+
+class RemoteDriver:
+    """EnhancedTikTokDriver と同じメソッドをワーカープロセス経由で呼び出すプロキシ"""
+
+    def __init__(self, pool, unique_id):
+        self._pool = pool
+        self._unique_id = unique_id
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def remote_method(*args, **kwargs):
+            return self._pool.call(self._unique_id, name, args, kwargs)
+        return remote_method
+
+    def close(self):
+        self._pool.release(self._unique_id)
+
+class DriverWorkerPool:
+    """ワーカープロセス群の管理（割り当て・期限付き呼び出し・停止したワーカーの再起動）"""
+
+    def __init__(self, num_workers=2, call_timeout=DRIVER_CALL_TIMEOUT,
+                 heartbeat_interval=WORKER_HEARTBEAT_INTERVAL, on_lost=None):
+        self.call_timeout = call_timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.on_lost = on_lost
+        self.workers = [DriverWorker(i) for i in range(num_workers)]
+        self.assignments = {}
+        # 処理期限切れで応答を待たなくなったドライバー作成（uniqueId -> 完了イベント）
+        self.settling = {}
+        self.lock = threading.Lock()
+        self.running = False
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+        self.running = True
+        threading.Thread(target=self._supervise, daemon=True).start()
+
+    def _supervise(self):
+        """定期的な死活確認（応答しないワーカーは再起動）"""
+        while self.running:
+            time.sleep(self.heartbeat_interval)
+            for worker in list(self.workers):
+                if not self.running:
+                    return
+                generation = worker.generation
+                try:
+                    worker.call('ping', timeout=self.heartbeat_interval)
+                except (WorkerCallTimeout, WorkerCrashed):
+                    self.restart(worker, generation)
+
+    def restart(self, worker, generation=None):
+        """ワーカー再起動（保持していた接続は失われるため通知する）"""
+        with worker.restart_lock:
+            # 既に別スレッドが再起動済みなら何もしない
+            if generation is not None and worker.generation != generation:
+                return
+            
+            with self.lock:
+                lost = list(worker.unique_ids)
+                worker.unique_ids.clear()
+                for unique_id in lost:
+                    self.assignments.pop(unique_id, None)
+
+            print(f"ワーカー{worker.index}を再起動します（失われた接続: {len(lost)}件）")
+            worker.stop(timeout=1.0)
+            worker.start()
+
+        # 呼び出し元が接続プールのロックを保持している場合があるため別スレッドで通知
+        if lost and self.on_lost:
+            threading.Thread(target=self.on_lost, args=(lost,), daemon=True).start()
+
+    def _wait(self, worker, request_id, future, description, deadline=None, on_abandoned=None):
+        """応答待ち
+
+        リクエストの処理期限が先に来た場合は応答を待たずに DeadlineExceeded を送出し、
+        ワーカー側の処理はそのまま完了させる（同じワーカーの他の接続には影響しない）。
+        ワーカーを再起動するのは DRIVER_CALL_TIMEOUT を超えても応答がない場合だけ。
+        """
+        generation = worker.generation
+        started = time.monotonic()
+        remaining = deadline.remaining() if deadline is not None else None
+        if remaining is not None and remaining < self.call_timeout:
+            try:
+                return future.result(timeout=remaining)
+            except FutureTimeoutError:
+                threading.Thread(
+                    target=self._watch_abandoned,
+                    args=(worker, generation, request_id, future, description, started, on_abandoned),
+                    daemon=True
+                ).start()
+                raise WorkerCallAbandoned(f"処理期限を超過しました ({description})")
+
+        try:
+            return future.result(timeout=self.call_timeout)
+        except FutureTimeoutError:
+            worker.forget(request_id)
+            self.restart(worker, generation)
+            raise WorkerCallTimeout(f"ワーカー{worker.index}の{description}が{self.call_timeout}秒以内に完了しませんでした")
+
+    def _watch_abandoned(self, worker, generation, request_id, future, description, started, on_abandoned):
+        """待つのをやめた呼び出しの完了を見届ける（DRIVER_CALL_TIMEOUT を超えたらワーカー再起動）"""
+        try:
+            future.result(timeout=max(0.0, started + self.call_timeout - time.monotonic()))
+        except FutureTimeoutError:
+            worker.forget(request_id)
+            print(f"ワーカー{worker.index}の{description}が{self.call_timeout}秒以内に完了しませんでした")
+            self.restart(worker, generation)
+        except Exception:
+            pass
+        if on_abandoned is not None:
+            on_abandoned()
+
+    def create_driver(self, unique_id, deadline=None, **kwargs):
+        """最も負荷の低いワーカーにドライバーを作成"""
+        # 同じuniqueIdの前回の作成が処理期限切れのまま続いていれば、その終了を待つ
+        with self.lock:
+            settling = self.settling.get(unique_id)
+        if settling is not None:
+            remaining = deadline.remaining() if deadline is not None else None
+            if not settling.wait(remaining):
+                raise DeadlineExceeded(f"前回のドライバー作成の終了待ちで処理期限を超過しました ({unique_id})")
+
+        with self.lock:
+            worker = min(self.workers, key=lambda w: len(w.unique_ids))
+            worker.unique_ids.add(unique_id)
+            self.assignments[unique_id] = worker
+            settled = self.settling[unique_id] = threading.Event()
+
+        def settle():
+            with self.lock:
+                if self.settling.get(unique_id) is settled:
+                    del self.settling[unique_id]
+            settled.set()
+
+        def close_abandoned():
+            # 作成が済んでいてもプールには登録されないため、ワーカー側で終了させる
+            self.release(unique_id)
+            settle()
+
+        try:
+            request_id, future = worker.submit('create', unique_id, kwargs=kwargs)
+            self._wait(worker, request_id, future, 'create', deadline, on_abandoned=close_abandoned)
+        except WorkerCallAbandoned:
+            # 作成はワーカー側で続いており、完了後に close_abandoned が後始末する
+            raise
+        except WorkerCallTimeout:
+            settle()
+            raise
+        except Exception:
+            settle()
+            self.release(unique_id)
+            raise
+        settle()
+        return RemoteDriver(self, unique_id)
+
+    def call(self, unique_id, method, args=(), kwargs=None):
+        """担当ワーカーでドライバーのメソッドを実行"""
+        with self.lock:
+            worker = self.assignments.get(unique_id)
+        if worker is None:
+            raise WorkerCrashed(f"{unique_id}のドライバーは存在しません")
+
+        request_id, future = worker.submit('call', unique_id, method, args, kwargs)
+        return self._wait(worker, request_id, future, method, (kwargs or {}).get('deadline'))
+
+    def release(self, unique_id):
+        """ドライバー終了と割り当て解除"""
+        with self.lock:
+            worker = self.assignments.pop(unique_id, None)
+            if worker:
+                worker.unique_ids.discard(unique_id)
+        if worker and worker.is_alive():
+            generation = worker.generation
+            try:
+                worker.call('close', unique_id, timeout=self.call_timeout)
+            except WorkerCallTimeout:
+                self.restart(worker, generation)
+
+    def collect_metrics(self, timeout=2.0):
+        """各ワーカーのメトリクススナップショットを取得"""
+        snapshots = []
+        for worker in self.workers:
+            if not worker.is_alive():
+                continue
+            try:
+                snapshots.append(worker.call('metrics', timeout=timeout))
+            except (WorkerCallTimeout, WorkerCrashed):
+                continue
+        return snapshots
+
+    def collect_profiles(self, seconds, interval=None):
+        """全ワーカーで同時にプロファイルを取得（ワーカー名 -> 結果）"""
+        workers = [worker for worker in self.workers if worker.is_alive()]
+        results = {}
+        if not workers:
+            return results
+
+        def run(worker):
+            try:
+                return worker.call('profile', args=(seconds, interval), timeout=seconds + 10.0)
+            except (WorkerCallTimeout, WorkerCrashed, WorkerCallError) as e:
+                return {"error": str(e)}
+
+        with ThreadPoolExecutor(max_workers=len(workers)) as executor:
+            for worker, result in zip(workers, executor.map(run, workers)):
+                results[f"driver-worker-{worker.index}"] = result
+        return results
+
+    def shutdown(self):
+        self.running = False
+        for worker in self.workers:
+            worker.stop()
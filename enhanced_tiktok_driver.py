@@ -1,26 +1,176 @@
 import time
 import random
-import json
 import os
+import json
+import functools
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.action_chains import ActionChains
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.chrome.options import Options
-import requests
+from session_store import FileSessionStore
+from deadline import Deadline, DeadlineExceeded
+from clock import clock_from_env
+from metrics import REGISTRY
+from process_tree import tree_rss_bytes
+from event_log import get_logger, current_phase
+
+# 高レベル操作ごとのWebDriver往復回数（chromedriverへのHTTPリクエスト数）
+DRIVER_OPERATIONS = REGISTRY.counter(
+    "tiktok_driver_operations_total", "Driver operations executed", ("operation",)
+)
+DRIVER_ROUNDTRIPS = REGISTRY.counter(
+    "tiktok_driver_roundtrips_total", "WebDriver round-trips issued by driver operations", ("operation",)
+)
+DRIVER_LAUNCH_SECONDS = REGISTRY.histogram(
+    "tiktok_driver_launch_seconds", "Browser launch time", ("profile",),
+    buckets=(0.5, 1.0, 2.0, 3.0, 5.0, 8.0, 13.0, 21.0, 34.0)
+)
+DRIVER_ROUNDTRIPS_PER_OPERATION = REGISTRY.histogram(
+    "tiktok_driver_operation_roundtrips", "WebDriver round-trips per driver operation", ("operation",),
+    buckets=(1, 2, 3, 5, 10, 20, 50, 100)
+)
+
+def accepts_deadline(method):
+    """メソッドに deadline 引数を追加し、実行中の待機を残り時間に制限する"""
+    @functools.wraps(method)
+    def wrapper(self, *args, deadline=None, **kwargs):
+        previous = self.deadline
+        if deadline is not None:
+            self.deadline = deadline
+        # ログの phase 項目に実行中の操作名を残す
+        phase = current_phase.set(method.__name__)
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            current_phase.reset(phase)
+            self.deadline = previous
+    return wrapper
+
+# 複数ロケーターを1回の評価で調べ、最初に一致した [インデックス, 要素] を返す
+SELECTOR_RACE_SCRIPT = """
+const [locators, clickable] = arguments;
+const usable = (el) => {
+    if (!clickable) return true;
+    const rect = el.getBoundingClientRect();
+    const style = window.getComputedStyle(el);
+    return !el.disabled && rect.width > 0 && rect.height > 0
+        && style.visibility !== 'hidden' && style.display !== 'none';
+};
+for (let i = 0; i < locators.length; i++) {
+    const locator = locators[i];
+    let candidates = [];
+    try {
+        if (locator.startsWith('//')) {
+            const result = document.evaluate(locator, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+            for (let j = 0; j < result.snapshotLength; j++) candidates.push(result.snapshotItem(j));
+        } else {
+            candidates = Array.from(document.querySelectorAll(locator));
+        }
+    } catch (e) {
+        continue;
+    }
+    const found = candidates.find(usable);
+    if (found) return [i, found];
+}
+return null;
+"""
+
+# セッション維持に必要なCookie（変化したらセッションストアに書き戻す）
+IMPORTANT_COOKIES = ('sessionid', 'tt-target-idc')
+
+def session_cookie_values(cookies):
+    """Cookie一覧から重要Cookieの値を取り出す"""
+    return {cookie['name']: cookie['value'] for cookie in cookies if cookie['name'] in IMPORTANT_COOKIES}
+
+def counts_roundtrips(method):
+    """操作中に発生したWebDriver往復回数をメトリクスに記録する"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        start = self.roundtrips
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            count = self.roundtrips - start
+            self.last_roundtrips[method.__name__] = count
+            DRIVER_OPERATIONS.labels(operation=method.__name__).inc()
+            DRIVER_ROUNDTRIPS.labels(operation=method.__name__).inc(count)
+            DRIVER_ROUNDTRIPS_PER_OPERATION.labels(operation=method.__name__).observe(count)
+    return wrapper
+
+# 軽量起動プロファイル（プール用のヘッドレス接続でセッション維持に不要な機能を止める）
+LEAN_PROFILE_ARGUMENTS = [
+    "--blink-settings=imagesEnabled=false",
+    "--disable-remote-fonts",
+    "--autoplay-policy=user-gesture-required",
+    "--mute-audio",
+    "--disable-background-networking",
+    "--disable-component-update",
+    "--disable-default-apps",
+    "--disable-extensions",
+    "--disable-sync",
+    "--disable-translate",
+    "--disable-domain-reliability",
+    "--disable-client-side-phishing-detection",
+    "--disable-breakpad",
+    "--metrics-recording-only",
+    "--no-first-run",
+    "--no-default-browser-check",
+    "--renderer-process-limit=2",
+    "--disk-cache-size=1048576"
+]
+LEAN_PROFILE_DISABLED_FEATURES = [
+    "MediaRouter",
+    "OptimizationHints",
+    "Translate",
+    "AutofillServerCommunication",
+    "CertificateTransparencyComponentUpdater"
+]
+LEAN_PROFILE_PREFS = {
+    'profile.managed_default_content_settings.images': 2,
+    'profile.managed_default_content_settings.media_stream': 2,
+    'profile.default_content_setting_values.notifications': 2
+}
 
 class EnhancedTikTokDriver:
-    def __init__(self, headless=False, user_data_dir=None):
+    def __init__(self, headless=False, user_data_dir=None, session_store=None, clock=None, backend=None, profile=None, unique_id=None):
         self.driver = None
         self.wait = None
         self.headless = headless
         self.user_data_dir = user_data_dir
+        # 待機に使う時計（テスト・ベンチマークでは scaled/virtual で待ち時間をなくす）
+        self.clock = clock or clock_from_env()
+        # chrome（既定） / fake（Chromeを起動しない代替WebDriver）
+        self.backend = backend or os.getenv('DRIVER_BACKEND', 'chrome')
+        # default（従来の全機能） / lean（画像・メディア・バックグラウンド通信等を無効化）
+        self.profile = profile or os.getenv('DRIVER_PROFILE', 'default')
+        self.launch_seconds = None
+        self.session_store = session_store or FileSessionStore()
+        self.session_version = None
+        # 最後に読み込んだ・保存したセッションの重要Cookie（変化の検出用）
+        self.stored_session_info = None
+        self.deadline = Deadline()
+        self.page_load_timeout = None
+        self.roundtrips = 0
+        self.last_roundtrips = {}
+        self.cdp_available = None
+        # 構造化ログ（キュー経由で書き込み、呼び出し元のスレッドではファイルI/Oを行わない）
+        self.log = get_logger('tiktok.driver', uniqueId=unique_id)
         self.setup_driver()
     
     def setup_driver(self):
         """高度なbot検出回避設定でChromeDriverを初期化"""
+        if self.backend == 'fake':
+            from fake_webdriver import FakeWebDriver
+            started = time.monotonic()
+            self.driver = FakeWebDriver()
+            self.launch_seconds = time.monotonic() - started
+            self._count_roundtrips()
+            self.wait = WebDriverWait(self.driver, 30)
+            return
+        
         options = Options()
         
         # 基本的なbot検出回避設定
@@ -47,15 +197,25 @@ class EnhancedTikTokDriver:
         options.add_argument(random.choice(window_sizes))
         
         # 言語とロケール設定
-        options.add_argument("--lang=ja-JP")
-        options.add_experimental_option('prefs', {
+        prefs = {
             'intl.accept_languages': 'ja-JP,ja,en-US,en'
-        })
+        }
+        options.add_argument("--lang=ja-JP")
         
         # WebGL、Canvas、AudioContext対策
         options.add_argument("--disable-web-security")
         options.add_argument("--allow-running-insecure-content")
-        options.add_argument("--disable-features=VizDisplayCompositor")
+        disabled_features = ["VizDisplayCompositor"]
+        
+        # 軽量プロファイル（--disable-features は最後の指定のみ有効なためまとめて渡す）
+        if self.profile == 'lean':
+            for argument in LEAN_PROFILE_ARGUMENTS:
+                options.add_argument(argument)
+            disabled_features.extend(LEAN_PROFILE_DISABLED_FEATURES)
+            prefs.update(LEAN_PROFILE_PREFS)
+        
+        options.add_argument(f"--disable-features={','.join(disabled_features)}")
+        options.add_experimental_option('prefs', prefs)
         
         # メモリとCPU使用量の最適化
         options.add_argument("--memory-pressure-off")
@@ -70,7 +230,11 @@ class EnhancedTikTokDriver:
             options.add_argument("--disable-gpu")
         
         # WebDriverの初期化
+        started = time.monotonic()
         self.driver = webdriver.Chrome(options=options)
+        self.launch_seconds = time.monotonic() - started
+        DRIVER_LAUNCH_SECONDS.labels(profile=self.profile).observe(self.launch_seconds)
+        self._count_roundtrips()
         
         # WebDriverプロパティの隠蔽
         self.driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
@@ -80,6 +244,100 @@ class EnhancedTikTokDriver:
         
         self.wait = WebDriverWait(self.driver, 30)
     
+    def resource_usage(self):
+        """起動プロファイル・起動時間・ブラウザプロセスツリーの常駐メモリ"""
+        rss = 0
+        service = getattr(self.driver, 'service', None)
+        process = getattr(service, 'process', None)
+        if process is not None:
+            rss = tree_rss_bytes(process.pid)
+        
+        return {
+            "profile": self.profile,
+            "launch_seconds": self.launch_seconds,
+            "rss_bytes": rss
+        }
+    
+    def _count_roundtrips(self):
+        """WebDriverの全コマンドが通る execute をラップして往復回数を数える"""
+        execute = self.driver.execute
+        
+        def counted_execute(driver_command, params=None):
+            self.roundtrips += 1
+            return execute(driver_command, params)
+        
+        self.driver.execute = counted_execute
+    
+    def batch_read(self, **expressions):
+        """複数のJavaScript式を1回の execute_script でまとめて評価（キー -> 値の辞書を返す）"""
+        body = ", ".join(f"{json.dumps(key)}: ({expression})" for key, expression in expressions.items())
+        return self.driver.execute_script(f"return {{{body}}};")
+    
+    def _cdp(self, command, params=None):
+        """Chrome DevTools Protocol コマンド実行（使えなければ None を返す）"""
+        if self.cdp_available is False or not hasattr(self.driver, 'execute_cdp_cmd'):
+            self.cdp_available = False
+            return None
+        
+        try:
+            result = self.driver.execute_cdp_cmd(command, params or {})
+            self.cdp_available = True
+            return result
+        except Exception as e:
+            # リモートWebDriverなどCDP非対応の環境では以後従来の経路を使う
+            if self.cdp_available is None:
+                self.log.warning(f"CDP利用不可のため通常のCookie操作を使用: {e}")
+                self.cdp_available = False
+            return None
+    
+    def get_all_cookies(self, domain="tiktok.com"):
+        """Cookie一括取得（CDPならページ遷移やページ文脈なしで取得できる）"""
+        result = self._cdp("Network.getAllCookies")
+        if result is None:
+            return self.driver.get_cookies()
+        
+        cookies = []
+        for cookie in result.get('cookies', []):
+            if domain and domain not in cookie.get('domain', ''):
+                continue
+            converted = {
+                'name': cookie['name'],
+                'value': cookie['value'],
+                'domain': cookie.get('domain'),
+                'path': cookie.get('path', '/'),
+                'secure': cookie.get('secure', False),
+                'httpOnly': cookie.get('httpOnly', False)
+            }
+            if cookie.get('sameSite'):
+                converted['sameSite'] = cookie['sameSite']
+            if not cookie.get('session') and cookie.get('expires', -1) > 0:
+                converted['expiry'] = int(cookie['expires'])
+            cookies.append(converted)
+        return cookies
+    
+    def set_cookies(self, cookies):
+        """Cookie一括設定（CDPの Network.setCookies で1回の呼び出し、成功時True）"""
+        params = []
+        for cookie in cookies:
+            param = {
+                'name': cookie['name'],
+                'value': cookie['value'],
+                'path': cookie.get('path', '/'),
+                'secure': cookie.get('secure', False),
+                'httpOnly': cookie.get('httpOnly', False)
+            }
+            if cookie.get('domain'):
+                param['domain'] = cookie['domain']
+            else:
+                param['url'] = "https://www.tiktok.com/"
+            if cookie.get('sameSite'):
+                param['sameSite'] = cookie['sameSite']
+            if cookie.get('expiry'):
+                param['expires'] = cookie['expiry']
+            params.append(param)
+        
+        return self._cdp("Network.setCookies", {'cookies': params}) is not None
+    
     def execute_stealth_scripts(self):
         """追加のステルス化スクリプト実行"""
         stealth_scripts = [
@@ -123,12 +381,18 @@ class EnhancedTikTokDriver:
             try:
                 self.driver.execute_script(script)
             except Exception as e:
-                print(f"ステルススクリプト実行エラー: {e}")
+                self.log.error(f"ステルススクリプト実行エラー: {e}")
     
     def human_like_delay(self, min_seconds=1, max_seconds=3):
         """人間らしい不規則な待機時間"""
         delay = random.uniform(min_seconds, max_seconds)
-        time.sleep(delay)
+        
+        # 残り時間で待ちきれない場合は待たずに打ち切る
+        remaining = self.deadline.remaining()
+        if remaining is not None and remaining < delay:
+            raise DeadlineExceeded("待機中に処理期限を超過しました")
+        
+        self.clock.sleep(delay)
         return delay
     
     def human_like_typing(self, element, text, typing_delay_range=(0.05, 0.15)):
@@ -136,7 +400,38 @@ class EnhancedTikTokDriver:
         element.clear()
         for char in text:
             element.send_keys(char)
-            time.sleep(random.uniform(*typing_delay_range))
+            self.human_like_delay(*typing_delay_range)
+    
+    def _wait(self, timeout=30, poll_frequency=0.5):
+        """残り時間に制限したWebDriverWait"""
+        self.deadline.check("要素待機")
+        return WebDriverWait(self.driver, self.deadline.clamp(timeout), poll_frequency=poll_frequency)
+    
+    def wait_for_any(self, locators, timeout=30, clickable=False, poll_frequency=0.25):
+        """複数のロケーター（"//"始まりはXPath、それ以外はCSS）のうち最初に現れた要素を待つ
+        
+        ポーリングごとにページ内で全ロケーターを1回の execute_script で評価するため、
+        セレクターの数に関わらず待機は最大1回のタイムアウトで済む。
+        戻り値は (一致したロケーターのインデックス, 要素)。見つからなければ TimeoutException。
+        """
+        locators = list(locators)
+        
+        def probe(driver):
+            return driver.execute_script(SELECTOR_RACE_SCRIPT, locators, clickable) or False
+        
+        index, element = self._wait(timeout, poll_frequency).until(probe)
+        return index, element
+    
+    def _navigate(self, url):
+        """ページ遷移（ページロードのタイムアウトを残り時間に制限）"""
+        self.deadline.check(url)
+        # 残り時間は呼び出しごとに変わるため整数秒に切り捨て、秒が変わった時だけ設定し直す
+        # （切り捨てなので期限を超えるタイムアウトにはならない）
+        page_load_timeout = max(1, int(self.deadline.clamp(300)))
+        if page_load_timeout != self.page_load_timeout:
+            self.driver.set_page_load_timeout(page_load_timeout)
+            self.page_load_timeout = page_load_timeout
+        self.driver.get(url)
     
     def random_mouse_movement(self):
         """ランダムなマウス移動"""
@@ -148,9 +443,13 @@ class EnhancedTikTokDriver:
                 actions = ActionChains(self.driver)
                 actions.move_to_element(random_element).perform()
                 self.human_like_delay(0.5, 1.5)
+        except DeadlineExceeded:
+            raise
         except Exception:
             pass
     
+    @accepts_deadline
+    @counts_roundtrips
     def simulate_human_behavior(self):
         """人間らしい行動のシミュレーション"""
         behaviors = [
@@ -164,38 +463,43 @@ class EnhancedTikTokDriver:
         for _ in range(random.randint(1, 2)):
             random.choice(behaviors)()
     
+    @accepts_deadline
+    @counts_roundtrips
     def safe_navigate_to_tiktok(self, max_retries=3):
         """安全なTikTokナビゲーション"""
         for attempt in range(max_retries):
             try:
-                print(f"TikTokアクセス試行 {attempt + 1}/{max_retries}")
+                self.log.info(f"TikTokアクセス試行 {attempt + 1}/{max_retries}")
                 
                 # まず別のサイトにアクセス（リファラー対策）
-                self.driver.get("https://www.google.com")
+                self._navigate("https://www.google.com")
                 self.human_like_delay(2, 4)
                 
                 # TikTokに移動
-                self.driver.get("https://www.tiktok.com/")
+                self._navigate("https://www.tiktok.com/")
                 self.human_like_delay(3, 6)
                 
                 # ページロード確認
-                self.wait.until(EC.presence_of_element_located((By.TAG_NAME, "body")))
+                self._wait().until(EC.presence_of_element_located((By.TAG_NAME, "body")))
                 
                 # 人間らしい行動
                 self.simulate_human_behavior()
                 
-                print("TikTokアクセス成功")
+                self.log.info("TikTokアクセス成功")
                 return True
                 
+            except DeadlineExceeded:
+                raise
             except TimeoutException:
-                print(f"試行 {attempt + 1} タイムアウト")
+                self.log.warning(f"試行 {attempt + 1} タイムアウト")
+                self.deadline.check("TikTokアクセス")
                 if attempt < max_retries - 1:
                     self.human_like_delay(5, 10)
                     continue
                 else:
                     return False
             except Exception as e:
-                print(f"試行 {attempt + 1} エラー: {e}")
+                self.log.error(f"試行 {attempt + 1} エラー: {e}")
                 if attempt < max_retries - 1:
                     self.human_like_delay(5, 10)
                     continue
@@ -204,12 +508,14 @@ class EnhancedTikTokDriver:
         
         return False
     
+    @accepts_deadline
+    @counts_roundtrips
     def enhanced_login(self, username, password):
         """拡張ログイン機能"""
         try:
-            print("ログインプロセス開始")
+            self.log.info("ログインプロセス開始")
             
-            # ログインボタンを探す
+            # ログインボタンを探す（いずれかのセレクターが現れるまで1回だけ待機）
             login_selectors = [
                 "button[data-e2e='top-login-button']",
                 "a[data-e2e='top-login-button']",
@@ -217,19 +523,11 @@ class EnhancedTikTokDriver:
                 "//a[contains(text(), 'Log in')]"
             ]
             
-            login_button = None
-            for selector in login_selectors:
-                try:
-                    if selector.startswith("//"):
-                        login_button = self.wait.until(EC.element_to_be_clickable((By.XPATH, selector)))
-                    else:
-                        login_button = self.wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, selector)))
-                    break
-                except TimeoutException:
-                    continue
-            
-            if not login_button:
-                print("ログインボタンが見つかりません")
+            try:
+                _, login_button = self.wait_for_any(login_selectors, clickable=True)
+            except TimeoutException:
+                self.deadline.check("ログイン")
+                self.log.warning("ログインボタンが見つかりません")
                 return False
             
             # 人間らしいクリック
@@ -245,16 +543,11 @@ class EnhancedTikTokDriver:
                 "input[data-e2e='email-or-username']"
             ]
             
-            username_input = None
-            for selector in username_selectors:
-                try:
-                    username_input = self.wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, selector)))
-                    break
-                except TimeoutException:
-                    continue
-            
-            if not username_input:
-                print("ユーザー名入力フィールドが見つかりません")
+            try:
+                _, username_input = self.wait_for_any(username_selectors)
+            except TimeoutException:
+                self.deadline.check("ログイン")
+                self.log.warning("ユーザー名入力フィールドが見つかりません")
                 return False
             
             # 人間らしいタイピング
@@ -268,16 +561,11 @@ class EnhancedTikTokDriver:
                 "input[data-e2e='password']"
             ]
             
-            password_input = None
-            for selector in password_selectors:
-                try:
-                    password_input = self.driver.find_element(By.CSS_SELECTOR, selector)
-                    break
-                except NoSuchElementException:
-                    continue
-            
-            if not password_input:
-                print("パスワード入力フィールドが見つかりません")
+            try:
+                _, password_input = self.wait_for_any(password_selectors, timeout=5)
+            except TimeoutException:
+                self.deadline.check("ログイン")
+                self.log.warning("パスワード入力フィールドが見つかりません")
                 return False
             
             # 人間らしいタイピング
@@ -291,81 +579,119 @@ class EnhancedTikTokDriver:
                 "//button[contains(text(), 'Log in')]"
             ]
             
-            submit_button = None
-            for selector in submit_selectors:
-                try:
-                    if selector.startswith("//"):
-                        submit_button = self.driver.find_element(By.XPATH, selector)
-                    else:
-                        submit_button = self.driver.find_element(By.CSS_SELECTOR, selector)
-                    break
-                except NoSuchElementException:
-                    continue
-            
-            if submit_button:
-                self.simulate_human_behavior()
-                submit_button.click()
-                self.human_like_delay(3, 6)
-                
-                # ログイン成功確認
-                success_indicators = [
-                    "//div[@data-e2e='nav-profile']",
-                    "//button[@data-e2e='nav-profile']",
-                    "[data-e2e='nav-profile']"
-                ]
-                
-                for indicator in success_indicators:
-                    try:
-                        if indicator.startswith("//"):
-                            self.wait.until(EC.presence_of_element_located((By.XPATH, indicator)))
-                        else:
-                            self.wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, indicator)))
-                        print("ログイン成功")
-                        return True
-                    except TimeoutException:
-                        continue
-                
-                print("ログイン結果の確認ができませんでした")
+            try:
+                _, submit_button = self.wait_for_any(submit_selectors, timeout=5)
+            except TimeoutException:
+                self.deadline.check("ログイン")
+                self.log.warning("ログインボタンが見つかりません")
                 return False
-            else:
-                print("ログインボタンが見つかりません")
+            
+            self.simulate_human_behavior()
+            submit_button.click()
+            self.human_like_delay(3, 6)
+            
+            # ログイン成功確認
+            success_indicators = [
+                "//div[@data-e2e='nav-profile']",
+                "//button[@data-e2e='nav-profile']",
+                "[data-e2e='nav-profile']"
+            ]
+            
+            try:
+                self.wait_for_any(success_indicators)
+            except TimeoutException:
+                self.deadline.check("ログイン確認")
+                self.log.warning("ログイン結果の確認ができませんでした")
                 return False
+            
+            self.log.info("ログイン成功")
+            return True
                 
+        except DeadlineExceeded:
+            raise
         except Exception as e:
-            print(f"ログインエラー: {e}")
+            self.log.error(f"ログインエラー: {e}")
             return False
     
-    def save_session(self, session_file="tiktok_session.json"):
+    @accepts_deadline
+    @counts_roundtrips
+    def save_session(self, session_file="tiktok"):
         """セッション情報の保存"""
         try:
-            cookies = self.driver.get_cookies()
+            # URLとUser-Agentは1回のスクリプト実行でまとめて取得
+            cookies = self.get_all_cookies()
+            page = self.batch_read(current_url="location.href", user_agent="navigator.userAgent")
             session_data = {
                 'cookies': cookies,
-                'current_url': self.driver.current_url,
-                'user_agent': self.driver.execute_script("return navigator.userAgent;")
+                'current_url': page['current_url'],
+                'user_agent': page['user_agent']
             }
             
-            with open(session_file, 'w', encoding='utf-8') as f:
-                json.dump(session_data, f, ensure_ascii=False, indent=2)
+            # 他のレプリカがより新しいセッションを保存済みなら上書きしない
+            version = self.session_store.save(session_file, session_data, base_version=self.session_version)
+            if version is None:
+                self.log.warning(f"より新しいセッションが保存済みのため保存をスキップ: {session_file}")
+                return False
             
-            print(f"セッション保存完了: {session_file}")
+            self.session_version = version
+            self.stored_session_info = session_cookie_values(cookies)
+            self.log = self.log.bind(session=f"{session_file}#v{version}")
+            self.log.info(f"セッション保存完了: {session_file} (version {version})")
             return True
         except Exception as e:
-            print(f"セッション保存エラー: {e}")
+            self.log.error(f"セッション保存エラー: {e}")
+            return False
+    
+    @accepts_deadline
+    @counts_roundtrips
+    def sync_session(self, session_file="tiktok", session_info=None):
+        """Cookieが読み込み・保存時から変わっていればストアに書き戻す（書き戻したらTrue）
+        
+        他のレプリカがより新しいversionを保存済みなら上書きせず、そのCookieをブラウザに反映する。
+        """
+        if session_info is None:
+            session_info = self.get_session_info()
+        if not session_info or session_info == self.stored_session_info:
+            return False
+        
+        if self.save_session(session_file):
+            return True
+        
+        newer = self.session_store.load(session_file)
+        if newer is None or newer.get('version', 0) <= (self.session_version or 0):
             return False
+        if not self.set_cookies(newer['cookies']):
+            for cookie in newer['cookies']:
+                self.driver.add_cookie(cookie)
+        self.session_version = newer['version']
+        self.stored_session_info = session_cookie_values(newer['cookies'])
+        self.log = self.log.bind(session=f"{session_file}#v{self.session_version}")
+        self.log.info(f"他のレプリカが保存したセッションを反映: {session_file} (version {self.session_version})")
+        return False
     
-    def load_session(self, session_file="tiktok_session.json"):
+    @accepts_deadline
+    @counts_roundtrips
+    def load_session(self, session_file="tiktok"):
         """セッション情報の読み込み"""
         try:
-            if not os.path.exists(session_file):
-                print("セッションファイルが存在しません")
+            session_data = self.session_store.load(session_file)
+            if session_data is None:
+                self.log.info("セッションファイルが存在しません")
                 return False
             
-            with open(session_file, 'r', encoding='utf-8') as f:
-                session_data = json.load(f)
+            self.session_version = session_data.get('version')
+            self.stored_session_info = session_cookie_values(session_data['cookies'])
+            self.log = self.log.bind(session=f"{session_file}#v{self.session_version}")
+            
+            # CDPが使えれば最初の遷移前にCookieを一括注入し、1回の遷移で復元する
+            if self.set_cookies(session_data['cookies']):
+                self._navigate("https://www.tiktok.com/")
+                self.human_like_delay(3, 5)
+                self.log.info("セッション復元完了（CDP）")
+                return True
             
             # TikTokにアクセス
-            self.driver.get("https://www.tiktok.com/")
+            self._navigate("https://www.tiktok.com/")
             self.human_like_delay(2, 4)
             
             # Cookieを設定
@@ -373,34 +699,30 @@ class EnhancedTikTokDriver:
                 try:
                     self.driver.add_cookie(cookie)
                 except Exception as e:
-                    print(f"Cookie設定エラー: {e}")
+                    self.log.error(f"Cookie設定エラー: {e}")
             
             # ページをリロード
             self.driver.refresh()
             self.human_like_delay(3, 5)
             
-            print("セッション復元完了")
+            self.log.info("セッション復元完了")
             return True
             
+        except DeadlineExceeded:
+            raise
         except Exception as e:
-            print(f"セッション読み込みエラー: {e}")
+            self.log.error(f"セッション読み込みエラー: {e}")
             return False
     
+    @accepts_deadline
+    @counts_roundtrips
     def get_session_info(self):
         """現在のセッション情報取得"""
         try:
             # 重要なCookieを取得
-            important_cookies = ['sessionid', 'tt-target-idc']
-            session_info = {}
-            
-            cookies = self.driver.get_cookies()
-            for cookie in cookies:
-                if cookie['name'] in important_cookies:
-                    session_info[cookie['name']] = cookie['value']
-            
-            return session_info
+            return session_cookie_values(self.get_all_cookies())
         except Exception as e:
-            print(f"セッション情報取得エラー: {e}")
+            self.log.error(f"セッション情報取得エラー: {e}")
             return {}
     
     def close(self):
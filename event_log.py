@@ -0,0 +1,160 @@
+# event_log.py - 非同期の構造化ログ（キュー経由で書き込みスレッド1本がJSON行を出力）
+import os
+import sys
+import copy
+import json
+import queue
+import atexit
+import logging
+import threading
+import contextvars
+import multiprocessing
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from metrics import REGISTRY
+
+# 出力先とローテーション設定（ワーカープロセスはプロセス名付きの別ファイルに書く）
+EVENT_LOG_PATH = os.getenv('EVENT_LOG_PATH', 'tiktok_events.log')
+EVENT_LOG_MAX_BYTES = int(os.getenv('EVENT_LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+EVENT_LOG_BACKUPS = int(os.getenv('EVENT_LOG_BACKUPS', '5'))
+EVENT_LOG_LEVEL = os.getenv('EVENT_LOG_LEVEL', 'INFO')
+
+# キューが満杯の場合は待たずに破棄する（呼び出し側のスレッドをブロックしない）
+EVENT_LOG_QUEUE_SIZE = int(os.getenv('EVENT_LOG_QUEUE_SIZE', '10000'))
+
+# コンソールにも出力するか
+EVENT_LOG_CONSOLE = os.getenv('EVENT_LOG_CONSOLE', 'true').lower() == 'true'
+
+LOG_RECORDS_DROPPED = REGISTRY.counter(
+    "tiktok_log_records_dropped_total", "Log records dropped because the log queue was full"
+)
+
+# 実行中の処理フェーズ（スレッド/タスクごと）
+current_phase = contextvars.ContextVar('phase', default=None)
+
+# JSONに出力するコンテキスト項目
+CONTEXT_FIELDS = ("uniqueId", "session", "phase")
+
+# 例外のトレースバックを呼び出し元のスレッドで文字列にするためのフォーマッター
+_exception_formatter = logging.Formatter()
+
+_listener = None
+_handler = None
+_setup_lock = threading.Lock()
+
+class JsonFormatter(logging.Formatter):
+    """1レコード1行のJSON"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "process": record.processName,
+            "thread": record.threadName
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class DroppingQueueHandler(QueueHandler):
+    """キューが満杯ならレコードを破棄してカウントする"""
+
+    def prepare(self, record):
+        """書き込みスレッドへ渡すレコード（メッセージと例外はここで文字列にする）
+
+        標準の QueueHandler.prepare はトレースバックをメッセージ本文に連結するため、
+        例外は exc_text に残し、JSONでは exception 項目として本文と分けて出力する。
+        """
+        # 呼び出し時点のフェーズを記録（書き込みスレッドでは参照できない）
+        if getattr(record, "phase", None) is None:
+            record.phase = current_phase.get()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = _exception_formatter.formatException(record.exc_info)
+
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+class EventLogger(logging.LoggerAdapter):
+    """uniqueId/session を束縛したロガー（bind で項目を追加した子を作る）"""
+
+    def process(self, msg, kwargs):
+        extra = dict(self.extra)
+        extra.update(kwargs.pop("extra", None) or {})
+        kwargs["extra"] = extra
+        return msg, kwargs
+
+    def bind(self, **fields):
+        return EventLogger(self.logger, {**self.extra, **fields})
+
+def _log_path(path):
+    process = multiprocessing.current_process()
+    if process.name == 'MainProcess':
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{process.name}{ext}"
+
+def setup_event_log(path=EVENT_LOG_PATH):
+    """ルートロガーにキューを接続し、書き込みスレッドを開始（プロセスごとに一度だけ）"""
+    global _listener, _handler
+    with _setup_lock:
+        if _listener is not None:
+            return
+
+        path = _log_path(path)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        file_handler = RotatingFileHandler(
+            path, maxBytes=EVENT_LOG_MAX_BYTES, backupCount=EVENT_LOG_BACKUPS, encoding='utf-8'
+        )
+        file_handler.setFormatter(JsonFormatter())
+        handlers = [file_handler]
+        if EVENT_LOG_CONSOLE:
+            console_handler = logging.StreamHandler(sys.stdout)
+            console_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+            handlers.append(console_handler)
+
+        log_queue = queue.Queue(maxsize=EVENT_LOG_QUEUE_SIZE)
+        _handler = DroppingQueueHandler(log_queue)
+        root = logging.getLogger()
+        root.addHandler(_handler)
+        root.setLevel(EVENT_LOG_LEVEL)
+
+        _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_event_log)
+
+def shutdown_event_log():
+    """キューに残ったレコードを書き出して停止"""
+    global _listener, _handler
+    with _setup_lock:
+        listener, _listener = _listener, None
+        handler, _handler = _handler, None
+    if handler is not None:
+        logging.getLogger().removeHandler(handler)
+    if listener is not None:
+        listener.stop()
+
+def get_logger(name, **fields):
+    """構造化ロガーの取得（初回呼び出し時にパイプラインを開始）"""
+    setup_event_log()
+    return EventLogger(logging.getLogger(name), fields)
@@ -0,0 +1,193 @@
+# fair_scheduler.py - APIクライアント間の重み付き公平スケジューリング（ドライバー処理の実行枠を配分）
+import os
+import json
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from deadline import DeadlineExceeded
+from metrics import REGISTRY
+
+# クライアント定義（X-API-Key -> 名前・重み・同時実行数の上限）
+# 例: {"key-abc": {"name": "dashboard", "weight": 3, "max_in_flight": 4}}
+API_CLIENTS = os.getenv('API_CLIENTS', '')
+
+# 未登録・キーなしのリクエストを受け付けるか（受け付ける場合は anonymous として扱う）
+API_KEY_REQUIRED = os.getenv('API_KEY_REQUIRED', 'false').lower() == 'true'
+
+# 全クライアント合計の同時実行枠（/send 用と /connect 用で別々）、クライアントごとの待ち行列の上限
+# /connect はChrome起動を含み長く枠を持つため、/send の枠を使い切らないよう分けておく
+SCHEDULER_CONCURRENCY = int(os.getenv('SCHEDULER_CONCURRENCY', '8'))
+SCHEDULER_CONNECT_CONCURRENCY = int(os.getenv('SCHEDULER_CONNECT_CONCURRENCY', '4'))
+SCHEDULER_MAX_QUEUE = int(os.getenv('SCHEDULER_MAX_QUEUE', '100'))
+
+# 処理時間の見積もり（実測の指数移動平均）の初期値と平滑化係数
+DEFAULT_OPERATION_COST = 1.0
+COST_SMOOTHING = 0.2
+
+CLIENT_REQUESTS = REGISTRY.counter(
+    "tiktok_client_requests_total", "Requests per API client", ("client", "operation", "status")
+)
+CLIENT_REQUEST_SECONDS = REGISTRY.histogram(
+    "tiktok_client_request_seconds", "Request latency per API client including queueing", ("client", "operation")
+)
+CLIENT_QUEUE_SECONDS = REGISTRY.histogram(
+    "tiktok_client_queue_seconds", "Time spent waiting for a scheduler slot", ("client", "pool")
+)
+CLIENT_IN_FLIGHT = REGISTRY.gauge(
+    "tiktok_client_in_flight", "Requests currently holding a scheduler slot", ("client", "pool")
+)
+
+class SchedulerQueueFull(RuntimeError):
+    """クライアントの待ち行列が上限に達した"""
+
+class ApiClient:
+    """APIクライアントの設定"""
+
+    __slots__ = ("name", "weight", "max_in_flight")
+
+    def __init__(self, name, weight=1.0, max_in_flight=None):
+        self.name = name
+        self.weight = max(float(weight), 0.01)
+        self.max_in_flight = int(max_in_flight) if max_in_flight else SCHEDULER_CONCURRENCY
+
+ANONYMOUS_CLIENT = ApiClient("anonymous")
+
+def clients_from_env(value=None):
+    """API_CLIENTS（JSON）からAPIキー -> ApiClient を生成"""
+    value = value if value is not None else API_CLIENTS
+    if not value:
+        return {}
+    return {
+        api_key: ApiClient(
+            config.get("name", api_key[:8]),
+            config.get("weight", 1.0),
+            config.get("max_in_flight")
+        )
+        for api_key, config in json.loads(value).items()
+    }
+
+class _Ticket:
+    """実行枠の待ち札"""
+
+    __slots__ = ("client", "operation", "granted", "charged")
+
+    def __init__(self, client, operation):
+        self.client = client
+        self.operation = operation
+        self.granted = False
+        self.charged = 0.0
+
+class FairScheduler:
+    """開始時刻公平キューイング（SFQ）による実行枠の配分
+
+    各クライアントは仮想時刻を持ち、実行枠を得るたびに「見積もり処理時間 / 重み」
+    だけ進む。空いた枠は仮想時刻が最も小さいクライアントの先頭リクエストに割り当てる。
+    完了時に実測時間で補正するため、重い /connect を多用するクライアントは
+    軽い /send を送るクライアントより多くの枠を消費したとみなされる。
+    """
+
+    def __init__(self, concurrency=SCHEDULER_CONCURRENCY, max_queue=SCHEDULER_MAX_QUEUE, name="default"):
+        self.name = name
+        self.available = concurrency
+        self.max_queue = max_queue
+        self.condition = threading.Condition()
+        self.queues = {}
+        self.in_flight = {}
+        self.virtual_time = {}
+        self.global_virtual_time = 0.0
+        self.costs = {}
+
+    def _dispatch(self):
+        """空き枠を仮想時刻の小さいクライアントから順に割り当てる（ロック下で呼ぶ）"""
+        granted = False
+        while self.available > 0:
+            candidates = [
+                client for client, queue in self.queues.items()
+                if queue and self.in_flight.get(client.name, 0) < client.max_in_flight
+            ]
+            if not candidates:
+                break
+
+            client = min(candidates, key=lambda c: max(self.virtual_time.get(c.name, 0.0), self.global_virtual_time))
+            start = max(self.virtual_time.get(client.name, 0.0), self.global_virtual_time)
+            ticket = self.queues[client].popleft()
+            ticket.charged = self.costs.get(ticket.operation, DEFAULT_OPERATION_COST) / client.weight
+            ticket.granted = True
+
+            self.global_virtual_time = start
+            self.virtual_time[client.name] = start + ticket.charged
+            self.in_flight[client.name] = self.in_flight.get(client.name, 0) + 1
+            self.available -= 1
+            CLIENT_IN_FLIGHT.labels(client=client.name, pool=self.name).set(self.in_flight[client.name])
+            granted = True
+
+        if granted:
+            self.condition.notify_all()
+
+    def _release(self, ticket, elapsed):
+        with self.condition:
+            client = ticket.client
+            self.available += 1
+            self.in_flight[client.name] -= 1
+            CLIENT_IN_FLIGHT.labels(client=client.name, pool=self.name).set(self.in_flight[client.name])
+
+            # 見積もりとの差を仮想時刻に反映し、処理時間の見積もりを更新
+            self.virtual_time[client.name] += elapsed / client.weight - ticket.charged
+            previous = self.costs.get(ticket.operation, DEFAULT_OPERATION_COST)
+            self.costs[ticket.operation] = previous + COST_SMOOTHING * (elapsed - previous)
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, client, operation, deadline=None):
+        """実行枠の取得（期限までに得られなければ DeadlineExceeded）"""
+        ticket = _Ticket(client, operation)
+        queued_at = time.monotonic()
+        with self.condition:
+            queue = self.queues.setdefault(client, deque())
+            if len(queue) >= self.max_queue:
+                raise SchedulerQueueFull(f"{client.name}の待ち行列が上限（{self.max_queue}件）に達しました")
+            queue.append(ticket)
+            self._dispatch()
+
+            while not ticket.granted:
+                timeout = deadline.remaining() if deadline is not None else None
+                if timeout is not None and timeout <= 0:
+                    queue.remove(ticket)
+                    raise DeadlineExceeded(f"実行枠の待機中に処理期限を超過しました ({operation})")
+                self.condition.wait(timeout)
+
+        started = time.monotonic()
+        CLIENT_QUEUE_SECONDS.labels(client=client.name, pool=self.name).observe(started - queued_at)
+        try:
+            yield
+        finally:
+            self._release(ticket, time.monotonic() - started)
+
+    def run(self, client, operation, func, *args, deadline=None, **kwargs):
+        """実行枠を得てから func を実行し、クライアント別のメトリクスを記録"""
+        started = time.monotonic()
+        try:
+            with self.slot(client, operation, deadline):
+                result = func(*args, **kwargs)
+        except SchedulerQueueFull as e:
+            result = {"status": "rate_limited", "message": str(e)}
+        except DeadlineExceeded as e:
+            result = {"status": "timeout", "message": str(e)}
+
+        CLIENT_REQUESTS.labels(client=client.name, operation=operation, status=result.get("status", "unknown")).inc()
+        CLIENT_REQUEST_SECONDS.labels(client=client.name, operation=operation).observe(time.monotonic() - started)
+        return result
+
+    def stats(self):
+        """クライアントごとの待ち件数・実行中件数"""
+        with self.condition:
+            return {
+                client.name: {
+                    "queued": len(queue),
+                    "in_flight": self.in_flight.get(client.name, 0),
+                    "weight": client.weight,
+                    "max_in_flight": client.max_in_flight
+                }
+                for client, queue in self.queues.items()
+            }
@@ -0,0 +1,128 @@
+# fake_webdriver.py - Chromeを起動せずに接続処理を通すためのWebDriver代替（テスト・ベンチマーク用）
+import re
+import time
+import itertools
+
+FAKE_USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) FakeWebDriver/1.0"
+
+class FakeElement:
+    """クリックするとログイン済みCookieが発行される要素"""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.value = ""
+
+    def click(self):
+        self.driver.login()
+
+    def clear(self):
+        self.value = ""
+
+    def send_keys(self, text):
+        self.value += text
+
+    def is_displayed(self):
+        return True
+
+    def is_enabled(self):
+        return True
+
+class FakeWebDriver:
+    """selenium.webdriver.Chrome のうち EnhancedTikTokDriver が使う範囲を模倣"""
+
+    session_ids = itertools.count(1)
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.current_url = "about:blank"
+        self.cookies = {}
+        self.page_load_timeout = None
+        self.commands = 0
+
+    def execute(self, driver_command, params=None):
+        """WebDriverコマンド1回分（chromedriverへの往復。必要なら遅延を模擬）"""
+        self.commands += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def login(self):
+        """ログイン成功時に発行されるCookieを設定"""
+        session_id = f"fake-session-{next(self.session_ids)}"
+        for name, value in (("sessionid", session_id), ("tt-target-idc", "useast2a")):
+            self.cookies[name] = {
+                "name": name,
+                "value": value,
+                "domain": ".tiktok.com",
+                "path": "/",
+                "secure": True,
+                "httpOnly": True
+            }
+
+    def get(self, url):
+        self.execute("get")
+        self.current_url = url
+
+    def refresh(self):
+        self.execute("refresh")
+
+    def set_page_load_timeout(self, seconds):
+        self.execute("set_page_load_timeout")
+        self.page_load_timeout = seconds
+
+    def execute_script(self, script, *args):
+        self.execute("execute_script")
+        if script.startswith("return {"):
+            # batch_read でまとめた式を評価
+            values = {
+                "location.href": self.current_url,
+                "navigator.userAgent": FAKE_USER_AGENT,
+                "document.title": "TikTok"
+            }
+            return {
+                key: values.get(expression)
+                for key, expression in re.findall(r'"(\w+)": \((.+?)\)', script)
+            }
+        if "navigator.userAgent" in script:
+            return FAKE_USER_AGENT
+        if script.strip().startswith("const [locators, clickable]"):
+            # セレクター競合待機では常に最初のロケーターが一致したものとする
+            return [0, FakeElement(self)]
+        return None
+
+    def find_element(self, by, value):
+        self.execute("find_element")
+        return FakeElement(self)
+
+    def find_elements(self, by, value):
+        self.execute("find_elements")
+        return [FakeElement(self)]
+
+    def get_cookies(self):
+        self.execute("get_cookies")
+        return [dict(cookie) for cookie in self.cookies.values()]
+
+    def add_cookie(self, cookie):
+        self.execute("add_cookie")
+        self.cookies[cookie["name"]] = dict(cookie)
+
+    def execute_cdp_cmd(self, cmd, cmd_args):
+        self.execute("execute_cdp_cmd")
+        if cmd == "Network.getAllCookies":
+            return {"cookies": [
+                dict(cookie, expires=-1, session=True, size=len(cookie["name"]) + len(cookie["value"]))
+                for cookie in self.cookies.values()
+            ]}
+        if cmd == "Network.setCookies":
+            for cookie in cmd_args["cookies"]:
+                self.cookies[cookie["name"]] = {
+                    key: cookie[key] for key in ("name", "value", "domain", "path", "secure", "httpOnly") if key in cookie
+                }
+            return {}
+        raise ValueError(f"未対応のCDPコマンド: {cmd}")
+
+    def delete_all_cookies(self):
+        self.execute("delete_all_cookies")
+        self.cookies.clear()
+
+    def quit(self):
+        self.execute("quit")
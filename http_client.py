@@ -0,0 +1,91 @@
+# http_client.py - 外部HTTP通信の共有セッション（コネクションプール）と送信元IPのキャッシュ
+import os
+import time
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+# ホストごとに保持する接続数
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '16'))
+
+# 送信元IPの確認先（テストではローカルのスタブを指定）と再取得間隔（秒）
+EGRESS_IP_URL = os.getenv('EGRESS_IP_URL', 'https://httpbin.org/ip')
+EGRESS_IP_TTL = float(os.getenv('EGRESS_IP_TTL', '300'))
+EGRESS_IP_TIMEOUT = float(os.getenv('EGRESS_IP_TIMEOUT', '5'))
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """プロセス内で共有するrequests.Session（TCP/TLS接続を再利用）"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+        return _session
+
+class EgressIPCache:
+    """送信元IPのキャッシュ（期限切れ時はバックグラウンドで再取得し、呼び出し側は待たない）"""
+
+    def __init__(self, url=EGRESS_IP_URL, ttl=EGRESS_IP_TTL, timeout=EGRESS_IP_TIMEOUT):
+        self.url = url
+        self.ttl = ttl
+        self.timeout = timeout
+        self.proxies = None
+        self.ip = None
+        self.fetched_at = None
+        self.generation = 0
+        self.refreshing = False
+        self.lock = threading.Lock()
+
+    def get(self):
+        """キャッシュ済みのIP（未取得なら 'unknown'）"""
+        with self.lock:
+            ip = self.ip
+            stale = self.fetched_at is None or time.monotonic() - self.fetched_at >= self.ttl
+        if stale:
+            self.refresh()
+        return ip or 'unknown'
+
+    def refresh(self):
+        """バックグラウンドで再取得（実行中なら何もしない）"""
+        with self.lock:
+            if self.refreshing:
+                return
+            self.refreshing = True
+            generation = self.generation
+            proxies = self.proxies
+        threading.Thread(target=self._fetch, args=(generation, proxies), daemon=True).start()
+
+    def _fetch(self, generation, proxies):
+        try:
+            response = get_session().get(self.url, proxies=proxies, timeout=self.timeout)
+            ip = response.json().get('origin')
+        except (requests.RequestException, ValueError):
+            ip = None
+
+        with self.lock:
+            self.refreshing = False
+            # 取得中にドライバーが作り直された場合は古い結果を捨てる
+            if generation != self.generation:
+                retry = True
+            else:
+                retry = False
+                if ip:
+                    self.ip = ip
+                self.fetched_at = time.monotonic()
+        if retry:
+            self.refresh()
+
+    def invalidate(self, proxies=None):
+        """ドライバー再作成時（プロキシ変更）に破棄して再取得"""
+        with self.lock:
+            self.generation += 1
+            self.proxies = proxies
+            self.ip = None
+            self.fetched_at = None
+        self.refresh()
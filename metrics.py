@@ -0,0 +1,356 @@
+# metrics.py - Prometheus形式のメトリクス（カウンター / ゲージ / ヒストグラム）
+import os
+import re
+import mmap
+import struct
+import threading
+
+# 複数プロセスで共有するメトリクスファイル（未設定ならプロセス内のメモリに保持）
+# デプロイ開始時に削除しておけば、前回の起動の値は引き継がない
+METRICS_MMAP_PATH = os.getenv('METRICS_MMAP_PATH')
+METRICS_MMAP_REGIONS = int(os.getenv('METRICS_MMAP_REGIONS', '32'))
+METRICS_MMAP_SLOTS = int(os.getenv('METRICS_MMAP_SLOTS', '2048'))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _escape_label_value(value):
+    """ラベル値のエスケープ（Prometheusテキスト形式: バックスラッシュ・二重引用符・改行）"""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in labels) + "}"
+
+def _sample_family(sample_key):
+    """サンプル名からメトリクス名を取得（_bucket/_sum/_count はヒストグラムの一部）"""
+    name = sample_key.split("{", 1)[0]
+    for suffix in ("_bucket", "_sum", "_count"):
+        if name.endswith(suffix):
+            return name, name[:-len(suffix)]
+    return name, name
+
+_LE_LABEL = re.compile(r'(?<=[{,])le="([^"]*)"')
+
+def _sample_sort_key(sample):
+    """出力順のキー（ヒストグラムのバケットは le を数値として昇順、+Inf を最後に）"""
+    key = sample[0]
+    match = _LE_LABEL.search(key)
+    if match is None:
+        return key, 0.0
+    return key[:match.start()] + key[match.end():], float(match.group(1))
+
+class MemoryStore:
+    """サンプル値の保存先（サンプルキー -> 値）"""
+
+    # 他プロセスの値を含むか（含まない場合はワーカーのスナップショットを合算して出力する）
+    shared = False
+
+    def __init__(self):
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, key, amount, gauge=False):
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def set(self, key, value, gauge=True):
+        with self.lock:
+            self.values[key] = value
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.values)
+
+# 共有メトリクスファイルの配置
+#   ファイルヘッダー（64バイト）: マジック, 領域数, 領域あたりのスロット数
+#   領域（プロセスごと）: ヘッダー（64バイト: pid, 起動時刻, 使用スロット数）+ スロット × N
+#   スロット（256バイト）: サンプルキー（UTF-8、240バイトまで）, 値（double）, 種別（1ならゲージ）
+_FILE_MAGIC = b"TKMETR01"
+_FILE_HEADER = struct.Struct("<8sII")
+_FILE_HEADER_SIZE = 64
+_REGION_HEADER = struct.Struct("<IxxxxQI")
+_REGION_HEADER_SIZE = 64
+_KEY_SIZE = 240
+_SLOT_SIZE = 256
+_VALUE = struct.Struct("<d")
+
+def _process_start_time(pid):
+    from process_tree import start_time
+    return start_time(pid) or 0
+
+class MmapStore:
+    """メモリマップしたファイルにプロセスごとの領域を持つ保存先
+
+    各プロセスは自分の領域にだけ書き込むため、値の更新にプロセス間のロックは不要
+    （プロセス内のスレッド間のみ threading.Lock で直列化する）。ファイルロック（flock）を
+    取るのは領域の確保時だけ。読み取り側は全領域の値を合算する。
+    終了したプロセスの領域は、カウンター・ヒストグラムの値を残したまま次に起動した
+    プロセスが引き継ぎ、ゲージは0に戻す（終了済みプロセスのゲージは合算にも含めない）。
+    """
+
+    shared = True
+
+    def __init__(self, path, regions=METRICS_MMAP_REGIONS, slots=METRICS_MMAP_SLOTS):
+        self.path = path
+        self.regions = regions
+        self.slots = slots
+        self.region_size = _REGION_HEADER_SIZE + slots * _SLOT_SIZE
+        self.lock = threading.Lock()
+        self.overflow_reported = False
+        self.pid = None
+        self._open()
+        self._claim()
+
+    def _open(self):
+        import fcntl
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        size = _FILE_HEADER_SIZE + self.regions * self.region_size
+
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            header = os.pread(self.fd, _FILE_HEADER.size, 0)
+            expected = _FILE_HEADER.pack(_FILE_MAGIC, self.regions, self.slots)
+            if not header.strip(b"\0"):
+                os.ftruncate(self.fd, size)
+                os.pwrite(self.fd, expected, 0)
+            elif header != expected:
+                # 他のプロセスが古い配置でマップしている可能性があるため作り直さない
+                raise RuntimeError(f"メトリクスファイルの配置が設定と異なります（削除してから起動してください）: {self.path}")
+            self.map = mmap.mmap(self.fd, size)
+        except BaseException:
+            # 閉じるとロックも解放される
+            os.close(self.fd)
+            raise
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def _region_offset(self, index):
+        return _FILE_HEADER_SIZE + index * self.region_size
+
+    def _slot_offset(self, region, slot):
+        return self._region_offset(region) + _REGION_HEADER_SIZE + slot * _SLOT_SIZE
+
+    def _read_region_header(self, index):
+        return _REGION_HEADER.unpack_from(self.map, self._region_offset(index))
+
+    def _alive(self, pid, started):
+        return pid != 0 and _process_start_time(pid) == started
+
+    def _claim(self):
+        """空き領域（または終了したプロセスの領域）を確保（flock下で行う）"""
+        import fcntl
+        pid = os.getpid()
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            for index in range(self.regions):
+                owner, started, count = self._read_region_header(index)
+                if owner != 0 and self._alive(owner, started):
+                    continue
+                self._adopt(index, count)
+                _REGION_HEADER.pack_into(
+                    self.map, self._region_offset(index), pid, _process_start_time(pid), len(self.index)
+                )
+                self.region = index
+                self.pid = pid
+                return
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        raise RuntimeError(f"メトリクスファイルの空き領域がありません（{self.regions}プロセス分）: {self.path}")
+
+    def _adopt(self, region, count):
+        """前の持ち主のカウンターを引き継ぎ、ゲージを0に戻す"""
+        self.index = {}
+        for slot in range(min(count, self.slots)):
+            key, _, gauge = self._read_slot(region, slot)
+            if gauge:
+                _VALUE.pack_into(self.map, self._slot_offset(region, slot) + _KEY_SIZE, 0.0)
+            self.index[key] = slot
+
+    def _read_slot(self, region, slot):
+        offset = self._slot_offset(region, slot)
+        key = bytes(self.map[offset:offset + _KEY_SIZE]).rstrip(b"\0").decode('utf-8')
+        value = _VALUE.unpack_from(self.map, offset + _KEY_SIZE)[0]
+        gauge = self.map[offset + _KEY_SIZE + _VALUE.size] == 1
+        return key, value, gauge
+
+    def _slot_for(self, key, gauge):
+        """キーのスロットのオフセット（なければ追加、満杯ならNone、self.lock下で呼ぶ）"""
+        if self.pid != os.getpid():
+            # fork後の子プロセスは親の領域に書き込まず、自分の領域を確保する
+            self._claim()
+        slot = self.index.get(key)
+        if slot is None:
+            encoded = key.encode('utf-8')
+            if len(encoded) > _KEY_SIZE or len(self.index) >= self.slots:
+                if not self.overflow_reported:
+                    self.overflow_reported = True
+                    print(f"メトリクスファイルに書き込めないサンプルを破棄します: {key}")
+                return None
+            slot = len(self.index)
+            offset = self._slot_offset(self.region, slot)
+            self.map[offset:offset + _KEY_SIZE] = encoded.ljust(_KEY_SIZE, b"\0")
+            _VALUE.pack_into(self.map, offset + _KEY_SIZE, 0.0)
+            self.map[offset + _KEY_SIZE + _VALUE.size] = 1 if gauge else 0
+            self.index[key] = slot
+            # キーと初期値を書き終えてから使用スロット数を増やす（読み取り側に公開）
+            struct.pack_into("<I", self.map, self._region_offset(self.region) + 16, len(self.index))
+        return self._slot_offset(self.region, slot) + _KEY_SIZE
+
+    def inc(self, key, amount, gauge=False):
+        with self.lock:
+            offset = self._slot_for(key, gauge)
+            if offset is not None:
+                _VALUE.pack_into(self.map, offset, _VALUE.unpack_from(self.map, offset)[0] + amount)
+
+    def set(self, key, value, gauge=True):
+        with self.lock:
+            offset = self._slot_for(key, gauge)
+            if offset is not None:
+                _VALUE.pack_into(self.map, offset, value)
+
+    def snapshot(self):
+        """全プロセスの値の合計（終了したプロセスのゲージは除く）"""
+        values = {}
+        for region in range(self.regions):
+            owner, started, count = self._read_region_header(region)
+            if count == 0:
+                continue
+            alive = self._alive(owner, started)
+            for slot in range(min(count, self.slots)):
+                key, value, gauge = self._read_slot(region, slot)
+                if gauge and not alive:
+                    continue
+                values[key] = values.get(key, 0.0) + value
+        return values
+
+    def live_processes(self):
+        """領域を持つ稼働中のプロセス数"""
+        return sum(1 for region in range(self.regions) if self._alive(*self._read_region_header(region)[:2]))
+
+def create_store(path=None):
+    """METRICS_MMAP_PATH が設定されていれば共有ファイル、なければプロセス内メモリ"""
+    path = path if path is not None else METRICS_MMAP_PATH
+    return MmapStore(path) if path else MemoryStore()
+
+class _Metric:
+    def __init__(self, registry, name, help_text, labelnames):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+
+    def _labels(self, labelvalues):
+        missing = set(self.labelnames) - set(labelvalues)
+        if missing:
+            raise ValueError(f"{self.name}: ラベルが不足しています: {sorted(missing)}")
+        return tuple((name, str(labelvalues[name])) for name in self.labelnames)
+
+    def labels(self, **labelvalues):
+        return _Child(self, self._labels(labelvalues))
+
+class _Child:
+    """ラベル値を束縛したメトリクス"""
+
+    def __init__(self, metric, labels):
+        self.metric = metric
+        self.labels = labels
+
+    def inc(self, amount=1.0):
+        self.metric.registry.store.inc(
+            self.metric.name + _format_labels(self.labels), amount, self.metric.type == "gauge"
+        )
+
+    def dec(self, amount=1.0):
+        self.inc(-amount)
+
+    def set(self, value):
+        self.metric.registry.store.set(self.metric.name + _format_labels(self.labels), value)
+
+    def observe(self, value):
+        metric = self.metric
+        store = metric.registry.store
+        for bound in metric.buckets:
+            if value <= bound:
+                store.inc(f"{metric.name}_bucket" + _format_labels(self.labels + (("le", repr(bound)),)), 1.0)
+        store.inc(f"{metric.name}_bucket" + _format_labels(self.labels + (("le", "+Inf"),)), 1.0)
+        store.inc(f"{metric.name}_sum" + _format_labels(self.labels), value)
+        store.inc(f"{metric.name}_count" + _format_labels(self.labels), 1.0)
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount=1.0):
+        _Child(self, ()).inc(amount)
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value):
+        _Child(self, ()).set(value)
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, registry, name, help_text, labelnames, buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value):
+        _Child(self, ()).observe(value)
+
+class MetricsRegistry:
+    """メトリクス定義とサンプル値の管理"""
+
+    def __init__(self, store=None):
+        self.store = store or MemoryStore()
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _register(self, cls, name, *args, **kwargs):
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = cls(self, name, *args, **kwargs)
+            return self.metrics[name]
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter, name, help_text, labelnames)
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self._register(Gauge, name, help_text, labelnames)
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, help_text, labelnames, buckets=buckets)
+
+    def snapshot(self):
+        return self.store.snapshot()
+
+    def render(self, extra_snapshots=()):
+        """Prometheusテキスト形式で出力（他プロセスのスナップショットは加算して合成）"""
+        samples = self.snapshot()
+        for snapshot in extra_snapshots:
+            for key, value in snapshot.items():
+                samples[key] = samples.get(key, 0.0) + value
+
+        families = {}
+        for key, value in samples.items():
+            _, family = _sample_family(key)
+            if family not in self.metrics:
+                # ヒストグラム以外で _sum/_count で終わる名前のメトリクス
+                family = key.split("{", 1)[0]
+            families.setdefault(family, []).append((key, value))
+
+        lines = []
+        for family in sorted(families):
+            metric = self.metrics.get(family)
+            if metric:
+                lines.append(f"# HELP {family} {metric.help}")
+                lines.append(f"# TYPE {family} {metric.type}")
+            for key, value in sorted(families[family], key=_sample_sort_key):
+                lines.append(f"{key} {float(value)!r}")
+        return "\n".join(lines) + "\n"
+
+# プロセス全体で共有するレジストリ
+REGISTRY = MetricsRegistry(create_store())
@@ -0,0 +1,96 @@
+# process_tree.py - /proc からプロセスツリー（chromedriver配下のChrome等）を調べる
+import os
+import signal
+
+def _parent_pids():
+    """pid -> 親pid の対応表"""
+    parents = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'r') as f:
+                # comm に空白や括弧が含まれ得るため最後の ')' 以降を解析する
+                fields = f.read().rsplit(')', 1)[1].split()
+            parents[int(entry)] = int(fields[1])
+        except (OSError, IndexError, ValueError):
+            continue
+    return parents
+
+def descendants(pid):
+    """指定プロセスの子孫pid一覧"""
+    children = {}
+    for child, parent in _parent_pids().items():
+        children.setdefault(parent, []).append(child)
+
+    result = []
+    stack = list(children.get(pid, []))
+    while stack:
+        child = stack.pop()
+        result.append(child)
+        stack.extend(children.get(child, []))
+    return result
+
+def rss_bytes(pid):
+    """プロセス1つの常駐メモリ（取得できなければ0）"""
+    try:
+        with open(f'/proc/{pid}/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return 0
+
+def tree_rss_bytes(pid):
+    """プロセスとその子孫の常駐メモリ合計"""
+    return sum(rss_bytes(p) for p in [pid] + descendants(pid))
+
+def _stat_fields(pid):
+    """/proc/<pid>/stat の comm より後ろの項目（state, ppid, ...）"""
+    try:
+        with open(f'/proc/{pid}/stat', 'r') as f:
+            return f.read().rsplit(')', 1)[1].split()
+    except (OSError, IndexError):
+        return None
+
+def start_time(pid):
+    """プロセスの起動時刻（ブート後のクロック数、pid再利用の判別に使う）"""
+    fields = _stat_fields(pid)
+    try:
+        return int(fields[19]) if fields else None
+    except (IndexError, ValueError):
+        return None
+
+def executable(pid):
+    """プロセスの実行ファイルのパス（取得できなければNone）"""
+    try:
+        return os.readlink(f'/proc/{pid}/exe')
+    except OSError:
+        return None
+
+def snapshot_descendants(pid, exclude_executable=None):
+    """子孫pid -> 起動時刻（後で kill_remaining に渡す、exclude_executable のプロセスは除く）"""
+    snapshot = {}
+    for child in descendants(pid):
+        if exclude_executable and executable(child) == exclude_executable:
+            continue
+        started = start_time(child)
+        if started is not None:
+            snapshot[child] = started
+    return snapshot
+
+def kill_remaining(snapshot, sig=signal.SIGKILL):
+    """スナップショット時点のプロセスのうち、まだ残っているものを強制終了（終了させた数）"""
+    killed = 0
+    for pid, started in snapshot.items():
+        fields = _stat_fields(pid)
+        # 終了済み（ゾンビ）か、起動時刻が違えば別プロセスにpidが再利用されている
+        if not fields or fields[0] == 'Z' or start_time(pid) != started:
+            continue
+        try:
+            os.kill(pid, sig)
+            killed += 1
+        except (ProcessLookupError, PermissionError):
+            continue
+    return killed
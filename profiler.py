@@ -0,0 +1,102 @@
+# profiler.py - 本番プロセス内のサンプリングプロファイラー（要求された時だけ動作）
+import os
+import sys
+import time
+import threading
+from collections import Counter
+
+# 1回のプロファイル実行の上限（秒）とサンプリング間隔の既定値（秒）
+PROFILE_MAX_SECONDS = float(os.getenv('PROFILE_MAX_SECONDS', '60'))
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', '0.005'))
+
+# スタック中に現れたら先頭にタグを付ける呼び出し元（接続プール・ドライバー・監視の主要処理）
+TAGGED_FUNCTIONS = ("create_connection", "send_message", "get_session_info", "record_event")
+
+# 待機状態の判定（スタック最上位のPythonフレームのファイル名・関数名で分類）
+LOCK_WAIT_FILES = ("threading.py", "queue.py", "_base.py")
+IO_WAIT_FILES = ("socket.py", "ssl.py", "selectors.py", "client.py", "connection.py", "socketserver.py")
+IO_WAIT_FUNCTIONS = ("recv", "recv_into", "readinto", "readline", "read", "accept", "select", "poll", "send", "sendall")
+
+class ProfilerBusy(RuntimeError):
+    """別のプロファイル実行中"""
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def classify_state(frame):
+    """スレッドの状態（running / lock_wait / io_wait）"""
+    code = frame.f_code
+    filename = os.path.basename(code.co_filename)
+    if filename in LOCK_WAIT_FILES and code.co_name in ("wait", "acquire", "get", "_wait_for_tstate_lock", "result", "join"):
+        return "lock_wait"
+    if filename in IO_WAIT_FILES or code.co_name in IO_WAIT_FUNCTIONS:
+        return "io_wait"
+    return "running"
+
+class SamplingProfiler:
+    """sys._current_frames() を一定間隔で読み、スタックを集計する
+
+    トレースフックは使わないため、実行していない間のコストはない。
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.lock = threading.Lock()
+
+    def run(self, seconds, interval=None):
+        """seconds 秒間サンプリングして結果を返す（同時実行不可）"""
+        if not self.lock.acquire(blocking=False):
+            raise ProfilerBusy("プロファイル実行中です")
+        try:
+            return self._sample(min(seconds, PROFILE_MAX_SECONDS), interval or self.interval)
+        finally:
+            self.lock.release()
+
+    def _sample(self, seconds, interval):
+        me = threading.get_ident()
+        stacks = Counter()
+        states = {}
+        tagged = Counter()
+        samples = 0
+        started = time.monotonic()
+        deadline = started + seconds
+
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                thread_name = names.get(ident, f"thread-{ident}")
+                state = classify_state(frame)
+                thread_states = states.setdefault(thread_name, Counter())
+                thread_states[state] += 1
+
+                labels = []
+                tags = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    if frame.f_code.co_name in TAGGED_FUNCTIONS:
+                        tags.append(frame.f_code.co_name)
+                    frame = frame.f_back
+                labels.reverse()
+
+                # 最も外側のタグをフレームグラフの根にする（同じ処理のサンプルがまとまる）
+                root = [f"[{tags[-1]}]"] if tags else []
+                for tag in set(tags):
+                    tagged[tag] += 1
+                stacks[";".join([thread_name] + root + labels)] += 1
+            samples += 1
+            time.sleep(interval)
+
+        return {
+            "duration": time.monotonic() - started,
+            "interval": interval,
+            "samples": samples,
+            "collapsed": "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()),
+            "threads": {name: dict(counts) for name, counts in states.items()},
+            "tagged": dict(tagged)
+        }
+
+# プロセス全体で共有するプロファイラー
+PROFILER = SamplingProfiler()
@@ -0,0 +1,222 @@
+# profiles.py - uniqueIdごとのChromeプロファイル管理（テンプレート複製・キャッシュ削除・古いプロファイルの掃除）
+import os
+import time
+import fcntl
+import shutil
+import threading
+
+# テンプレートプロファイル（未設定なら <PROFILE_ROOT>-template、存在しなければ空のプロファイルで起動）
+# uniqueIdごとのプロファイルと同じディレクトリに置くと、同名のuniqueIdで上書きされるため外に置く
+PROFILE_TEMPLATE = os.getenv('PROFILE_TEMPLATE')
+
+# この日数以上接続されていないuniqueIdのプロファイルを削除
+PROFILE_CLEANUP_DAYS = float(os.getenv('PROFILE_CLEANUP_DAYS', '7'))
+PROFILE_CLEANUP_INTERVAL = float(os.getenv('PROFILE_CLEANUP_INTERVAL', '3600'))
+
+# ディスク使用量の再計算間隔（走査は掃除スレッドで行い、/status は計算済みの値を返す）
+PROFILE_USAGE_TTL = float(os.getenv('PROFILE_USAGE_TTL', '60'))
+
+# 切断時に削除するキャッシュ（Cookie・Local Storage・IndexedDB はセッション維持のため残す）
+CACHE_DIRS = (
+    "Default/Cache",
+    "Default/Code Cache",
+    "Default/GPUCache",
+    "Default/DawnCache",
+    "Default/Service Worker/CacheStorage",
+    "Default/Service Worker/ScriptCache",
+    "GrShaderCache",
+    "GraphiteDawnCache",
+    "ShaderCache",
+    "component_crx_cache"
+)
+
+# 最終接続時刻の記録ファイル
+LAST_USED_MARKER = ".last_used"
+
+# ioctl(FICLONE): Btrfs / XFS などでブロックを共有したまま複製する
+FICLONE = 0x40049409
+
+def clone_file(src, dst):
+    """ファイル複製（reflink可能なら共有、できなければ通常コピー）"""
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            return True
+        except OSError:
+            shutil.copyfileobj(fsrc, fdst)
+            return False
+
+def clone_tree(src, dst):
+    """ディレクトリ複製（Chromeはファイルをその場で書き換えるためハードリンクは使わない）"""
+    for directory, dirnames, filenames in os.walk(src):
+        relative = os.path.relpath(directory, src)
+        target = os.path.normpath(os.path.join(dst, relative))
+        # テンプレート側のキャッシュは複製しない
+        dirnames[:] = [
+            name for name in dirnames
+            if os.path.normpath(os.path.join(relative, name)) not in CACHE_DIRS
+        ]
+        os.makedirs(target, exist_ok=True)
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            if os.path.islink(path):
+                continue
+            clone_file(path, os.path.join(target, filename))
+        shutil.copystat(directory, target)
+
+def directory_size(path):
+    """ディレクトリの実使用量（ブロック数ベース）"""
+    total = 0
+    for directory, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.lstat(os.path.join(directory, filename)).st_blocks * 512
+            except OSError:
+                continue
+    return total
+
+class ProfileManager:
+    """uniqueIdごとのChromeプロファイル管理"""
+
+    def __init__(self, root="./profiles", template=PROFILE_TEMPLATE):
+        self.root = root
+        self.template = template or os.path.normpath(root) + "-template"
+        self.usage_cache = {}
+        self.lock = threading.Lock()
+        self.running = False
+        self._move_legacy_template()
+
+    def _move_legacy_template(self):
+        """以前の既定の配置（<PROFILE_ROOT>/_template）のテンプレートを移動"""
+        legacy = os.path.join(self.root, "_template")
+        if os.path.isdir(legacy) and not os.path.exists(self.template):
+            os.rename(legacy, self.template)
+            print(f"テンプレートプロファイルを移動: {legacy} -> {self.template}")
+
+    def path_for(self, unique_id):
+        """uniqueIdのプロファイルのパス（テンプレートを指す場合は ValueError）"""
+        path = os.path.join(self.root, unique_id)
+        if os.path.abspath(path) == os.path.abspath(self.template):
+            raise ValueError(f"テンプレートプロファイルは接続に使用できません: {unique_id}")
+        return path
+
+    def _touch(self, path):
+        with open(os.path.join(path, LAST_USED_MARKER), 'a'):
+            pass
+        os.utime(os.path.join(path, LAST_USED_MARKER))
+
+    def prepare(self, unique_id):
+        """接続用プロファイルを用意（未作成ならテンプレートから複製）"""
+        path = self.path_for(unique_id)
+        if not os.path.isdir(path):
+            if os.path.isdir(self.template):
+                # 複製途中のプロファイルをChromeに渡さないよう一時ディレクトリで作ってから置き換える
+                tmp_path = f"{path}.cloning-{os.getpid()}-{threading.get_ident()}"
+                try:
+                    clone_tree(self.template, tmp_path)
+                    os.rename(tmp_path, path)
+                    print(f"プロファイル複製: {unique_id}")
+                except OSError:
+                    shutil.rmtree(tmp_path, ignore_errors=True)
+                    if not os.path.isdir(path):
+                        raise
+            else:
+                os.makedirs(path, exist_ok=True)
+
+        self._touch(path)
+        return path
+
+    def prune(self, unique_id):
+        """切断後のキャッシュ削除（削除したバイト数を返す）"""
+        path = self.path_for(unique_id)
+        if not os.path.isdir(path):
+            return 0
+
+        freed = 0
+        for cache_dir in CACHE_DIRS:
+            cache_path = os.path.join(path, cache_dir)
+            if os.path.isdir(cache_path):
+                freed += directory_size(cache_path)
+                shutil.rmtree(cache_path, ignore_errors=True)
+
+        self._touch(path)
+        with self.lock:
+            self.usage_cache.pop(unique_id, None)
+        return freed
+
+    def disk_usage(self, unique_id):
+        """計算済みのディスク使用量（未計算ならNone、ディスクは走査しない）"""
+        with self.lock:
+            cached = self.usage_cache.get(unique_id)
+        return cached[1] if cached else None
+
+    def refresh_usage(self, active_ids=(), max_age=PROFILE_USAGE_TTL):
+        """接続中のプロファイルのうち、計算から max_age 秒を過ぎたものの使用量を再計算"""
+        active = set(active_ids)
+        with self.lock:
+            for unique_id in set(self.usage_cache) - active:
+                del self.usage_cache[unique_id]
+            stale = [
+                unique_id for unique_id in active
+                if unique_id not in self.usage_cache or time.time() - self.usage_cache[unique_id][0] >= max_age
+            ]
+
+        for unique_id in stale:
+            usage = directory_size(self.path_for(unique_id))
+            with self.lock:
+                self.usage_cache[unique_id] = (time.time(), usage)
+        return len(stale)
+
+    def cleanup(self, active_ids=(), max_age_days=PROFILE_CLEANUP_DAYS):
+        """max_age_days 日以上接続されていないプロファイルを削除"""
+        if not os.path.isdir(self.root):
+            return []
+
+        active = set(active_ids)
+        threshold = time.time() - max_age_days * 86400
+        template = os.path.abspath(self.template)
+        removed = []
+
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name in active or not os.path.isdir(path) or os.path.abspath(path) == template:
+                continue
+            if ".cloning-" in name:
+                continue
+
+            marker = os.path.join(path, LAST_USED_MARKER)
+            try:
+                last_used = os.stat(marker if os.path.exists(marker) else path).st_mtime
+            except OSError:
+                continue
+            if last_used < threshold:
+                shutil.rmtree(path, ignore_errors=True)
+                removed.append(name)
+
+        with self.lock:
+            for name in removed:
+                self.usage_cache.pop(name, None)
+        if removed:
+            print(f"古いプロファイルを削除: {len(removed)}件")
+        return removed
+
+    def start_cleanup(self, active_ids, interval=PROFILE_CLEANUP_INTERVAL, usage_interval=PROFILE_USAGE_TTL):
+        """定期掃除とディスク使用量の計算の開始（active_ids は接続中のuniqueIdを返す関数）"""
+        self.running = True
+
+        def loop():
+            next_cleanup = 0.0
+            while self.running:
+                try:
+                    if time.monotonic() >= next_cleanup:
+                        self.cleanup(active_ids())
+                        next_cleanup = time.monotonic() + interval
+                    self.refresh_usage(active_ids(), usage_interval)
+                except Exception as e:
+                    print(f"プロファイル掃除エラー: {e}")
+                time.sleep(min(interval, usage_interval))
+
+        threading.Thread(target=loop, daemon=True).start()
+
+    def stop(self):
+        self.running = False
@@ -0,0 +1,245 @@
+# replay.py - traffic_capture で記録したリクエストを再生し、レイテンシとエラーを集計
+import os
+import sys
+import json
+import math
+import time
+import socket
+import shutil
+import tempfile
+import argparse
+import threading
+import subprocess
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from http_client import get_session
+
+def load_capture(path):
+    """記録ファイルの読み込み（相対時刻順）"""
+    entries = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                entries.append(json.loads(line))
+    entries.sort(key=lambda entry: entry["t"])
+    return entries
+
+def percentile(sorted_values, p):
+    """最近傍順位法のパーセンタイル"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, math.ceil(p / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def summarize(results, elapsed):
+    """エンドポイントごとのレイテンシ分布とエラー件数"""
+    by_path = {}
+    for result in results:
+        by_path.setdefault(result["path"], []).append(result)
+
+    summary = {"requests": len(results), "elapsed": elapsed, "paths": {}}
+    for path, items in sorted(by_path.items()):
+        latencies = sorted(item["latency"] for item in items)
+        summary["paths"][path] = {
+            "count": len(items),
+            "errors": sum(1 for item in items if item["error"] or item["status"] >= 400),
+            # 記録時と同じステータスが返った件数（再現性の確認）
+            "matched": sum(1 for item in items if item["status"] == item.get("expected_status")),
+            "status": dict(Counter(str(item["status"]) for item in items)),
+            "p50": percentile(latencies, 50),
+            "p90": percentile(latencies, 90),
+            "p99": percentile(latencies, 99),
+            "max": latencies[-1]
+        }
+    return summary
+
+def send(target, entry, timeout):
+    """1件送信して結果を返す"""
+    started = time.monotonic()
+    status, error = 0, None
+    try:
+        response = get_session().request(
+            entry.get("method", "POST"),
+            f"{target}{entry['path']}",
+            json=entry.get("body"),
+            timeout=timeout
+        )
+        # 一括エンドポイントのストリームも最後まで読んでから計測する
+        response.content
+        status = response.status_code
+    except requests.RequestException as e:
+        error = str(e)
+    return {
+        "path": entry["path"],
+        "status": status,
+        "error": error,
+        "latency": time.monotonic() - started
+    }
+
+def entry_ids(entry):
+    """リクエストが対象とするuniqueId（一括エンドポイントは全件）"""
+    body = entry.get("body")
+    if not isinstance(body, dict):
+        return []
+    if isinstance(body.get("uniqueIds"), list):
+        return [unique_id for unique_id in body["uniqueIds"] if isinstance(unique_id, str)]
+    return [body["uniqueId"]] if isinstance(body.get("uniqueId"), str) else []
+
+class _Pending:
+    """再生待ちのリクエスト（同じuniqueIdの先行リクエストが終わるまで送らない）"""
+
+    __slots__ = ("entry", "remaining", "followers", "done")
+
+    def __init__(self, entry):
+        self.entry = entry
+        self.remaining = 0
+        self.followers = []
+        self.done = False
+
+def replay(entries, target, speed=1.0, concurrency=32, timeout=300.0):
+    """記録時の間隔を speed 倍速で再現して送信（speed=None なら待たずに送信）
+
+    同じuniqueIdへのリクエストは記録順に送る（接続完了前に送信や切断が届くことはない）。
+    """
+    results = []
+    latest = {}
+    outstanding = [0]
+    condition = threading.Condition()
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    def run(pending):
+        result = send(target, pending.entry, timeout)
+        result["expected_status"] = pending.entry.get("status")
+        with condition:
+            results.append(result)
+            pending.done = True
+            # 先行リクエストがすべて終わった後続リクエストを送る
+            for follower in pending.followers:
+                follower.remaining -= 1
+                if follower.remaining == 0:
+                    executor.submit(run, follower)
+            outstanding[0] -= 1
+            condition.notify_all()
+
+    def dispatch(entry):
+        pending = _Pending(entry)
+        with condition:
+            outstanding[0] += 1
+            for unique_id in set(entry_ids(entry)):
+                previous = latest.get(unique_id)
+                if previous is not None and not previous.done:
+                    previous.followers.append(pending)
+                    pending.remaining += 1
+                latest[unique_id] = pending
+            if pending.remaining:
+                return
+        executor.submit(run, pending)
+
+    started = time.monotonic()
+    try:
+        for entry in entries:
+            if speed:
+                delay = started + entry["t"] / speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            dispatch(entry)
+        with condition:
+            condition.wait_for(lambda: outstanding[0] == 0)
+    finally:
+        executor.shutdown(wait=True)
+    return summarize(results, time.monotonic() - started)
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_fake_server(workdir, ready_timeout=60.0):
+    """代替WebDriverで api_server を起動（Chromeもログイン待ちも不要）
+
+    セッション・プール状態・プロファイルは workdir に作るため、前回の再生の状態は引き継がない。
+    """
+    port = _free_port()
+    env = dict(os.environ)
+    env.update({
+        "PORT": str(port),
+        "DRIVER_BACKEND": "fake",
+        "DRIVER_CLOCK": env.get("DRIVER_CLOCK", "zero"),
+        "TIKTOK_USERNAME": env.get("TIKTOK_USERNAME", "replay"),
+        "TIKTOK_PASSWORD": env.get("TIKTOK_PASSWORD", "replay"),
+        "COOKIE_CACHE_PATH": "",
+        "EVENT_LOG_CONSOLE": "false"
+    })
+    for name in ("TRAFFIC_CAPTURE_PATH", "CLUSTER_NODES", "POOL_STATE_PATH", "SESSION_STORE_URL", "PROFILE_ROOT"):
+        env.pop(name, None)
+
+    server_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "api_server.py")
+    process = subprocess.Popen(
+        [sys.executable, server_script], env=env, cwd=workdir,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    target = f"http://127.0.0.1:{port}"
+
+    deadline = time.monotonic() + ready_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("api_server が起動直後に終了しました")
+        try:
+            if get_session().get(f"{target}/health/ready", timeout=1).status_code == 200:
+                return process, target
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+
+    process.terminate()
+    raise RuntimeError("api_server の起動待ちがタイムアウトしました")
+
+def parse_speed(value):
+    """1x / 10x / max"""
+    if value == 'max':
+        return None
+    return float(value.rstrip('x'))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="記録したAPIリクエストの再生")
+    parser.add_argument("capture", help="TRAFFIC_CAPTURE_PATH で記録したJSONL")
+    parser.add_argument("--target", help="再生先のURL（省略時は代替WebDriverの api_server を起動）")
+    parser.add_argument("--speed", default="1x", help="再生速度（1x / 10x / max）")
+    parser.add_argument("--concurrency", type=int, default=32, help="同時リクエスト数の上限")
+    parser.add_argument("--timeout", type=float, default=300.0, help="1リクエストのタイムアウト（秒）")
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力")
+    args = parser.parse_args(argv)
+
+    entries = load_capture(args.capture)
+    process = None
+    workdir = None
+    target = args.target
+    if not target:
+        workdir = tempfile.mkdtemp(prefix="tiktok-replay-")
+        process, target = start_fake_server(workdir)
+
+    try:
+        summary = replay(entries, target.rstrip('/'), parse_speed(args.speed), args.concurrency, args.timeout)
+    finally:
+        if process:
+            process.terminate()
+            process.wait(10)
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+        return
+
+    print(f"再生完了: {summary['requests']}件 / {summary['elapsed']:.2f}秒 (速度 {args.speed})")
+    for path, stats in summary["paths"].items():
+        print(
+            f"{path}: {stats['count']}件 エラー {stats['errors']}件 記録と一致 {stats['matched']}件 "
+            f"p50 {stats['p50'] * 1000:.1f}ms p90 {stats['p90'] * 1000:.1f}ms "
+            f"p99 {stats['p99'] * 1000:.1f}ms max {stats['max'] * 1000:.1f}ms status {stats['status']}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+# session_store.py - セッション保存先の抽象化（ファイル / SQLite / Redis）
+import os
+import json
+import time
+import fcntl
+import socket
+import sqlite3
+import tempfile
+import threading
+from urllib.parse import quote, urlparse
+
+# セッションファイルのプロセス内キャッシュ（パス -> (mtime_ns, size, データ)）
+_session_cache = {}
+_session_cache_lock = threading.Lock()
+
+def write_session_file(session_file, session_data):
+    """セッションファイルのアトミック書き込み（一時ファイル経由でリネーム）"""
+    directory = os.path.dirname(os.path.abspath(session_file))
+    os.makedirs(directory, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".session-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(session_data, f, ensure_ascii=False, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, session_file)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    # 書き込んだ内容でキャッシュを更新し、次回の読み込みでディスクを読まない
+    stat = os.stat(session_file)
+    with _session_cache_lock:
+        _session_cache[os.path.abspath(session_file)] = (stat.st_mtime_ns, stat.st_size, session_data)
+
+def read_session_file(session_file):
+    """セッションファイルの読み込み（mtime/サイズが変わっていなければキャッシュを返す）"""
+    key = os.path.abspath(session_file)
+    stat = os.stat(key)
+
+    with _session_cache_lock:
+        cached = _session_cache.get(key)
+    if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        return cached[2]
+
+    with open(key, 'r', encoding='utf-8') as f:
+        session_data = json.load(f)
+
+    with _session_cache_lock:
+        _session_cache[key] = (stat.st_mtime_ns, stat.st_size, session_data)
+    return session_data
+
+class SessionStore:
+    """セッション保存先の共通インターフェース
+
+    各レコードは単調増加する version を持つ。save() は base_version を受け取り、
+    保存済みの version がそれより新しければ書き込まずに None を返す
+    （他のレプリカがより新しいCookieを保存済み）。base_version が None の場合は
+    新規ログインとみなし、常に保存済み version + 1 で書き込む。
+    """
+
+    def load(self, key):
+        """セッションデータを取得（存在しなければNone）"""
+        raise NotImplementedError
+
+    def save(self, key, session_data, base_version=None):
+        """セッションデータを保存し、新しいversionを返す（競合時はNone）"""
+        raise NotImplementedError
+
+    def exists(self, key):
+        """セッションの有無"""
+        return self.load(key) is not None
+
+    def _next_record(self, current, session_data, base_version):
+        """競合判定と保存レコードの生成（競合時はNone）"""
+        current_version = current.get('version', 0) if current else 0
+        if base_version is not None and current_version > base_version:
+            return None
+
+        record = dict(session_data)
+        record['version'] = current_version + 1
+        record['saved_at'] = time.time()
+        return record
+
+class FileSessionStore(SessionStore):
+    """ローカルファイルへの保存（従来の ./sessions/*_session.json 形式）"""
+
+    def __init__(self, directory="./sessions"):
+        self.directory = directory
+
+    def path_for(self, key):
+        """キーからファイルパスを決定（キーはクライアント由来のため、区切り文字等はエスケープ）"""
+        return os.path.join(self.directory, f"{quote(key, safe='@-_.')}_session.json")
+
+    def load(self, key):
+        path = self.path_for(key)
+        if not os.path.exists(path):
+            return None
+        return read_session_file(path)
+
+    def save(self, key, session_data, base_version=None):
+        path = self.path_for(key)
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        # 同一ホスト上の複数プロセスからの書き込みはロックファイルで直列化
+        with open(f"{path}.lock", 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                current = read_session_file(path) if os.path.exists(path) else None
+                record = self._next_record(current, session_data, base_version)
+                if record is None:
+                    return None
+                write_session_file(path, record)
+                return record['version']
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+class SQLiteSessionStore(SessionStore):
+    """SQLiteへの保存（同一ホスト/共有ボリューム上のレプリカ向け）"""
+
+    def __init__(self, db_path="sessions.db"):
+        self.db_path = db_path
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    key TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL,
+                    data TEXT NOT NULL,
+                    updated_at REAL
+                )
+            """)
+
+    def load(self, key):
+        with sqlite3.connect(self.db_path) as conn:
+            row = conn.execute("SELECT data FROM sessions WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, key, session_data, base_version=None):
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        try:
+            # 読み取りから書き込みまでを書き込みロック下で行う
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT data FROM sessions WHERE key = ?", (key,)).fetchone()
+            record = self._next_record(json.loads(row[0]) if row else None, session_data, base_version)
+            if record is None:
+                conn.execute("ROLLBACK")
+                return None
+
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (key, version, data, updated_at) VALUES (?, ?, ?, ?)",
+                (key, record['version'], json.dumps(record, ensure_ascii=False, separators=(',', ':')), record['saved_at'])
+            )
+            conn.execute("COMMIT")
+            return record['version']
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+class RedisConnection:
+    """最小限のRESPクライアント（Redis互換サーバー向け）"""
+
+    def __init__(self, host="localhost", port=6379, db=0, password=None, timeout=5.0):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self.sock = None
+        self.reader = None
+
+    def connect(self):
+        self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self.reader = self.sock.makefile('rb')
+        if self.password:
+            self.execute('AUTH', self.password)
+        if self.db:
+            self.execute('SELECT', self.db)
+
+    def close(self):
+        if self.sock:
+            try:
+                self.sock.close()
+            finally:
+                self.sock = None
+                self.reader = None
+
+    def execute(self, *args):
+        """コマンド送信と応答の読み取り"""
+        if self.sock is None:
+            self.connect()
+
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode('utf-8')
+            parts.append(f"${len(data)}\r\n".encode() + data + b"\r\n")
+
+        try:
+            self.sock.sendall(b"".join(parts))
+            return self._read_reply()
+        except (OSError, ConnectionError):
+            self.close()
+            raise
+
+    def _read_reply(self):
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError("Redis接続が切断されました")
+
+        prefix, payload = line[:1], line[1:-2]
+        if prefix == b'+':
+            return payload.decode()
+        if prefix == b'-':
+            raise RuntimeError(payload.decode())
+        if prefix == b':':
+            return int(payload)
+        if prefix == b'$':
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self.reader.read(length + 2)
+            return data[:-2]
+        if prefix == b'*':
+            count = int(payload)
+            if count < 0:
+                return None
+            return [self._read_reply() for _ in range(count)]
+        raise RuntimeError(f"不明なRESP応答: {line!r}")
+
+# 他レプリカの書き込みで EXEC が中断された（再試行する）
+_EXEC_ABORTED = object()
+
+class RedisSessionStore(SessionStore):
+    """Redisプロトコルでの保存（複数ホストのレプリカでCookieを共有）"""
+
+    def __init__(self, host="localhost", port=6379, db=0, password=None,
+                 prefix="tiktok:session:", connection=None, max_retries=5):
+        self.prefix = prefix
+        self.max_retries = max_retries
+        self.connection = connection or RedisConnection(host, port, db, password)
+        self.lock = threading.Lock()
+
+    def load(self, key):
+        with self.lock:
+            raw = self.connection.execute('GET', self.prefix + key)
+        return json.loads(raw) if raw else None
+
+    def save(self, key, session_data, base_version=None):
+        redis_key = self.prefix + key
+
+        with self.lock:
+            # WATCH/MULTI/EXECによる楽観的ロック（他レプリカと競合したら再試行）
+            error = None
+            for _ in range(self.max_retries):
+                try:
+                    version = self._save_once(redis_key, session_data, base_version)
+                except OSError as e:
+                    # 切断した接続は閉じられ、WATCH/MULTIの状態ごと破棄される（次の試行で接続し直す）
+                    error = e
+                    continue
+                if version is not _EXEC_ABORTED:
+                    return version
+                error = None
+
+        # 通信エラーのまま再試行が尽きた場合は、競合（None）と区別できるよう送出する
+        if error is not None:
+            raise error
+        return None
+
+    def _save_once(self, redis_key, session_data, base_version):
+        """WATCHからEXECまでの1回分（他レプリカの書き込みでEXECが中断されたら _EXEC_ABORTED）"""
+        connection = self.connection
+        connection.execute('WATCH', redis_key)
+        in_multi = False
+        try:
+            raw = connection.execute('GET', redis_key)
+            record = self._next_record(json.loads(raw) if raw else None, session_data, base_version)
+            if record is None:
+                connection.execute('UNWATCH')
+                return None
+
+            connection.execute('MULTI')
+            in_multi = True
+            connection.execute('SET', redis_key, json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+            in_multi = False
+            result = connection.execute('EXEC')
+        except OSError:
+            raise
+        except Exception:
+            # エラー応答の後も接続は使えるため、MULTI/WATCHの状態を次の呼び出しに持ち越さない
+            self._abort(in_multi)
+            raise
+        return _EXEC_ABORTED if result is None else record['version']
+
+    def _abort(self, in_multi):
+        """失敗した保存の後始末（MULTI中ならDISCARD、それ以外はUNWATCH。できなければ接続を捨てる）"""
+        try:
+            self.connection.execute('DISCARD' if in_multi else 'UNWATCH')
+        except Exception:
+            self.connection.close()
+
+def create_session_store(url=None):
+    """URLからセッションストアを生成（SESSION_STORE_URL）
+
+    例: file://./sessions, sqlite:///sessions.db（相対パス）, sqlite:////data/sessions.db, redis://:password@redis:6379/0
+    """
+    url = url if url is not None else os.getenv('SESSION_STORE_URL', '')
+    if not url:
+        return FileSessionStore()
+
+    parsed = urlparse(url)
+    if parsed.scheme == 'file':
+        return FileSessionStore(parsed.netloc + parsed.path or "./sessions")
+    if parsed.scheme == 'sqlite':
+        return SQLiteSessionStore(parsed.path[1:] or "sessions.db")
+    if parsed.scheme == 'redis':
+        return RedisSessionStore(
+            host=parsed.hostname or "localhost",
+            port=parsed.port or 6379,
+            db=int(parsed.path.lstrip('/') or 0),
+            password=parsed.password
+        )
+    raise ValueError(f"未対応のセッションストア: {url}")
@@ -0,0 +1,87 @@
+# settings.py - 接続プールの実行時設定（起動時は環境変数から読み込み、管理APIで変更可能）
+import os
+import math
+import threading
+
+class SettingsError(ValueError):
+    """設定値が不正"""
+
+# 項目名 -> (型, 環境変数, 既定値, 最小値, 最大値)
+# max_connections / idle_timeout / send_rate は 0 で無制限・無効
+SETTING_FIELDS = {
+    # プールの最大接続数（縮小時は最終利用が古い接続から順に切断）
+    "max_connections": (int, 'MAX_CONNECTIONS', '0', 0, None),
+    # Chrome起動・ログインを同時に行う接続数
+    "connect_concurrency": (int, 'CONNECT_CONCURRENCY', '4', 1, 64),
+    # 最終利用からこの秒数を過ぎた接続を切断
+    "idle_timeout": (float, 'IDLE_TIMEOUT', os.getenv('SESSION_TIMEOUT', '0'), 0, None),
+    # 送信後のCookie再取得を省略する期間（秒、0なら毎回取得）
+    "cookie_cache_ttl": (float, 'COOKIE_CACHE_TTL', '0', 0, 86400),
+    # 1接続あたりの送信レート上限（件/秒）
+    "send_rate": (float, 'SEND_RATE', '0', 0, 100),
+}
+
+def _convert(name, value):
+    kind, _, _, minimum, maximum = SETTING_FIELDS[name]
+    if isinstance(value, bool):
+        raise SettingsError(f"{name}: 数値を指定してください")
+    try:
+        converted = kind(value)
+    except (TypeError, ValueError, OverflowError):
+        raise SettingsError(f"{name}: 数値を指定してください")
+    if not math.isfinite(converted):
+        raise SettingsError(f"{name}: 有限の数値を指定してください")
+    if kind is int and isinstance(value, float) and not value.is_integer():
+        raise SettingsError(f"{name}: 整数を指定してください")
+    if converted < minimum or (maximum is not None and converted > maximum):
+        upper = f"{maximum}以下" if maximum is not None else ""
+        raise SettingsError(f"{name}: {minimum}以上{upper}の値を指定してください")
+    return converted
+
+class PoolSettings:
+    """検証済みの設定値（属性として読み、update でまとめて変更）
+
+    update は全項目を検証してから反映するため、一部だけが変わることはない。
+    変更後は登録済みのコールバックに変更された項目名の一覧を渡す。
+    """
+
+    def __init__(self, **values):
+        self.lock = threading.Lock()
+        self.listeners = []
+        for name in SETTING_FIELDS:
+            setattr(self, name, _convert(name, values[name]))
+
+    @classmethod
+    def from_env(cls):
+        """環境変数から生成（不正な値は起動時に SettingsError）"""
+        return cls(**{
+            name: os.getenv(env_name, default)
+            for name, (_, env_name, default, _, _) in SETTING_FIELDS.items()
+        })
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in SETTING_FIELDS}
+
+    def on_change(self, callback):
+        self.listeners.append(callback)
+
+    def update(self, changes):
+        """設定を変更して変更後の全設定を返す（不正な値があれば何も変更しない）"""
+        if not isinstance(changes, dict) or not changes:
+            raise SettingsError("変更する設定をJSONオブジェクトで指定してください")
+        unknown = sorted(set(changes) - set(SETTING_FIELDS))
+        if unknown:
+            raise SettingsError(f"未知の設定: {', '.join(unknown)}")
+        converted = {name: _convert(name, value) for name, value in changes.items()}
+
+        with self.lock:
+            changed = [name for name, value in converted.items() if getattr(self, name) != value]
+            for name in changed:
+                setattr(self, name, converted[name])
+            current = self.as_dict()
+
+        if changed:
+            print(f"設定変更: {', '.join(f'{name}={current[name]}' for name in changed)}")
+            for callback in self.listeners:
+                callback(changed)
+        return current
@@ -7,15 +7,43 @@ import {
   sendMessageCompat
 } from "./compat.js";
 
-type CookieCache = { sessionid: string; "tt-target-idc"?: string };
+type CookieCache = { sessionid: string; "tt-target-idc"?: string; version?: number };
 
 export class ConnectionManager {
   private pool = new Map<string, any>();
   private cookies?: CookieCache;
+  private cookiesMtimeMs = 0;
+  private cookieWatcher?: NodeJS.Timeout;
 
   async loadCookies(path = process.env.COOKIE_CACHE_PATH ?? "./cookies.json") {
+    const stat = await fs.stat(path);
     const raw = await fs.readFile(path, "utf-8");
     this.cookies = JSON.parse(raw);
+    this.cookiesMtimeMs = stat.mtimeMs;
+  }
+
+  /** cookies.json の更新を監視（mtime が変わった時だけ読み直し、version が古ければ無視）
+   *  Python 側の接続プールがアトミックに書き換えるため、読み込み途中の内容は見えない
+   */
+  watchCookies(
+    path = process.env.COOKIE_CACHE_PATH ?? "./cookies.json",
+    intervalMs = Number(process.env.COOKIE_POLL_INTERVAL_MS ?? 2000)
+  ) {
+    if (this.cookieWatcher) return;
+    this.cookieWatcher = setInterval(async () => {
+      try {
+        const stat = await fs.stat(path);
+        if (stat.mtimeMs === this.cookiesMtimeMs) return;
+        const next = JSON.parse(await fs.readFile(path, "utf-8")) as CookieCache;
+        this.cookiesMtimeMs = stat.mtimeMs;
+        if (!next.sessionid) return;
+        if (next.version !== undefined && this.cookies?.version !== undefined && next.version <= this.cookies.version) return;
+        this.cookies = next;
+      } catch {
+        // 一時的な読み込み失敗は次回のポーリングで再試行
+      }
+    }, intervalMs);
+    this.cookieWatcher.unref?.();
   }
 
   private ensureCookiesLoaded() {
@@ -58,6 +86,10 @@ export class ConnectionManager {
   }
 
   async shutdownAll(): Promise<void> {
+    if (this.cookieWatcher) {
+      clearInterval(this.cookieWatcher);
+      this.cookieWatcher = undefined;
+    }
     for (const [id, conn] of this.pool.entries()) {
       try { await conn.disconnect?.(); } catch {}
       this.pool.delete(id);
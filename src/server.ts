@@ -51,6 +51,8 @@ async function loadCookies(): Promise<CookieCache> {
     process.exit(1);
   }
   await manager.loadCookies(COOKIE_PATH);
+  // Python 側の接続プールが更新した cookies.json を再起動なしで反映
+  manager.watchCookies(COOKIE_PATH);
 })().catch((err) => {
   log.error({ err }, "Fatal at startup");
   process.exit(1);
@@ -0,0 +1,93 @@
+# teardown.py - ドライバーの終了処理（driver.quit()）をバックグラウンドの限られたスレッドで実行
+import os
+import time
+import queue
+import threading
+from metrics import REGISTRY
+
+# 切断時の終了処理を並列に行うスレッド数
+TEARDOWN_CONCURRENCY = int(os.getenv('TEARDOWN_CONCURRENCY', '4'))
+
+# シャットダウン時に全ドライバーの終了を待つ上限（秒、超えたらプロセスツリーを強制終了）
+SHUTDOWN_TIMEOUT = float(os.getenv('SHUTDOWN_TIMEOUT', '20'))
+
+TEARDOWN_SECONDS = REGISTRY.histogram(
+    "tiktok_driver_teardown_seconds", "Time spent closing a driver", ("reason", "outcome")
+)
+TEARDOWN_PENDING = REGISTRY.gauge(
+    "tiktok_driver_teardown_pending", "Drivers waiting for or in the middle of teardown"
+)
+SHUTDOWN_KILLED = REGISTRY.counter(
+    "tiktok_shutdown_killed_processes_total", "Browser processes killed after the shutdown deadline"
+)
+
+class DriverTeardown:
+    """ドライバーの終了処理キュー
+
+    切断要求はエントリを外した時点で応答し、Chromeの終了は常駐スレッドで行う。
+    スレッドはデーモンのため、終了処理が固まってもプロセスの終了を妨げない。
+    """
+
+    def __init__(self, concurrency=TEARDOWN_CONCURRENCY):
+        self.queue = queue.Queue()
+        self.condition = threading.Condition()
+        # uniqueId -> 終了待ちの件数（同じuniqueIdの再接続は終了を待ってから行う）
+        self.pending = {}
+        for i in range(concurrency):
+            threading.Thread(target=self._work_loop, name=f"driver-teardown-{i}", daemon=True).start()
+
+    def close(self, unique_id, driver, reason="disconnect", on_closed=None):
+        """ドライバーの終了を依頼（待たずに戻る）"""
+        with self.condition:
+            self.pending[unique_id] = self.pending.get(unique_id, 0) + 1
+            TEARDOWN_PENDING.set(sum(self.pending.values()))
+        self.queue.put((unique_id, driver, reason, on_closed))
+
+    def _work_loop(self):
+        while True:
+            self._close_now(*self.queue.get())
+
+    def _close_now(self, unique_id, driver, reason, on_closed):
+        started = time.monotonic()
+        outcome = "ok"
+        try:
+            driver.close()
+        except Exception as e:
+            outcome = "error"
+            print(f"ドライバー終了エラー ({unique_id}): {e}")
+        TEARDOWN_SECONDS.labels(reason=reason, outcome=outcome).observe(time.monotonic() - started)
+
+        if on_closed is not None:
+            try:
+                on_closed()
+            except Exception as e:
+                print(f"ドライバー終了後の処理エラー ({unique_id}): {e}")
+
+        with self.condition:
+            self.pending[unique_id] -= 1
+            if not self.pending[unique_id]:
+                del self.pending[unique_id]
+            TEARDOWN_PENDING.set(sum(self.pending.values()))
+            self.condition.notify_all()
+
+    def wait(self, unique_id, timeout=None):
+        """uniqueIdの終了処理が済むまで待つ（期限内に済めばTrue）"""
+        with self.condition:
+            return self.condition.wait_for(lambda: unique_id not in self.pending, timeout)
+
+    def close_all(self, drivers, timeout=SHUTDOWN_TIMEOUT):
+        """全ドライバーを並列に終了（期限までに終わらなかったuniqueId一覧を返す）"""
+        for unique_id, driver in drivers.items():
+            with self.condition:
+                self.pending[unique_id] = self.pending.get(unique_id, 0) + 1
+                TEARDOWN_PENDING.set(sum(self.pending.values()))
+            # シャットダウン時は並列数を制限せず、1台ずつ専用スレッドで終了させる
+            threading.Thread(
+                target=self._close_now, args=(unique_id, driver, "shutdown", None),
+                name=f"driver-teardown-{unique_id}", daemon=True
+            ).start()
+
+        expires_at = time.monotonic() + timeout
+        with self.condition:
+            self.condition.wait_for(lambda: not self.pending, max(0.0, expires_at - time.monotonic()))
+            return list(self.pending)
@@ -0,0 +1,31 @@
+# conftest.py - テスト共通設定（Chromeを起動しない代替WebDriver・待機なしの時計・一時ディレクトリ）
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# api_server 等はインポート時に環境変数を読むため、最初に設定する
+WORKDIR = tempfile.mkdtemp(prefix="tiktok-tests-")
+for name, value in {
+    "DRIVER_BACKEND": "fake",
+    "DRIVER_CLOCK": "zero",
+    "DRIVER_WORKERS": "0",
+    "TIKTOK_USERNAME": "test",
+    "TIKTOK_PASSWORD": "test",
+    "COOKIE_CACHE_PATH": "",
+    "EVENT_LOG_CONSOLE": "false",
+    "EVENT_LOG_PATH": os.path.join(WORKDIR, "events.log"),
+    "POOL_STATE_PATH": os.path.join(WORKDIR, "pool_state.json"),
+    "PROFILE_ROOT": os.path.join(WORKDIR, "profiles"),
+    "SESSION_STORE_URL": f"file://{os.path.join(WORKDIR, 'sessions')}",
+    "MONITOR_DB_PATH": os.path.join(WORKDIR, "bot_detection.db"),
+}.items():
+    os.environ[name] = value
+for name in ("TRAFFIC_CAPTURE_PATH", "CLUSTER_NODES", "METRICS_MMAP_PATH", "API_CLIENTS", "ADMIN_TOKEN"):
+    os.environ.pop(name, None)
+
+# サーバー起動時と同じく接続プール等を生成（インポートだけでは生成されない）
+import api_server
+api_server.initialize_services()
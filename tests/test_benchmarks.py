@@ -0,0 +1,192 @@
+# test_benchmarks.py - 性能の計測（代替WebDriver・待機なしの時計で実行し、結果を表示して大きな退行だけを検出）
+import os
+import sys
+import time
+import json
+import socket
+import signal
+import threading
+import subprocess
+import urllib.request
+import api_server
+from deadline import Deadline
+from enhanced_tiktok_driver import EnhancedTikTokDriver
+from session_store import FileSessionStore
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# ブラウザを起動する計測の対象（既定はテスト用の代替WebDriver、chrome を指定すると実際のChromeを計測）
+BENCH_DRIVER_BACKEND = os.getenv('BENCH_DRIVER_BACKEND', os.environ['DRIVER_BACKEND'])
+BENCH_DRIVERS = int(os.getenv('BENCH_DRIVERS', '3'))
+
+def report(name, **values):
+    """計測結果の表示（pytest -s で確認できる）"""
+    print(f"\n[bench] {name}: " + ", ".join(f"{key}={value}" for key, value in values.items()))
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def get_json(url, timeout=1.0):
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, None
+    except OSError:
+        return None, None
+
+def wait_for(url, expected_status, started, limit=30.0):
+    """url が expected_status を返すまでの経過秒数"""
+    while time.monotonic() - started < limit:
+        status, _ = get_json(url, timeout=0.5)
+        if status == expected_status:
+            return time.monotonic() - started
+        time.sleep(0.01)
+    raise AssertionError(f"{url} が {limit} 秒以内に {expected_status} を返しませんでした")
+
+def test_bench_startup_time(tmp_path):
+    port = free_port()
+    env = dict(os.environ, PORT=str(port), POOL_STATE_PATH=str(tmp_path / "pool_state.json"))
+    base = f"http://127.0.0.1:{port}"
+
+    started = time.monotonic()
+    # カレントディレクトリに ./sessions 等を作るため、一時ディレクトリで起動する
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "api_server.py")], cwd=str(tmp_path), env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        live = wait_for(f"{base}/health/live", 200, started)
+        ready = wait_for(f"{base}/health/ready", 200, started)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(30)
+
+    # 起動経路で Selenium と監視スタックを読み込まないこと
+    probe = subprocess.run(
+        [sys.executable, "-c", "import sys, api_server; print(sorted(sys.modules))"],
+        cwd=str(tmp_path), env=dict(env, PYTHONPATH=ROOT), capture_output=True, text=True, check=True
+    )
+    loaded = probe.stdout.strip().splitlines()[-1]
+    report("startup", live=f"{live:.3f}s", ready=f"{ready:.3f}s")
+    assert "'selenium'" not in loaded
+    assert "'advanced_monitoring'" not in loaded
+    assert live < 10.0
+
+def session_data():
+    """実際のTikTokセッションに近い大きさのセッション（Cookie 60件程度）"""
+    cookies = [
+        {"name": f"cookie_{i}", "value": "v" * 120, "domain": ".tiktok.com", "path": "/",
+         "secure": True, "httpOnly": bool(i % 2), "sameSite": "None", "expiry": 1900000000 + i}
+        for i in range(60)
+    ]
+    return {"cookies": cookies, "current_url": "https://www.tiktok.com/", "user_agent": "Mozilla/5.0 " * 10}
+
+def per_call(func, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) / repeat
+
+def test_bench_session_load_before_and_after_cache(tmp_path):
+    data = session_data()
+    repeat = 2000
+
+    # 変更前: indent=2 で保存し、接続のたびにファイルを読み直してパース
+    legacy_path = tmp_path / "legacy_session.json"
+    with open(legacy_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+    def legacy_load():
+        with open(legacy_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    # 変更後: コンパクトな形式でアトミックに保存し、mtime/サイズが同じならキャッシュを返す
+    store = FileSessionStore(str(tmp_path / "sessions"))
+    store.save("bench", data)
+    assert store.load("bench")["cookies"] == legacy_load()["cookies"]
+
+    before = per_call(legacy_load, repeat)
+    after = per_call(lambda: store.load("bench"), repeat)
+    report("session_load", before=f"{before * 1e6:.1f}us", after=f"{after * 1e6:.1f}us",
+           speedup=f"{before / after:.1f}x",
+           file_bytes=f"{os.path.getsize(legacy_path)} -> {os.path.getsize(store.path_for('bench'))}")
+    assert after < before
+    assert os.path.getsize(store.path_for("bench")) < os.path.getsize(legacy_path)
+
+def test_bench_lean_vs_default_launch_and_rss(tmp_path):
+    results = {}
+    for profile in ("default", "lean"):
+        drivers = []
+        try:
+            for i in range(BENCH_DRIVERS):
+                drivers.append(EnhancedTikTokDriver(
+                    headless=True, user_data_dir=str(tmp_path / f"{profile}-{i}"),
+                    backend=BENCH_DRIVER_BACKEND, profile=profile
+                ))
+            usages = [driver.resource_usage() for driver in drivers]
+        finally:
+            for driver in drivers:
+                driver.close()
+        assert [usage["profile"] for usage in usages] == [profile] * BENCH_DRIVERS
+        results[profile] = {
+            "launch": sum(usage["launch_seconds"] for usage in usages) / BENCH_DRIVERS,
+            "rss": sum(usage["rss_bytes"] for usage in usages) // BENCH_DRIVERS,
+        }
+
+    report("driver_resources", backend=BENCH_DRIVER_BACKEND, drivers=BENCH_DRIVERS, **{
+        f"{profile}_{key}": f"{value:.3f}s" if key == "launch" else f"{value / 2**20:.1f}MiB"
+        for profile, values in results.items() for key, value in values.items()
+    })
+    if BENCH_DRIVER_BACKEND == "chrome":
+        assert results["lean"]["rss"] < results["default"]["rss"]
+
+def status_latencies(client, seconds):
+    latencies = []
+    until = time.monotonic() + seconds
+    while time.monotonic() < until:
+        started = time.perf_counter()
+        assert client.get("/status").status_code == 200
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+
+def test_bench_status_latency_during_connects(tmp_path, monkeypatch):
+    pool = api_server.TikTokConnectionPool(state_path=str(tmp_path / "pool_state.json"))
+    monkeypatch.setattr(api_server, "connection_pool", pool)
+    client = api_server.app.test_client()
+    for i in range(50):
+        assert pool.create_connection(f"idle{i}", Deadline(30))["status"] == "connected"
+
+    idle_p50, idle_p99 = status_latencies(client, 0.5)
+
+    # Chrome起動中の接続と、プールのロックを長く持つ処理が続いている状態
+    open_driver = pool._open_driver
+    def slow_open(unique_id, deadline):
+        time.sleep(0.5)
+        return open_driver(unique_id, deadline)
+    pool._open_driver = slow_open
+    busy = threading.Event()
+    def hold_lock():
+        while not busy.is_set():
+            with pool.lock:
+                time.sleep(0.05)
+    threads = [threading.Thread(target=hold_lock)] + [
+        threading.Thread(target=pool.create_connection, args=(f"new{i}", Deadline(30))) for i in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        busy_p50, busy_p99 = status_latencies(client, 0.5)
+    finally:
+        busy.set()
+        for thread in threads:
+            thread.join()
+        pool.close_all(timeout=5)
+
+    report("status_latency", connections=50,
+           idle=f"p50 {idle_p50 * 1e3:.2f}ms / p99 {idle_p99 * 1e3:.2f}ms",
+           connecting=f"p50 {busy_p50 * 1e3:.2f}ms / p99 {busy_p99 * 1e3:.2f}ms")
+    # ロックを待っていれば p50 でも 50ms 近くかかる
+    assert busy_p50 < 0.025
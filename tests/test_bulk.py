@@ -0,0 +1,89 @@
+# test_bulk.py - 一括接続・切断（並列数の上限・完了順のNDJSON・集計行）
+import json
+import threading
+import pytest
+import api_server
+
+@pytest.fixture
+def pool(tmp_path, monkeypatch):
+    pool = api_server.TikTokConnectionPool(state_path=str(tmp_path / "pool_state.json"))
+    monkeypatch.setattr(api_server, "connection_pool", pool)
+    yield pool
+    pool.close_all(timeout=5)
+
+@pytest.fixture
+def client(pool):
+    return api_server.app.test_client()
+
+def gated_launches(pool, gates=None, failing=()):
+    """Chrome起動を置き換え、同時に起動している数の最大を記録する"""
+    gates = gates or {}
+    idle = threading.Event()
+    stats = {"running": 0, "peak": 0}
+    lock = threading.Lock()
+    open_driver = pool._open_driver
+    def launch(unique_id, deadline):
+        with lock:
+            stats["running"] += 1
+            stats["peak"] = max(stats["peak"], stats["running"])
+        try:
+            # 起動に時間がかかる分だけ並列実行が重なる
+            gates.get(unique_id, idle).wait(10 if unique_id in gates else 0.02)
+            if unique_id in failing:
+                return {"status": "error", "message": "起動失敗"}, None
+            return open_driver(unique_id, deadline)
+        finally:
+            with lock:
+                stats["running"] -= 1
+    pool._open_driver = launch
+    return stats
+
+def lines(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+def test_bulk_connect_limits_parallelism_and_reports_each_id(pool, client):
+    stats = gated_launches(pool, failing=("broken",))
+    unique_ids = [f"user{i}" for i in range(12)] + ["broken", "user0"]
+    response = client.post("/connect/bulk", json={"uniqueIds": unique_ids, "concurrency": 3})
+    assert response.mimetype == "application/x-ndjson"
+
+    results = lines(response)
+    summary = results.pop()
+    # 重複したuniqueIdは1回だけ処理する
+    assert summary == {"summary": {"total": 13, "failed": 1}}
+    assert sorted(result["uniqueId"] for result in results) == sorted(unique_ids[:-1])
+    assert {result["uniqueId"]: result["status"] for result in results}["broken"] == "error"
+    assert 1 < stats["peak"] <= 3
+    assert sorted(pool.drivers) == sorted(unique_ids[:12])
+
+def test_bulk_results_stream_in_completion_order(pool, client):
+    slow = threading.Event()
+    gated_launches(pool, gates={"slow": slow})
+    response = client.post("/connect/bulk", json={"uniqueIds": ["slow", "fast1", "fast2"], "concurrency": 3},
+                           buffered=False)
+    stream = iter(response.response)
+    try:
+        # slow の起動が終わる前に、完了した分から届く
+        first = [json.loads(next(stream))["uniqueId"] for _ in range(2)]
+        assert sorted(first) == ["fast1", "fast2"]
+        assert not slow.is_set()
+        slow.set()
+        last = json.loads(next(stream))
+        assert (last["uniqueId"], last["status"]) == ("slow", "connected")
+        assert json.loads(next(stream)) == {"summary": {"total": 3, "failed": 0}}
+    finally:
+        slow.set()
+        response.close()
+
+def test_bulk_disconnect_and_validation(pool, client):
+    gated_launches(pool)
+    client.post("/connect/bulk", json={"uniqueIds": ["a", "b", "c"]}).get_data()
+    results = lines(client.post("/disconnect/bulk", json={"uniqueIds": ["a", "b", "c"]}))
+    assert results[-1] == {"summary": {"total": 3, "failed": 0}}
+    assert {result["status"] for result in results[:-1]} == {"disconnected"}
+    assert not pool.drivers
+
+    assert client.post("/connect/bulk", json={"uniqueIds": []}).status_code == 400
+    assert client.post("/connect/bulk", json={"uniqueIds": ["a"], "concurrency": "many"}).status_code == 400
+    too_many = [f"user{i}" for i in range(api_server.BULK_MAX_IDS + 1)]
+    assert client.post("/connect/bulk", json={"uniqueIds": too_many}).status_code == 400
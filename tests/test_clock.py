@@ -0,0 +1,63 @@
+# test_clock.py - 待機の時計（実時間の待機の中断・倍率・仮想時間）
+import time
+import threading
+from clock import RealClock, ScaledClock, VirtualClock, WaitSlots, clock_from_env, interrupt_all
+
+def test_interrupt_all_wakes_every_real_clock():
+    clocks = [RealClock(), ScaledClock(1.0)]
+    woke = []
+    threads = [threading.Thread(target=lambda c=clock: (c.sleep(30), woke.append(c))) for clock in clocks]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+
+    started = time.monotonic()
+    interrupt_all()
+    for thread in threads:
+        thread.join(5)
+    assert len(woke) == 2
+    assert time.monotonic() - started < 1.0
+
+    # 中断後の待機も即時に戻る
+    started = time.monotonic()
+    clocks[0].sleep(30)
+    assert time.monotonic() - started < 1.0
+
+def test_scaled_and_virtual_clocks_do_not_wait():
+    started = time.monotonic()
+    clock_from_env("zero").sleep(30)
+    assert time.monotonic() - started < 1.0
+
+    clock = VirtualClock(start=100.0)
+    clock.sleep(2.5)
+    clock.advance(1.0)
+    assert clock.monotonic() == 103.5
+    assert clock.slept == 2.5
+
+def test_waiting_call_gives_its_slot_to_other_calls():
+    slots = WaitSlots(1)
+    clock = RealClock()
+    def wait_in_slot():
+        with slots.hold():
+            clock.sleep(30)
+    waiting = threading.Thread(target=wait_in_slot)
+    waiting.start()
+    while not slots.waiting:
+        time.sleep(0.001)
+
+    # 待機中の呼び出しが枠を持ったままなら、ここで30秒待たされる
+    ran = threading.Event()
+    def work():
+        with slots.hold():
+            ran.set()
+    other = threading.Thread(target=work)
+    other.start()
+    try:
+        assert ran.wait(5)
+    finally:
+        clock.interrupt()
+        waiting.join(5)
+        other.join(5)
+    assert slots.waiting == 0
+    # 待機を終えた呼び出しは枠を取り直してから返し、抜けた後は枠が戻っている
+    assert slots.semaphore.acquire(timeout=1)
@@ -0,0 +1,124 @@
+# test_cluster.py - コンシステントハッシュの分散・メンバー変更時の安定性と担当ノードへの転送
+import requests
+import pytest
+import api_server
+from collections import Counter
+from cluster import HashRing, ClusterMembership
+
+SELF_URL, OTHER_URL = "http://self:3000", "http://other:3000"
+KEYS = [f"user{i}" for i in range(3000)]
+
+def test_keys_spread_evenly_across_nodes():
+    ring = HashRing(["http://a", "http://b", "http://c"])
+    counts = Counter(ring.get_node(key) for key in KEYS)
+    assert set(counts) == {"http://a", "http://b", "http://c"}
+    for count in counts.values():
+        assert 0.25 < count / len(KEYS) < 0.42
+
+def test_adding_and_removing_a_node_only_moves_its_share():
+    ring = HashRing(["http://a", "http://b", "http://c"])
+    before = {key: ring.get_node(key) for key in KEYS}
+
+    ring.add_node("http://d")
+    after = {key: ring.get_node(key) for key in KEYS}
+    moved = [key for key in KEYS if before[key] != after[key]]
+    # 移動するのは新ノードが引き受けた分だけ（約1/4）
+    assert all(after[key] == "http://d" for key in moved)
+    assert 0.15 < len(moved) / len(KEYS) < 0.35
+
+    ring.remove_node("http://d")
+    assert {key: ring.get_node(key) for key in KEYS} == before
+    assert len(ring.keys) == len(ring.ring) == 3 * ring.vnodes
+
+def test_update_members_reports_only_moved_ids():
+    membership = ClusterMembership(SELF_URL, [SELF_URL])
+    moved = membership.update_members([SELF_URL + "/", OTHER_URL], KEYS)
+    assert membership.members == [OTHER_URL, SELF_URL]
+    assert moved == {key: OTHER_URL for key in KEYS if membership.owner(key) == OTHER_URL}
+    assert 0 < len(moved) < len(KEYS)
+
+class FakeResponse:
+    def __init__(self, content, status_code=200):
+        self.content = content
+        self.status_code = status_code
+        self.headers = {"Content-Type": "application/json"}
+
+class FakeSession:
+    """転送先へのPOSTを記録する（error を設定すると送出する）"""
+
+    def __init__(self):
+        self.posts = []
+        self.error = None
+
+    def post(self, url, json=None, headers=None, timeout=None):
+        self.posts.append((url, json, headers, timeout))
+        if self.error:
+            raise self.error
+        return FakeResponse(b'{"status": "sent", "node": "other"}')
+
+@pytest.fixture
+def two_nodes(monkeypatch):
+    membership = ClusterMembership(SELF_URL, [SELF_URL, OTHER_URL])
+    session = FakeSession()
+    monkeypatch.setattr(api_server, "cluster", membership)
+    monkeypatch.setattr(api_server, "get_session", lambda: session)
+    remote = next(key for key in KEYS if membership.owner(key) == OTHER_URL)
+    local = next(key for key in KEYS if membership.is_local(key))
+    return api_server.app.test_client(), membership, session, remote, local
+
+def test_request_for_remote_id_is_forwarded_with_key_and_remaining_time(two_nodes):
+    client, _, session, remote, _ = two_nodes
+    response = client.post(
+        "/send", json={"uniqueId": remote, "message": "hi"},
+        headers={"X-API-Key": "key-abc", "X-Request-Timeout": "20"}
+    )
+    assert response.status_code == 200
+    assert response.get_json() == {"status": "sent", "node": "other"}
+
+    [(url, payload, headers, timeout)] = session.posts
+    assert url == f"{OTHER_URL}/send"
+    assert payload == {"uniqueId": remote, "message": "hi"}
+    assert headers["X-Cluster-Forwarded"] == SELF_URL
+    assert headers["X-API-Key"] == "key-abc"
+    assert 0 < float(headers["X-Request-Timeout"]) <= 20
+    assert timeout <= 25
+
+def test_local_and_already_forwarded_requests_are_handled_here(two_nodes):
+    client, _, session, remote, local = two_nodes
+    assert client.post("/connect", json={"uniqueId": local}).get_json()["status"] == "connected"
+    # 転送済みのリクエストはメンバー構成が食い違っていても再転送しない
+    response = client.post("/connect", json={"uniqueId": remote}, headers={"X-Cluster-Forwarded": OTHER_URL})
+    assert response.get_json()["status"] == "connected"
+    assert session.posts == []
+    for unique_id in (local, remote):
+        api_server.connection_pool.disconnect(unique_id)
+
+def test_membership_change_moves_routing(two_nodes):
+    client, membership, session, remote, _ = two_nodes
+    membership.update_members([SELF_URL])
+    assert client.post("/send", json={"uniqueId": remote, "message": "hi"}).get_json()["status"] == "error"
+    assert session.posts == []
+
+    membership.update_members([SELF_URL, OTHER_URL])
+    client.post("/send", json={"uniqueId": remote, "message": "hi"})
+    assert [post[0] for post in session.posts] == [f"{OTHER_URL}/send"]
+
+def test_redirect_mode_and_forward_failure(two_nodes):
+    client, membership, session, remote, _ = two_nodes
+    session.error = requests.ConnectionError("refused")
+    response = client.post("/disconnect", json={"uniqueId": remote})
+    assert response.status_code == 502
+    assert response.get_json()["node"] == OTHER_URL
+
+    membership.mode = "redirect"
+    response = client.post("/disconnect", json={"uniqueId": remote})
+    assert response.status_code == 307
+    assert response.headers["Location"] == f"{OTHER_URL}/disconnect"
+
+def test_non_object_body_is_rejected(two_nodes):
+    client = two_nodes[0]
+    for body in ([1, 2], "text", 3):
+        response = client.post("/connect", json=body)
+        assert response.status_code == 400
+    response = client.post("/connect", json={"uniqueId": ["not", "a", "string"]})
+    assert response.status_code == 400
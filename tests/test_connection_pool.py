@@ -0,0 +1,115 @@
+# test_connection_pool.py - 接続プールのロックの持ち方と接続・切断・再接続の競合
+import time
+import threading
+import pytest
+import api_server
+from deadline import Deadline
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = api_server.TikTokConnectionPool(state_path=str(tmp_path / "pool_state.json"))
+    yield pool
+    pool.close_all(timeout=5)
+
+def connect(pool, unique_id):
+    result = pool.create_connection(unique_id, Deadline(30))
+    assert result["status"] == "connected", result
+    return pool.drivers[unique_id]
+
+def test_send_gives_up_at_deadline_while_pool_lock_is_held(pool):
+    connect(pool, "a")
+    pool.lock.acquire()
+    threading.Timer(2.0, pool.lock.release).start()
+
+    started = time.monotonic()
+    result = pool.send_message("a", "hello", Deadline(0.3))
+    assert result["status"] == "timeout"
+    assert time.monotonic() - started < 1.0
+
+def test_slow_send_does_not_block_other_connections(pool):
+    slow = connect(pool, "slow")
+    connect(pool, "fast")
+    slow.simulate_human_behavior = lambda deadline=None: time.sleep(1.5)
+
+    sender = threading.Thread(target=pool.send_message, args=("slow", "hello", Deadline(30)))
+    sender.start()
+    time.sleep(0.1)
+    try:
+        started = time.monotonic()
+        assert pool.send_message("fast", "hello", Deadline(30))["status"] == "sent"
+        assert pool.disconnect("fast")["status"] == "disconnected"
+        assert time.monotonic() - started < 1.0
+    finally:
+        sender.join()
+
+def test_sends_on_one_connection_are_serialized(pool):
+    driver = connect(pool, "a")
+    active = []
+    overlap = []
+
+    def behave(deadline=None):
+        active.append(1)
+        overlap.append(len(active))
+        time.sleep(0.2)
+        active.pop()
+    driver.simulate_human_behavior = behave
+
+    threads = [threading.Thread(target=pool.send_message, args=("a", "hello", Deadline(30))) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max(overlap) == 1
+
+def test_reconnect_waits_for_launch_cancelled_by_disconnect(pool):
+    opened = []
+    closed = []
+    release_first = threading.Event()
+    open_driver = pool._open_driver
+
+    def slow_open(unique_id, deadline):
+        # 2回目の起動時点で先行する起動のドライバーは終了済み（同じプロファイルを2つのChromeで使わない）
+        closed_before = list(closed)
+        result, driver = open_driver(unique_id, deadline)
+        close = driver.close
+        driver.close = lambda: (closed.append(driver), close())
+        opened.append((driver, closed_before))
+        if len(opened) == 1:
+            release_first.wait(5)
+        return result, driver
+    pool._open_driver = slow_open
+
+    first = []
+    connecting = threading.Thread(target=lambda: first.append(pool.create_connection("a", Deadline(30))))
+    connecting.start()
+    while not opened:
+        time.sleep(0.01)
+    assert pool.disconnect("a")["status"] == "disconnected"
+
+    second = []
+    reconnecting = threading.Thread(target=lambda: second.append(pool.create_connection("a", Deadline(30))))
+    reconnecting.start()
+    time.sleep(0.1)
+    assert len(opened) == 1
+    release_first.set()
+    connecting.join()
+    reconnecting.join()
+
+    assert first[0]["status"] == "disconnected"
+    assert second[0]["status"] == "connected", second
+    assert len(opened) == 2
+    assert opened[1][1] == [opened[0][0]]
+    assert pool.drivers["a"] is opened[1][0]
+    assert pool.connections.get("a").status == "connected"
+
+def test_admin_resources_reports_usage_per_profile(pool, monkeypatch):
+    connect(pool, "a")
+    connect(pool, "b")
+    monkeypatch.setattr(api_server, "connection_pool", pool)
+    monkeypatch.setattr(api_server, "ADMIN_TOKEN", "secret")
+
+    response = api_server.app.test_client().get("/admin/resources", headers={"X-Admin-Token": "secret"})
+    body = response.get_json()
+    assert sorted(body["connections"]) == ["a", "b"]
+    assert body["connections"]["a"]["launch_seconds"] is not None
+    assert body["profiles"]["default"]["count"] == 2
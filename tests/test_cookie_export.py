@@ -0,0 +1,44 @@
+# test_cookie_export.py - cookies.json の書き出し（Cookieが実際に更新された時だけ書き込む）
+import json
+from cookie_export import CookieExporter
+
+def session(session_id):
+    return {"sessionid": session_id, "tt-target-idc": "useast2a"}
+
+def exporter(tmp_path):
+    # debounce は長くし、書き込みは flush で明示的に行う
+    return CookieExporter(path=str(tmp_path / "cookies.json"), debounce=3600)
+
+def test_alternating_connections_do_not_rewrite_file(tmp_path):
+    cookies = exporter(tmp_path)
+    assert cookies.update(session("a-1"), "a")
+    assert cookies.flush()
+    assert cookies.update(session("b-1"), "b")
+    assert cookies.flush()
+
+    for _ in range(5):
+        assert not cookies.update(session("a-1"), "a")
+        assert not cookies.update(session("b-1"), "b")
+    assert not cookies.flush()
+    assert json.loads((tmp_path / "cookies.json").read_text())["version"] == 2
+
+def test_rotation_on_any_connection_is_exported(tmp_path):
+    cookies = exporter(tmp_path)
+    cookies.update(session("a-1"), "a")
+    cookies.update(session("b-1"), "b")
+    cookies.flush()
+
+    assert cookies.update(session("a-2"), "a")
+    assert cookies.flush()
+    written = json.loads((tmp_path / "cookies.json").read_text())
+    assert (written["sessionid"], written["source"]) == ("a-2", "a")
+
+def test_reconnected_connection_is_compared_again(tmp_path):
+    cookies = exporter(tmp_path)
+    cookies.update(session("a-1"), "a")
+    cookies.flush()
+    cookies.forget("a")
+
+    # 書き出し済みと同じ内容なら再接続でも書き込まない
+    assert not cookies.update(session("a-1"), "a")
+    assert not cookies.flush()
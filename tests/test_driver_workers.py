@@ -0,0 +1,165 @@
+# test_driver_workers.py - ワーカー呼び出しの処理期限とワーカー再起動の条件
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import multiprocessing
+import subprocess
+import urllib.request
+from concurrent.futures import Future
+import pytest
+from deadline import Deadline
+from driver_workers import DriverWorker, DriverWorkerPool, WorkerCallAbandoned, WorkerCallTimeout
+from process_tree import _stat_fields
+
+class StubWorker:
+    index = 0
+    generation = 1
+
+    def __init__(self):
+        self.forgotten = []
+
+    def forget(self, request_id):
+        self.forgotten.append(request_id)
+
+def stub_pool(call_timeout):
+    pool = DriverWorkerPool(num_workers=0, call_timeout=call_timeout)
+    pool.restarts = []
+    pool.restart = lambda worker, generation=None: pool.restarts.append(generation)
+    return pool
+
+def test_request_deadline_abandons_wait_without_restart():
+    pool = stub_pool(call_timeout=5.0)
+    future = Future()
+    finished = []
+
+    with pytest.raises(WorkerCallAbandoned):
+        pool._wait(StubWorker(), 1, future, "create", Deadline(0.05), on_abandoned=lambda: finished.append(True))
+    assert pool.restarts == []
+
+    # ワーカー側の処理が後から完了したら後始末が呼ばれる
+    future.set_result(None)
+    for _ in range(100):
+        if finished:
+            break
+        time.sleep(0.01)
+    assert finished == [True]
+    assert pool.restarts == []
+
+def test_call_timeout_restarts_worker():
+    pool = stub_pool(call_timeout=0.05)
+    worker = StubWorker()
+    with pytest.raises(WorkerCallTimeout):
+        pool._wait(worker, 7, Future(), "send", None)
+    assert pool.restarts == [1]
+    assert worker.forgotten == [7]
+
+def test_abandoned_call_restarts_only_after_call_timeout():
+    pool = stub_pool(call_timeout=0.2)
+    worker = StubWorker()
+    with pytest.raises(WorkerCallAbandoned):
+        pool._wait(worker, 3, Future(), "send", Deadline(0.01))
+    assert pool.restarts == []
+    time.sleep(0.4)
+    assert pool.restarts == [1]
+
+def test_short_client_deadline_keeps_other_connections(tmp_path):
+    pool = DriverWorkerPool(num_workers=1, heartbeat_interval=60)
+    pool.start()
+    try:
+        worker = pool.workers[0]
+        generation = worker.generation
+        driver = pool.create_driver("kept", headless=True, user_data_dir=str(tmp_path / "kept"))
+
+        with pytest.raises(WorkerCallAbandoned):
+            pool.create_driver("late", deadline=Deadline(0.0001), headless=True, user_data_dir=str(tmp_path / "late"))
+
+        # 作成の完了後、期限切れで不要になったドライバーは割り当てごと解放される
+        for _ in range(200):
+            if "late" not in pool.assignments and "late" not in pool.settling:
+                break
+            time.sleep(0.05)
+        assert "late" not in pool.assignments
+        assert worker.generation == generation
+        assert driver.get_session_info() is not None
+    finally:
+        pool.shutdown()
+
+def _spawn_browser_and_hang(pid_conn):
+    browser = subprocess.Popen(["sleep", "60"])
+    pid_conn.send(browser.pid)
+    time.sleep(60)
+
+def process_gone(pid):
+    fields = _stat_fields(pid)
+    return fields is None or fields[0] == 'Z'
+
+def test_stop_kills_browsers_left_by_killed_worker():
+    context = multiprocessing.get_context('spawn')
+    parent_conn, child_conn = context.Pipe()
+    worker = DriverWorker(0)
+    worker.conn = parent_conn
+    # 停止要求に応じないワーカー（driver.quit() が終わらない状態）の代わり
+    worker.process = context.Process(target=_spawn_browser_and_hang, args=(child_conn,), daemon=True)
+    worker.process.start()
+    browser_pid = parent_conn.recv()
+
+    worker.stop(timeout=0.5)
+
+    for _ in range(50):
+        if process_gone(browser_pid):
+            break
+        time.sleep(0.05)
+    assert process_gone(browser_pid)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def post(url, body, headers=None):
+    data = json.dumps(body).encode()
+    request = urllib.request.Request(url, data, {"Content-Type": "application/json", **(headers or {})})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return json.loads(response.read())
+
+def test_server_with_spawned_worker_does_not_rebuild_services_in_worker(tmp_path):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    env = dict(os.environ, PORT=str(port), DRIVER_WORKERS="1", ADMIN_TOKEN="secret", PYTHONUNBUFFERED="1",
+               POOL_STATE_PATH=str(tmp_path / "pool_state.json"),
+               TRAFFIC_CAPTURE_PATH=str(tmp_path / "capture.jsonl"))
+    base = f"http://127.0.0.1:{port}"
+    output = open(tmp_path / "server.log", "w")
+    # 起動スクリプトとして実行する（ワーカーは api_server.py を __mp_main__ として読み込む）
+    server = subprocess.Popen([sys.executable, os.path.join(ROOT, "api_server.py")], cwd=str(tmp_path), env=env,
+                              stdout=output, stderr=subprocess.STDOUT)
+    try:
+        for _ in range(300):
+            try:
+                with urllib.request.urlopen(f"{base}/health/ready", timeout=1) as response:
+                    if response.status == 200:
+                        break
+            except OSError:
+                pass
+            time.sleep(0.05)
+
+        assert post(f"{base}/connect", {"uniqueId": "worker-user"})["status"] == "connected"
+        assert post(f"{base}/send", {"uniqueId": "worker-user", "message": "hi"})["status"] == "sent"
+
+        profile = post(f"{base}/admin/profile", {"seconds": 0.2}, {"X-Admin-Token": "secret"})
+        worker_threads = set(profile["workers"]["driver-worker-0"]["threads"])
+        api_threads = set(profile["threads"])
+        # APIプロセスだけが終了処理のスレッドやリクエスト記録のスレッドを持つ
+        assert any(name.startswith("driver-teardown-") for name in api_threads)
+        assert not any(name.startswith("driver-teardown-") for name in worker_threads)
+        assert len(worker_threads) < len(api_threads)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(30)
+        output.close()
+
+    log = (tmp_path / "server.log").read_text()
+    assert "Docker関連ファイル" not in log
+    captured = [json.loads(line) for line in (tmp_path / "capture.jsonl").read_text().splitlines()]
+    assert [entry["path"] for entry in captured] == ["/connect", "/send"]
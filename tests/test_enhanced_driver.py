@@ -0,0 +1,152 @@
+# test_enhanced_driver.py - EnhancedTikTokDriver の待機・Cookie操作（代替WebDriverで実行）
+import time
+import pytest
+from selenium.common.exceptions import TimeoutException
+from enhanced_tiktok_driver import EnhancedTikTokDriver, SELECTOR_RACE_SCRIPT
+from fake_webdriver import FakeWebDriver, FakeElement
+from session_store import FileSessionStore
+from deadline import Deadline
+from clock import VirtualClock
+
+class SlowPageDriver(FakeWebDriver):
+    """appears_after 回目の評価から matches に合うロケーターが現れるページ（評価ごとのロケーターを記録）"""
+
+    def __init__(self, matches=lambda locator: False, appears_after=1):
+        super().__init__()
+        self.matches = matches
+        self.appears_after = appears_after
+        self.races = []
+
+    def execute_script(self, script, *args):
+        if script != SELECTOR_RACE_SCRIPT:
+            return super().execute_script(script, *args)
+        self.execute("execute_script")
+        locators, _ = args
+        self.races.append(list(locators))
+        if len(self.races) < self.appears_after:
+            return None
+        for index, locator in enumerate(locators):
+            if self.matches(locator):
+                return [index, FakeElement(self)]
+        return None
+
+@pytest.fixture
+def driver(tmp_path):
+    driver = EnhancedTikTokDriver(
+        headless=True, user_data_dir=str(tmp_path / "profile"), session_store=FileSessionStore(str(tmp_path / "sessions"))
+    )
+    yield driver
+    driver.close()
+
+def use_page(driver, page):
+    driver.driver = page
+    driver.cdp_available = None
+    driver._count_roundtrips()
+    return page
+
+def test_wait_for_any_returns_first_locator_to_appear_with_one_evaluation_per_poll(driver):
+    locators = ["#stale", "//button[text()='Old']", "button[data-e2e='top-login-button']"]
+    page = use_page(driver, SlowPageDriver(lambda locator: locator == locators[2], appears_after=3))
+
+    index, element = driver.wait_for_any(locators, timeout=5, poll_frequency=0.01)
+    assert index == 2
+    assert isinstance(element, FakeElement)
+    # 3ロケーターを毎回まとめて評価するので、評価回数はポーリング回数と同じ
+    assert page.races == [locators] * 3
+    assert driver.roundtrips == 3
+
+def test_wait_for_any_gives_up_after_one_timeout_for_all_locators(driver):
+    page = use_page(driver, SlowPageDriver())
+    started = time.monotonic()
+    with pytest.raises(TimeoutException):
+        driver.wait_for_any(["#a", "#b", "#c", "#d"], timeout=0.3, poll_frequency=0.05)
+    # ロケーターごとに待てば 4 x 0.3 秒かかる
+    assert time.monotonic() - started < 0.9
+    assert all(len(race) == 4 for race in page.races)
+
+def test_login_waits_once_per_step(driver):
+    page = use_page(driver, SlowPageDriver(lambda locator: True))
+    assert driver.enhanced_login("user", "pass")
+    # ログインボタン・ユーザー名・パスワード・送信・ログイン確認の5段階で各1回
+    assert len(page.races) == 5
+    assert page.cookies["sessionid"]["value"].startswith("fake-session-")
+
+class RecordingDriver(FakeWebDriver):
+    """WebDriverコマンドを順に記録（cdp=False ならCDP非対応のリモートWebDriverとして振る舞う）"""
+
+    def __init__(self, cdp=True):
+        super().__init__()
+        self.cdp = cdp
+        self.log = []
+
+    def execute(self, driver_command, params=None):
+        self.log.append(driver_command)
+        super().execute(driver_command, params)
+
+    def execute_cdp_cmd(self, cmd, cmd_args):
+        if not self.cdp:
+            raise RuntimeError("CDP is not supported")
+        self.log.append(cmd)
+        return super().execute_cdp_cmd(cmd, cmd_args)
+
+def saved_session(driver):
+    use_page(driver, FakeWebDriver()).login()
+    driver.driver.cookies["other"] = {"name": "other", "value": "x", "domain": ".example.com", "path": "/"}
+    assert driver.save_session("user")
+
+def test_session_restore_injects_cookies_before_a_single_navigation(driver):
+    saved_session(driver)
+    page = use_page(driver, RecordingDriver())
+    assert driver.load_session("user")
+
+    assert page.log.index("Network.setCookies") < page.log.index("get")
+    assert page.log.count("get") == 1
+    assert "add_cookie" not in page.log and "refresh" not in page.log
+    assert page.cookies["sessionid"]["value"].startswith("fake-session-")
+    # tiktok.com 以外のCookieは保存されていない
+    assert "other" not in page.cookies
+
+def test_session_restore_falls_back_without_cdp(driver):
+    saved_session(driver)
+    page = use_page(driver, RecordingDriver(cdp=False))
+    assert driver.load_session("user")
+
+    assert driver.cdp_available is False
+    assert page.log.index("get") < page.log.index("add_cookie") < page.log.index("refresh")
+    assert set(page.cookies) == {"sessionid", "tt-target-idc"}
+    assert driver.get_session_info() == {name: page.cookies[name]["value"] for name in ("sessionid", "tt-target-idc")}
+
+def test_cdp_cookies_are_read_without_page_context(driver):
+    page = use_page(driver, RecordingDriver())
+    page.cookies["sessionid"] = {"name": "sessionid", "value": "abc", "domain": ".tiktok.com", "path": "/"}
+    page.cookies["other"] = {"name": "other", "value": "x", "domain": ".example.com", "path": "/"}
+    page.log.clear()
+
+    cookies = driver.get_all_cookies()
+    assert page.log == ["Network.getAllCookies", "execute_cdp_cmd"]
+    assert cookies == [{
+        "name": "sessionid", "value": "abc", "domain": ".tiktok.com", "path": "/", "secure": False, "httpOnly": False
+    }]
+    assert len(driver.get_all_cookies(domain=None)) == 2
+
+def test_page_load_timeout_is_set_only_when_the_whole_second_changes(driver):
+    page = use_page(driver, RecordingDriver())
+    # 期限なしなら最初の1回だけ
+    for _ in range(3):
+        driver._navigate("https://www.tiktok.com/")
+    assert page.log.count("set_page_load_timeout") == 1
+    assert page.page_load_timeout == 300
+
+    # 同じ秒のうちの遷移では設定し直さず、秒が減った時だけ下げる
+    page.log.clear()
+    clock = VirtualClock()
+    driver.deadline = Deadline(20.9, clock=clock)
+    for _ in range(3):
+        driver._navigate("https://www.tiktok.com/")
+        clock.advance(0.2)
+    assert page.log.count("set_page_load_timeout") == 1
+    assert page.page_load_timeout == 20
+    clock.advance(5)
+    driver._navigate("https://www.tiktok.com/")
+    assert page.page_load_timeout == 15
+    assert page.log.count("set_page_load_timeout") == 2
@@ -0,0 +1,86 @@
+# test_event_log.py - キュー経由の構造化ログ（例外の出力・コンテキスト項目・満杯時の破棄・書き込みスレッド）
+import json
+import time
+import threading
+import queue
+import logging
+import pytest
+import event_log
+from event_log import DroppingQueueHandler, JsonFormatter, EventLogger, current_phase, get_logger, EVENT_LOG_PATH
+from metrics import REGISTRY
+
+@pytest.fixture
+def queued():
+    """キューに積まれたレコードを直接受け取るロガー"""
+    log_queue = queue.Queue(maxsize=10)
+    handler = DroppingQueueHandler(log_queue)
+    logger = logging.getLogger("tests.event_log.queued")
+    logger.addHandler(handler)
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    yield logger, log_queue
+    logger.removeHandler(handler)
+    logger.propagate = True
+    logger.setLevel(logging.NOTSET)
+
+def test_exception_is_kept_as_its_own_field(queued):
+    logger, log_queue = queued
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        logger.exception("送信失敗 %s", "user1")
+    record = log_queue.get_nowait()
+
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "送信失敗 user1"
+    assert entry["exception"].startswith("Traceback (most recent call last):")
+    assert "ZeroDivisionError: division by zero" in entry["exception"]
+    # コンソール出力ではメッセージに続けてトレースバックが出る
+    console = logging.Formatter("%(levelname)s - %(message)s").format(record)
+    assert console.startswith("ERROR - 送信失敗 user1\nTraceback")
+
+def test_bound_fields_and_phase_are_recorded(queued):
+    logger, log_queue = queued
+    log = EventLogger(logger, {"uniqueId": "user1"}).bind(session="user1#v3")
+    token = current_phase.set("send_message")
+    try:
+        log.info("送信完了")
+    finally:
+        current_phase.reset(token)
+    log.info("フェーズ外")
+
+    entries = [json.loads(JsonFormatter().format(log_queue.get_nowait())) for _ in range(2)]
+    assert {key: entries[0][key] for key in ("message", "uniqueId", "session", "phase")} == {
+        "message": "送信完了", "uniqueId": "user1", "session": "user1#v3", "phase": "send_message"
+    }
+    assert "phase" not in entries[1]
+
+def test_full_queue_drops_and_counts_without_blocking(queued):
+    logger, log_queue = queued
+    dropped = REGISTRY.snapshot().get("tiktok_log_records_dropped_total", 0.0)
+    started = time.monotonic()
+    for i in range(25):
+        logger.info("record %d", i)
+    assert time.monotonic() - started < 1.0
+    assert log_queue.qsize() == 10
+    assert REGISTRY.snapshot()["tiktok_log_records_dropped_total"] == dropped + 15
+
+def test_records_are_written_by_the_writer_thread(monkeypatch):
+    log = get_logger("tests.event_log.pipeline", uniqueId="writer")
+    file_handler = event_log._listener.handlers[0]
+    written = []
+    emit = file_handler.emit
+    def record_thread(record):
+        written.append((threading.current_thread(), record.getMessage()))
+        emit(record)
+    monkeypatch.setattr(file_handler, "emit", record_thread)
+
+    log.info("書き込みスレッド確認")
+    until = time.monotonic() + 5
+    while not written and time.monotonic() < until:
+        time.sleep(0.01)
+    # ファイルへの書き込みは呼び出し元ではなく書き込みスレッドで行われる
+    assert written == [(event_log._listener._thread, "書き込みスレッド確認")]
+    with open(EVENT_LOG_PATH, encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f if "書き込みスレッド確認" in line]
+    assert entries[-1]["uniqueId"] == "writer"
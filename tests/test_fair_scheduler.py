@@ -0,0 +1,169 @@
+# test_fair_scheduler.py - クライアント間の実行枠の配分とクラスタ内部リクエストの認証
+import time
+import threading
+import pytest
+import api_server
+from cluster import ClusterMembership
+from deadline import Deadline
+from fair_scheduler import FairScheduler, ApiClient
+
+def hold(release):
+    release.wait()
+    return {"status": "sent"}
+
+def run_queued(scheduler, requests):
+    """枠を塞いだ状態で requests（クライアントの並び）を順に積み、許可された順を返す"""
+    order = []
+    blocker = ApiClient("blocker")
+    release = threading.Event()
+    holding = threading.Thread(target=scheduler.run, args=(blocker, "hold", hold, release))
+    holding.start()
+    while not scheduler.in_flight.get("blocker"):
+        time.sleep(0.001)
+
+    threads = []
+    for client in requests:
+        thread = threading.Thread(target=scheduler.run, args=(client, "send", lambda c=client: order.append(c.name) or {"status": "sent"}))
+        thread.start()
+        threads.append(thread)
+        while sum(len(queue) for queue in scheduler.queues.values()) < len(threads):
+            time.sleep(0.001)
+
+    release.set()
+    holding.join()
+    for thread in threads:
+        thread.join()
+    return order
+
+def test_slots_are_shared_in_proportion_to_weight():
+    scheduler = FairScheduler(concurrency=1)
+    heavy = ApiClient("heavy", weight=3)
+    light = ApiClient("light", weight=1)
+
+    # 軽いクライアントが先に大量に積んでも、重みの大きいクライアントが待たされ続けない
+    order = run_queued(scheduler, [light] * 8 + [heavy] * 8)
+    assert order[:8].count("heavy") >= 5
+
+def test_in_flight_cap_limits_one_client():
+    scheduler = FairScheduler(concurrency=4)
+    client = ApiClient("capped", max_in_flight=1)
+    active = []
+    overlap = []
+
+    def work():
+        active.append(1)
+        overlap.append(len(active))
+        time.sleep(0.05)
+        active.pop()
+        return {"status": "sent"}
+
+    threads = [threading.Thread(target=scheduler.run, args=(client, "send", work)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max(overlap) == 1
+
+def test_queued_request_times_out_and_full_queue_is_rate_limited():
+    scheduler = FairScheduler(concurrency=1, max_queue=1)
+    client = ApiClient("busy")
+    release = threading.Event()
+    holding = threading.Thread(target=scheduler.run, args=(client, "hold", hold, release))
+    holding.start()
+    while not scheduler.in_flight.get("busy"):
+        time.sleep(0.001)
+    try:
+        assert scheduler.run(client, "send", dict, deadline=Deadline(0.05))["status"] == "timeout"
+
+        waiting = threading.Thread(target=scheduler.run, args=(client, "send", dict))
+        waiting.start()
+        while not scheduler.queues[client]:
+            time.sleep(0.001)
+        assert scheduler.run(client, "send", dict)["status"] == "rate_limited"
+    finally:
+        release.set()
+        holding.join()
+        waiting.join()
+
+@pytest.fixture
+def keys_required(monkeypatch):
+    monkeypatch.setattr(api_server, "API_KEY_REQUIRED", True)
+    monkeypatch.setattr(api_server, "CLUSTER_API_KEY", "internal")
+    monkeypatch.setitem(api_server.api_clients, "internal", ApiClient("cluster"))
+    monkeypatch.setattr(api_server, "ADMIN_TOKEN", "secret")
+    return api_server.app.test_client()
+
+def test_forwarded_connect_with_cluster_key_is_accepted(keys_required):
+    payload = {"uniqueId": "forwarded"}
+    headers = {"X-Cluster-Forwarded": "http://other:3000"}
+    assert keys_required.post("/connect", json=payload, headers=headers).status_code == 401
+
+    response = keys_required.post("/connect", json=payload, headers={**headers, "X-API-Key": "internal"})
+    assert response.status_code == 200
+    assert response.get_json()["status"] == "connected"
+    api_server.connection_pool.disconnect("forwarded")
+
+def test_member_change_migrates_with_cluster_key(keys_required, monkeypatch):
+    self_url, other_url = "http://self:3000", "http://other:3000"
+    monkeypatch.setattr(api_server, "cluster", ClusterMembership(self_url, [self_url]))
+    moving = next(
+        f"user{i}" for i in range(1000)
+        if ClusterMembership(self_url, [self_url, other_url]).owner(f"user{i}") == other_url
+    )
+    assert api_server.connection_pool.create_connection(moving, Deadline(30))["status"] == "connected"
+
+    forwarded = []
+    def forward(node_url, path, payload, deadline=None, api_key=None):
+        forwarded.append((node_url, path, payload, api_key))
+        return api_server.Response("{}", status=200)
+    monkeypatch.setattr(api_server, "forward_to_node", forward)
+
+    response = keys_required.post(
+        "/cluster/members", json={"members": [self_url, other_url]}, headers={"X-Admin-Token": "secret"})
+    assert response.get_json()["moved"] == {moving: other_url}
+    for _ in range(200):
+        if forwarded:
+            break
+        time.sleep(0.01)
+    assert forwarded == [(other_url, "/connect", {"uniqueId": moving}, "internal")]
+    assert moving not in api_server.connection_pool.connections
+
+def test_send_and_disconnect_do_not_wait_behind_long_connects(tmp_path, monkeypatch):
+    pool = api_server.TikTokConnectionPool(state_path=str(tmp_path / "pool_state.json"))
+    monkeypatch.setattr(api_server, "connection_pool", pool)
+    monkeypatch.setattr(api_server, "schedulers", {
+        "connect": FairScheduler(concurrency=2, name="connect"),
+        "send": FairScheduler(concurrency=2, name="send")
+    })
+    client = api_server.app.test_client()
+    for unique_id in ("ready", "leaving"):
+        assert pool.create_connection(unique_id, Deadline(30))["status"] == "connected"
+
+    # Chrome起動に時間のかかる接続で connect 用の枠と起動待ちを埋める
+    release = threading.Event()
+    open_driver = pool._open_driver
+    def slow_open(unique_id, deadline):
+        release.wait(10)
+        return open_driver(unique_id, deadline)
+    pool._open_driver = slow_open
+    connects = [
+        threading.Thread(target=client.post, args=("/connect",), kwargs={"json": {"uniqueId": f"slow{i}"}})
+        for i in range(6)
+    ]
+    for thread in connects:
+        thread.start()
+    try:
+        while api_server.schedulers["connect"].available:
+            time.sleep(0.001)
+
+        started = time.monotonic()
+        response = client.post("/send", json={"uniqueId": "ready", "message": "hi"})
+        assert response.get_json()["status"] == "sent"
+        assert client.post("/disconnect", json={"uniqueId": "leaving"}).get_json()["status"] == "disconnected"
+        assert time.monotonic() - started < 2.0
+        assert not release.is_set()
+    finally:
+        release.set()
+        for thread in connects:
+            thread.join()
+        pool.close_all(timeout=5)
@@ -0,0 +1,90 @@
+# test_http_client.py - 共有HTTPセッションの接続再利用と送信元IPキャッシュ（ローカルのスタブで確認）
+import json
+import time
+import threading
+import pytest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from http_client import EgressIPCache, get_session
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.client_address[1], self.path))
+            index = len(server.requests)
+        gate = server.gates.get(index)
+        if gate is not None:
+            gate.wait(5)
+        body = json.dumps({"origin": f"203.0.113.{index}"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.requests = []
+    # n回目のリクエストの応答を止めておくイベント
+    server.gates = {}
+    server.lock = threading.Lock()
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    for gate in server.gates.values():
+        gate.set()
+    server.shutdown()
+    server.server_close()
+
+def wait_until(condition, timeout=5.0):
+    until = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < until
+        time.sleep(0.005)
+
+def test_shared_session_reuses_one_connection(stub):
+    assert get_session() is get_session()
+    for _ in range(5):
+        assert get_session().get(f"{stub.url}/ip", timeout=5).status_code == 200
+    assert len({port for port, _ in stub.requests}) == 1
+
+def test_egress_ip_is_cached_and_refreshed_in_background(stub):
+    cache = EgressIPCache(url=f"{stub.url}/ip", ttl=60)
+    # 初回は取得を待たずに返す
+    assert cache.get() == "unknown"
+    wait_until(lambda: cache.fetched_at is not None)
+    for _ in range(10):
+        assert cache.get() == "203.0.113.1"
+    assert len(stub.requests) == 1
+
+    # 期限切れでも古い値をすぐ返し、再取得は裏で行う
+    stub.gates[2] = threading.Event()
+    cache.fetched_at -= 60
+    started = time.monotonic()
+    assert cache.get() == "203.0.113.1"
+    assert time.monotonic() - started < 0.5
+    stub.gates[2].set()
+    wait_until(lambda: cache.get() == "203.0.113.2")
+    assert len(stub.requests) == 2
+
+def test_invalidate_discards_lookup_started_before_rebuild(stub):
+    cache = EgressIPCache(url=f"{stub.url}/ip", ttl=60)
+    stub.gates[1] = threading.Event()
+    cache.get()
+    wait_until(lambda: len(stub.requests) == 1)
+
+    # ドライバーをプロキシ付きで作り直した（取得中の古い経路の結果は使わない）
+    cache.invalidate({"http": stub.url})
+    assert cache.get() == "unknown"
+    stub.gates[1].set()
+    wait_until(lambda: cache.ip is not None)
+
+    assert cache.get() == "203.0.113.2"
+    # 作り直し後の取得は新しいプロキシ経由（絶対URLでプロキシに届く）
+    assert stub.requests[1][1] == f"{stub.url}/ip"
@@ -0,0 +1,101 @@
+# test_metrics.py - Prometheus形式の出力順と共有メトリクスファイルのプロセス間の合算
+import os
+import multiprocessing
+import pytest
+from metrics import MetricsRegistry, MemoryStore, MmapStore
+
+def bucket_bounds(text, labels):
+    prefix = f'requests_seconds_bucket{{{labels},le="'
+    return [line[len(prefix):].split('"', 1)[0] for line in text.splitlines() if line.startswith(prefix)]
+
+def test_histogram_buckets_are_rendered_in_numeric_order():
+    registry = MetricsRegistry(MemoryStore())
+    histogram = registry.histogram("requests_seconds", "Request time", ("rule",), buckets=(0.5, 2.5, 10.0, 30.0))
+    for value in (0.1, 3.0, 50.0):
+        histogram.labels(rule="a").observe(value)
+    histogram.labels(rule="b").observe(0.1)
+
+    text = registry.render()
+    assert bucket_bounds(text, 'rule="a"') == ["0.5", "2.5", "10.0", "30.0", "+Inf"]
+    assert bucket_bounds(text, 'rule="b"') == ["0.5", "2.5", "10.0", "30.0", "+Inf"]
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry(MemoryStore())
+    counter = registry.counter("requests_total", "Requests", ("client",))
+    counter.labels(client='C:\\bots\\"main"\nline2').inc()
+    histogram = registry.histogram("requests_seconds", "Request time", ("rule",), buckets=(1.0, 5.0))
+    histogram.labels(rule='a,le="9"').observe(0.5)
+
+    lines = registry.render().splitlines()
+    assert 'requests_total{client="C:\\\\bots\\\\\\"main\\"\\nline2"} 1.0' in lines
+    # 値に le= を含んでもバケットの並びは崩れない
+    assert bucket_bounds("\n".join(lines), 'rule="a,le=\\"9\\""') == ["1.0", "5.0", "+Inf"]
+
+def _record_in_child(path, amount, ready, finish):
+    store = MmapStore(path, regions=4, slots=64)
+    for _ in range(amount):
+        store.inc("requests_total", 1.0)
+    store.set("connections", float(amount))
+    ready.set()
+    finish.wait(30)
+
+def start_child(context, path, amount):
+    ready, finish = context.Event(), context.Event()
+    process = context.Process(target=_record_in_child, args=(path, amount, ready, finish), daemon=True)
+    process.start()
+    assert ready.wait(30)
+    return process, finish
+
+def test_mmap_store_sums_processes_and_drops_gauges_of_exited_ones(tmp_path):
+    path = str(tmp_path / "metrics.mmap")
+    context = multiprocessing.get_context('spawn')
+    first, finish_first = start_child(context, path, 3)
+    second, finish_second = start_child(context, path, 5)
+    reader = MmapStore(path, regions=4, slots=64)
+    try:
+        assert reader.snapshot() == {"requests_total": 8.0, "connections": 8.0}
+        assert reader.live_processes() == 3
+
+        finish_first.set()
+        first.join(30)
+        # 終了したプロセスのカウンターは残り、ゲージは合算から外れる
+        assert reader.snapshot() == {"requests_total": 8.0, "connections": 5.0}
+        assert reader.live_processes() == 2
+
+        # 次に起動したプロセスが空いた領域を引き継ぎ、カウンターを継続する
+        third, finish_third = start_child(context, path, 1)
+        assert reader.snapshot() == {"requests_total": 9.0, "connections": 6.0}
+        finish_third.set()
+        third.join(30)
+    finally:
+        finish_first.set()
+        finish_second.set()
+        second.join(30)
+
+def test_mmap_store_forked_child_writes_to_its_own_region(tmp_path):
+    path = str(tmp_path / "metrics.mmap")
+    store = MmapStore(path, regions=4, slots=64)
+    store.inc("requests_total", 1.0)
+
+    pid = os.fork()
+    if pid == 0:
+        store.inc("requests_total", 10.0)
+        os._exit(0)
+    os.waitpid(pid, 0)
+
+    assert store.index["requests_total"] == 0
+    assert MmapStore(path, regions=4, slots=64).snapshot()["requests_total"] == 11.0
+    assert store.region != MmapStore(path, regions=4, slots=64).region
+
+def test_mmap_store_rejects_file_with_different_layout(tmp_path):
+    path = str(tmp_path / "metrics.mmap")
+    MmapStore(path, regions=4, slots=64)
+    with pytest.raises(RuntimeError):
+        MmapStore(path, regions=8, slots=64)
+
+def test_mmap_store_drops_samples_that_do_not_fit(tmp_path):
+    store = MmapStore(str(tmp_path / "metrics.mmap"), regions=2, slots=2)
+    store.inc("x" * 300, 1.0)
+    for name in ("a", "b", "c"):
+        store.inc(name, 1.0)
+    assert store.snapshot() == {"a": 1.0, "b": 1.0}
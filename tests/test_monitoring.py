@@ -0,0 +1,114 @@
+# test_monitoring.py - 検出イベントのキーセットページング・SQL集計・NDJSONエクスポート
+import json
+import sqlite3
+import pytest
+import api_server
+from datetime import datetime, timedelta
+from advanced_monitoring import BotDetectionMonitor, DetectionEvent
+
+START = datetime(2026, 1, 1, 10, 0, 0)
+
+def record(monitor, minutes, event_type="suspicious", session_id="s1"):
+    monitor.record_event(DetectionEvent(
+        timestamp=START + timedelta(minutes=minutes), event_type=event_type,
+        ip_address="203.0.113.1", user_agent="ua", session_id=session_id, details=""
+    ))
+
+@pytest.fixture
+def monitor(tmp_path):
+    monitor = BotDetectionMonitor(str(tmp_path / "bot_detection.db"))
+    # 同じ時刻のイベントを含む（id で順序が決まる）
+    for i in range(25):
+        record(monitor, i // 2 * 10, ("captcha", "block", "success")[i % 3], ("s1", "s2")[i % 2])
+    return monitor
+
+def all_pages(monitor, limit, **filters):
+    events, cursor, pages = [], None, 0
+    while True:
+        page, cursor = monitor.query_events(cursor=cursor, limit=limit, **filters)
+        events.extend(page)
+        pages += 1
+        if cursor is None:
+            return events, pages
+
+def test_keyset_pages_cover_every_event_once_in_order(monitor):
+    events, pages = all_pages(monitor, 7)
+    assert pages == 4
+    assert [event["id"] for event in events] == list(range(1, 26))
+
+    s1, _ = all_pages(monitor, 4, session_id="s1", since=(START + timedelta(minutes=20)).isoformat())
+    assert [event["id"] for event in s1] == [5, 7, 9, 11, 13, 15, 17, 19, 21, 23, 25]
+
+    until = (START + timedelta(minutes=30)).isoformat()
+    assert [event["id"] for event in all_pages(monitor, 3, until=until)[0]] == [1, 2, 3, 4, 5, 6]
+
+def test_rows_inserted_before_the_cursor_do_not_shift_later_pages(monitor):
+    first, cursor = monitor.query_events(limit=10)
+    record(monitor, -5)
+    second, _ = monitor.query_events(cursor=cursor, limit=10)
+    # OFFSET なら先頭への挿入で1件ずれて重複する
+    assert second[0]["id"] == first[-1]["id"] + 1
+
+def test_paginated_query_uses_the_session_time_index(monitor):
+    with sqlite3.connect(monitor.db_path) as conn:
+        plan = " ".join(row[-1] for row in conn.execute("""
+            EXPLAIN QUERY PLAN
+            SELECT id FROM detection_events
+            WHERE session_id = ? AND (timestamp, id) > (?, ?)
+            ORDER BY timestamp, id LIMIT 10
+        """, ("s1", START.isoformat(), 0)))
+    assert "idx_detection_events_session_time" in plan
+    assert "TEMP B-TREE" not in plan
+
+def test_counts_are_aggregated_per_bucket_and_type(monitor):
+    hourly = monitor.aggregate_events(3600)
+    assert hourly == [
+        {"bucket": "2026-01-01 10:00:00", "counts": {"block": 4, "captcha": 4, "success": 4}},
+        {"bucket": "2026-01-01 11:00:00", "counts": {"block": 4, "captcha": 4, "success": 4}},
+        {"bucket": "2026-01-01 12:00:00", "counts": {"captcha": 1}},
+    ]
+    half_hourly = monitor.aggregate_events(1800, session_id="s2")
+    assert [bucket["bucket"] for bucket in half_hourly] == [
+        "2026-01-01 10:00:00", "2026-01-01 10:30:00", "2026-01-01 11:00:00", "2026-01-01 11:30:00"
+    ]
+    assert sum(sum(bucket["counts"].values()) for bucket in half_hourly) == 12
+
+def test_iter_events_and_session_health_pages(monitor):
+    assert [event["id"] for event in monitor.iter_events(batch_size=4)] == list(range(1, 26))
+
+    with sqlite3.connect(monitor.db_path) as conn:
+        conn.executemany(
+            "INSERT INTO session_health (session_id, status) VALUES (?, ?)",
+            [(f"session{i:02d}", "blocked" if i % 3 == 0 else "active") for i in range(10)]
+        )
+    page, cursor = monitor.query_session_health(limit=4)
+    assert [row["session_id"] for row in page] == ["session00", "session01", "session02", "session03"]
+    page, cursor = monitor.query_session_health(cursor=cursor, limit=4, status="blocked")
+    assert [row["session_id"] for row in page] == ["session06", "session09"]
+    assert cursor is None
+
+@pytest.fixture
+def admin(monitor, monkeypatch):
+    monkeypatch.setattr(api_server, "ADMIN_TOKEN", "secret")
+    monkeypatch.setattr(api_server, "_monitor", monitor)
+    client = api_server.app.test_client()
+    client.environ_base["HTTP_X_ADMIN_TOKEN"] = "secret"
+    return client
+
+def test_monitor_endpoints(admin):
+    page = admin.get("/monitor/events?session_id=s2&limit=5").get_json()
+    assert [event["id"] for event in page["events"]] == [2, 4, 6, 8, 10]
+    page = admin.get(f"/monitor/events?session_id=s2&limit=5&cursor={page['next_cursor']}").get_json()
+    assert [event["id"] for event in page["events"]] == [12, 14, 16, 18, 20]
+    assert admin.get("/monitor/events?cursor=garbage").status_code == 400
+
+    assert admin.get("/monitor/events/aggregate?bucket=0").status_code == 400
+    assert len(admin.get("/monitor/events/aggregate?bucket=3600").get_json()["buckets"]) == 3
+
+    response = admin.get("/monitor/events/export?session_id=s1")
+    assert response.is_streamed
+    assert response.mimetype == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [event["id"] for event in lines] == list(range(1, 26, 2))
+
+    assert admin.get("/monitor/events", environ_base={"HTTP_X_ADMIN_TOKEN": "wrong"}).status_code == 401
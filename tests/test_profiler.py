@@ -0,0 +1,74 @@
+# test_profiler.py - サンプリングプロファイラーの集計・主要処理のタグ付け・管理エンドポイント
+import sys
+import time
+import threading
+import pytest
+import api_server
+from profiler import SamplingProfiler, ProfilerBusy, PROFILER
+
+def send_message(release):
+    """接続プールの送信処理に見立てた待機"""
+    release.wait(10)
+
+@pytest.fixture
+def sending():
+    release = threading.Event()
+    thread = threading.Thread(target=send_message, args=(release,), name="sender")
+    thread.start()
+    yield thread
+    release.set()
+    thread.join()
+
+@pytest.fixture
+def admin(monkeypatch):
+    monkeypatch.setattr(api_server, "ADMIN_TOKEN", "secret")
+    return api_server.app.test_client()
+
+def test_tagged_call_site_roots_the_collapsed_stack(sending):
+    result = SamplingProfiler().run(0.1, 0.005)
+    assert result["samples"] > 1
+
+    stacks = [line.rsplit(" ", 1)[0] for line in result["collapsed"].splitlines()]
+    sender = [stack for stack in stacks if stack.startswith("sender;")]
+    assert sender and all(stack.startswith("sender;[send_message];") for stack in sender)
+    assert "send_message (test_profiler.py:" in sender[0]
+    assert result["tagged"]["send_message"] >= result["samples"] - 1
+    # Event.wait で止まっているスレッドはロック待ちに分類される
+    assert set(result["threads"]["sender"]) == {"lock_wait"}
+
+def test_profiler_costs_nothing_until_run():
+    assert sys.getprofile() is None and sys.gettrace() is None
+    assert not any("profile" in thread.name for thread in threading.enumerate())
+
+def test_concurrent_runs_are_rejected(admin, sending):
+    profiler = SamplingProfiler()
+    running = threading.Thread(target=profiler.run, args=(0.3,))
+    running.start()
+    while not profiler.lock.locked():
+        time.sleep(0.001)
+    try:
+        with pytest.raises(ProfilerBusy):
+            profiler.run(0.1)
+    finally:
+        running.join()
+
+    with PROFILER.lock:
+        response = admin.post("/admin/profile", json={"seconds": 0.1}, headers={"X-Admin-Token": "secret"})
+    assert response.status_code == 409
+
+def test_admin_endpoint_formats(admin, sending):
+    assert admin.post("/admin/profile", json={"seconds": 0.1}).status_code == 401
+    headers = {"X-Admin-Token": "secret"}
+    assert admin.post("/admin/profile", json={"seconds": 0}, headers=headers).status_code == 400
+    assert admin.post("/admin/profile", json={"seconds": "ten"}, headers=headers).status_code == 400
+
+    result = admin.post("/admin/profile", json={"seconds": 0.1, "interval": 0.01}, headers=headers).get_json()
+    assert result["interval"] == 0.01
+    assert result["workers"] == {}
+    assert "sender" in result["threads"]
+
+    response = admin.post("/admin/profile", json={"seconds": 0.1, "format": "collapsed"}, headers=headers)
+    assert response.mimetype == "text/plain"
+    lines = response.get_data(as_text=True).splitlines()
+    assert all(line.startswith("api;") and line.rsplit(" ", 1)[1].isdigit() for line in lines)
+    assert any(line.startswith("api;sender;[send_message];") for line in lines)
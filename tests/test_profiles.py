@@ -0,0 +1,106 @@
+# test_profiles.py - プロファイルの複製・掃除とディスク使用量の計算
+import os
+import time
+import pytest
+import profiles
+import api_server
+from deadline import Deadline
+from profiles import ProfileManager, LAST_USED_MARKER
+
+def write(path, size):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b"x" * size)
+
+def test_prepare_clones_template_without_caches(tmp_path):
+    manager = ProfileManager(str(tmp_path / "profiles"))
+    write(str(tmp_path / "profiles-template" / "Default" / "Preferences"), 10)
+    write(str(tmp_path / "profiles-template" / "Default" / "Cache" / "data"), 10)
+
+    path = manager.prepare("a")
+    assert os.path.isfile(os.path.join(path, "Default", "Preferences"))
+    assert not os.path.exists(os.path.join(path, "Default", "Cache"))
+
+def test_cleanup_keeps_active_and_recent(tmp_path):
+    manager = ProfileManager(str(tmp_path))
+    for name in ("active", "recent", "old"):
+        manager.prepare(name)
+    old = time.time() - 30 * 86400
+    for name in ("active", "old"):
+        os.utime(tmp_path / name / LAST_USED_MARKER, (old, old))
+
+    assert manager.cleanup(["active"], max_age_days=7) == ["old"]
+    assert sorted(os.listdir(tmp_path)) == ["active", "recent"]
+
+def test_template_is_outside_unique_id_namespace(tmp_path):
+    root = tmp_path / "profiles"
+    write(str(tmp_path / "profiles-template" / "Default" / "Preferences"), 10)
+    manager = ProfileManager(str(root))
+
+    # "_template" は通常のuniqueIdとして扱われ、テンプレートから複製される
+    path = manager.prepare("_template")
+    write(os.path.join(path, "Default", "Cache", "data"), 10)
+    manager.prune("_template")
+    assert os.path.isfile(tmp_path / "profiles-template" / "Default" / "Preferences")
+    assert not os.path.exists(tmp_path / "profiles-template" / LAST_USED_MARKER)
+
+def test_template_configured_inside_root_cannot_be_used_as_profile(tmp_path):
+    manager = ProfileManager(str(tmp_path), template=str(tmp_path / "base"))
+    os.makedirs(tmp_path / "base")
+    with pytest.raises(ValueError):
+        manager.prepare("base")
+    with pytest.raises(ValueError):
+        manager.prune("base")
+    assert "base" not in manager.cleanup([], max_age_days=0)
+
+def test_legacy_template_is_moved_out_of_root(tmp_path):
+    write(str(tmp_path / "profiles" / "_template" / "Default" / "Preferences"), 10)
+    manager = ProfileManager(str(tmp_path / "profiles"))
+    assert manager.template == str(tmp_path / "profiles-template")
+    assert os.path.isfile(tmp_path / "profiles-template" / "Default" / "Preferences")
+    assert not os.path.exists(tmp_path / "profiles" / "_template")
+
+def test_connect_as_template_name_leaves_template_untouched(tmp_path, monkeypatch):
+    pool = api_server.TikTokConnectionPool(state_path=str(tmp_path / "pool_state.json"))
+    pool.profiles = ProfileManager(str(tmp_path / "profiles"))
+    write(str(tmp_path / "profiles-template" / "Default" / "Preferences"), 10)
+    try:
+        assert pool.create_connection("_template", Deadline(30))["status"] == "connected"
+        assert pool.disconnect("_template")["status"] == "disconnected"
+    finally:
+        pool.close_all(timeout=5)
+    assert os.listdir(tmp_path / "profiles-template") == ["Default"]
+
+def test_disk_usage_is_computed_only_by_refresh(tmp_path, monkeypatch):
+    manager = ProfileManager(str(tmp_path))
+    write(str(tmp_path / "a" / "data"), 8192)
+    write(str(tmp_path / "gone" / "data"), 8192)
+    walked = []
+    directory_size = profiles.directory_size
+    monkeypatch.setattr(profiles, "directory_size", lambda path: walked.append(path) or directory_size(path))
+
+    assert manager.disk_usage("a") is None
+    assert walked == []
+
+    assert manager.refresh_usage(["a", "gone"]) == 2
+    assert manager.disk_usage("a") >= 8192
+    # 計算から PROFILE_USAGE_TTL 以内は再計算しない
+    assert manager.refresh_usage(["a"]) == 0
+    assert manager.disk_usage("gone") is None
+    for _ in range(10):
+        manager.disk_usage("a")
+    assert len(walked) == 2
+
+def test_status_does_not_walk_profiles(monkeypatch):
+    pool = api_server.connection_pool
+    assert pool.create_connection("status-reader", Deadline(30))["status"] == "connected"
+    try:
+        walked = []
+        monkeypatch.setattr(profiles, "directory_size", walked.append)
+        body = api_server.app.test_client().get("/status").get_json()
+        assert body["connections"]["status-reader"]["profile_bytes"] is None
+        assert body["profile_bytes_total"] == 0
+        assert walked == []
+    finally:
+        monkeypatch.undo()
+        pool.disconnect("status-reader")
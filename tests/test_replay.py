@@ -0,0 +1,95 @@
+# test_replay.py - リクエストの記録と再生（記録ミドルウェア・再生順序と速度・代替WebDriverのサーバーでの再生）
+import json
+import threading
+import pytest
+from werkzeug.serving import make_server
+import api_server
+import replay
+from traffic_capture import TrafficRecorder
+
+def capture_line(t, path, body, status=200):
+    return {"t": t, "method": "POST", "path": path, "body": body, "status": status, "latency": 0.01}
+
+def write_capture(path, entries):
+    with open(path, "w", encoding="utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(entry) + "\n")
+    return str(path)
+
+def test_api_calls_are_captured_with_relative_times(tmp_path, monkeypatch):
+    recorder = TrafficRecorder(str(tmp_path / "capture.jsonl"))
+    monkeypatch.setattr(api_server, "traffic_recorder", recorder)
+    client = api_server.app.test_client()
+
+    client.post("/connect", json={"uniqueId": "captured"})
+    client.get("/status")
+    client.post("/send", json={"uniqueId": "captured", "message": "hi"})
+    client.post("/send", json={"uniqueId": "captured"})
+    client.post("/disconnect", json={"uniqueId": "captured"})
+    recorder.close()
+
+    entries = replay.load_capture(recorder.path)
+    assert [(entry["path"], entry["status"]) for entry in entries] == [
+        ("/connect", 200), ("/send", 200), ("/send", 400), ("/disconnect", 200)
+    ]
+    assert entries[1]["body"] == {"uniqueId": "captured", "message": "hi"}
+    assert all(0 <= a["t"] <= b["t"] for a, b in zip(entries, entries[1:]))
+    assert all(entry["latency"] >= 0 for entry in entries)
+
+def test_summary_percentiles_and_errors():
+    assert replay.percentile([1, 2, 3, 4], 50) == 2
+    assert replay.percentile([1, 2, 3, 4], 99) == 4
+    assert replay.percentile([], 50) is None
+
+    results = [
+        {"path": "/send", "status": 200, "error": None, "latency": latency, "expected_status": 200}
+        for latency in (0.1, 0.2, 0.3)
+    ] + [{"path": "/send", "status": 0, "error": "refused", "latency": 0.5, "expected_status": 200}]
+    stats = replay.summarize(results, 1.0)["paths"]["/send"]
+    assert (stats["count"], stats["errors"], stats["matched"]) == (4, 1, 3)
+    assert (stats["p50"], stats["max"]) == (0.2, 0.5)
+    assert stats["status"] == {"200": 3, "0": 1}
+
+@pytest.fixture
+def server():
+    http_server = make_server("127.0.0.1", 0, api_server.app, threaded=True)
+    thread = threading.Thread(target=http_server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{http_server.server_port}"
+    http_server.shutdown()
+
+def test_replay_keeps_per_id_order_and_paces_by_speed(server):
+    entries = []
+    for i in range(5):
+        unique_id = f"replayed{i}"
+        entries += [
+            capture_line(0.0, "/connect", {"uniqueId": unique_id}),
+            capture_line(0.0, "/send", {"uniqueId": unique_id, "message": "hi"}),
+            capture_line(2.0, "/disconnect", {"uniqueId": unique_id}),
+        ]
+
+    # max 速度でも同じuniqueIdは記録順に送るため、送信が接続より先に届かない
+    summary = replay.replay(entries, server, speed=None, concurrency=8)
+    assert summary["requests"] == 15
+    for path in ("/connect", "/send", "/disconnect"):
+        assert summary["paths"][path]["errors"] == 0
+        assert summary["paths"][path]["matched"] == 5
+
+    # 10倍速なら最後の記録（2秒）は0.2秒後に送る
+    summary = replay.replay(entries, server, speed=10.0, concurrency=8)
+    assert summary["elapsed"] >= 0.2
+    assert sum(stats["errors"] for stats in summary["paths"].values()) == 0
+
+def test_replay_command_starts_fake_server(tmp_path, capsys):
+    capture = write_capture(tmp_path / "capture.jsonl", [
+        capture_line(0.0, "/connect", {"uniqueId": "cli"}),
+        capture_line(0.1, "/send", {"uniqueId": "cli", "message": "hi"}),
+        capture_line(0.2, "/connect/bulk", {"uniqueIds": ["cli", "cli2"]}),
+        capture_line(0.3, "/disconnect/bulk", {"uniqueIds": ["cli", "cli2"]}),
+    ])
+    replay.main([capture, "--speed", "max", "--json"])
+    summary = json.loads(capsys.readouterr().out)
+    assert summary["requests"] == 4
+    assert {path: stats["errors"] for path, stats in summary["paths"].items()} == {
+        "/connect": 0, "/send": 0, "/connect/bulk": 0, "/disconnect/bulk": 0
+    }
@@ -0,0 +1,226 @@
+# test_session_store.py - セッションストアのキーの扱い・versionによる競合判定・Cookieの書き戻し
+import os
+import threading
+import pytest
+import api_server
+from deadline import Deadline
+from enhanced_tiktok_driver import EnhancedTikTokDriver
+from session_store import FileSessionStore, SQLiteSessionStore, RedisSessionStore
+
+class InProcessRedis:
+    """WATCH/MULTI/EXEC を解釈するプロセス内のRedis代替（接続ごとに1インスタンス）"""
+
+    def __init__(self, data=None):
+        self.data = data if data is not None else {}
+        self.versions = {}
+        self.watched = {}
+        self.queued = None
+
+    def connect(self):
+        """同じデータを共有する別の接続（別レプリカ相当）"""
+        other = InProcessRedis(self.data)
+        other.versions = self.versions
+        return other
+
+    def execute(self, *args):
+        command, rest = args[0], args[1:]
+        if command == 'WATCH':
+            self.watched[rest[0]] = self.versions.get(rest[0], 0)
+            return 'OK'
+        if command == 'UNWATCH':
+            self.watched.clear()
+            return 'OK'
+        if command == 'MULTI':
+            self.queued = []
+            return 'OK'
+        if command == 'DISCARD':
+            self.queued = None
+            self.watched.clear()
+            return 'OK'
+        if command == 'EXEC':
+            queued, self.queued = self.queued, None
+            changed = any(self.versions.get(key, 0) != seen for key, seen in self.watched.items())
+            self.watched.clear()
+            if changed:
+                return None
+            return [self._apply(*queued_args) for queued_args in queued]
+        if self.queued is not None:
+            self.queued.append(args)
+            return 'QUEUED'
+        return self._apply(*args)
+
+    def close(self):
+        self.queued = None
+        self.watched.clear()
+
+    def _apply(self, command, key, *values):
+        if command == 'GET':
+            return self.data.get(key)
+        if command == 'SET':
+            self.data[key] = values[0]
+            self.versions[key] = self.versions.get(key, 0) + 1
+            return 'OK'
+        raise ValueError(command)
+
+@pytest.fixture(params=["file", "sqlite", "redis"])
+def store_pair(request, tmp_path):
+    """同じ保存先を参照する2つのストア（2つのレプリカ相当）"""
+    if request.param == "file":
+        return FileSessionStore(str(tmp_path)), FileSessionStore(str(tmp_path))
+    if request.param == "sqlite":
+        path = str(tmp_path / "sessions.db")
+        return SQLiteSessionStore(path), SQLiteSessionStore(path)
+    redis = InProcessRedis()
+    return RedisSessionStore(connection=redis), RedisSessionStore(connection=redis.connect())
+
+def cookies(session_id):
+    return [{"name": "sessionid", "value": session_id}, {"name": "tt-target-idc", "value": "useast2a"}]
+
+def test_save_from_stale_base_version_is_rejected(store_pair):
+    first, second = store_pair
+    assert first.save("a", {"cookies": cookies("login")}) == 1
+
+    assert first.save("a", {"cookies": cookies("first")}, base_version=1) == 2
+    assert second.save("a", {"cookies": cookies("second")}, base_version=1) is None
+    assert second.load("a")["cookies"] == cookies("first")
+
+    # 新規ログインは常に保存される
+    assert second.save("a", {"cookies": cookies("relogin")}) == 3
+
+def test_concurrent_saves_from_same_base_keep_one_winner(store_pair):
+    first, second = store_pair
+    first.save("a", {"cookies": cookies("login")})
+    results = []
+    threads = [
+        threading.Thread(target=lambda store=store, name=name: results.append(
+            store.save("a", {"cookies": cookies(name)}, base_version=1)))
+        for store, name in ((first, "first"), (second, "second"))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(results, key=str) == [2, None]
+
+def test_redis_save_retries_when_another_replica_writes_between_watch_and_exec():
+    redis = InProcessRedis()
+    other = RedisSessionStore(connection=redis.connect())
+    store = RedisSessionStore(connection=redis)
+    store.save("a", {"cookies": cookies("login")})
+
+    execute = redis.execute
+    def interleaved(*args):
+        if args[0] == 'MULTI' and not interleaved.done:
+            interleaved.done = True
+            other.save("a", {"cookies": cookies("other")}, base_version=1)
+        return execute(*args)
+    interleaved.done = False
+    redis.execute = interleaved
+
+    # 再試行時には他レプリカの version 2 が見えるため、version 1 を元にした保存は競合になる
+    assert store.save("a", {"cookies": cookies("mine")}, base_version=1) is None
+    assert store.load("a")["cookies"] == cookies("other")
+
+def failing(redis, command, error, times=1):
+    """command の実行時に error を times 回送出する接続"""
+    execute = redis.execute
+    remaining = [times]
+    def execute_or_fail(*args):
+        if args[0] == command and remaining[0]:
+            remaining[0] -= 1
+            raise error
+        return execute(*args)
+    redis.execute = execute_or_fail
+    return redis
+
+def test_redis_error_inside_multi_is_discarded_before_the_next_command():
+    redis = InProcessRedis()
+    store = RedisSessionStore(connection=redis)
+    store.save("a", {"cookies": cookies("login")})
+
+    failing(redis, 'SET', RuntimeError("OOM command not allowed when used memory > 'maxmemory'"))
+    with pytest.raises(RuntimeError):
+        store.save("a", {"cookies": cookies("rotated")}, base_version=1)
+    # MULTI のまま残っていれば、次の GET はキューに積まれて値が読めない
+    assert store.load("a")["cookies"] == cookies("login")
+    assert store.save("a", {"cookies": cookies("rotated")}, base_version=1) == 2
+
+def test_redis_connection_errors_are_retried_and_raised_when_retries_run_out():
+    redis = InProcessRedis()
+    store = RedisSessionStore(connection=redis, max_retries=3)
+    failing(redis, 'GET', ConnectionError("Redis接続が切断されました"), times=2)
+    assert store.save("a", {"cookies": cookies("login")}) == 1
+
+    # 再試行が尽きても競合（None）とは報告しない
+    failing(redis, 'WATCH', ConnectionError("Redis接続が切断されました"), times=3)
+    with pytest.raises(ConnectionError):
+        store.save("a", {"cookies": cookies("rotated")}, base_version=1)
+    assert store.save("a", {"cookies": cookies("rotated")}, base_version=1) == 2
+
+def rotate(driver, session_id):
+    driver.driver.cookies["sessionid"]["value"] = session_id
+
+def test_rotated_cookies_are_written_back_and_adopted_by_stale_replica(tmp_path):
+    store = FileSessionStore(str(tmp_path))
+    first = EnhancedTikTokDriver(session_store=store, user_data_dir=str(tmp_path / "first"))
+    second = EnhancedTikTokDriver(session_store=store, user_data_dir=str(tmp_path / "second"))
+    try:
+        assert first.enhanced_login("test", "test") and first.save_session("a")
+        assert second.load_session("a")
+        assert not first.sync_session("a")
+
+        rotate(first, "rotated-first")
+        assert first.sync_session("a")
+        assert store.load("a")["version"] == 2
+
+        # 古いversionを元に更新したレプリカは上書きせず、新しいCookieを取り込む
+        rotate(second, "rotated-second")
+        assert not second.sync_session("a")
+        assert second.session_version == 2
+        assert second.get_session_info()["sessionid"] == "rotated-first"
+        assert store.load("a")["version"] == 2
+    finally:
+        first.close()
+        second.close()
+
+def test_send_writes_rotated_cookies_back_to_store(tmp_path):
+    pool = api_server.TikTokConnectionPool(state_path=str(tmp_path / "pool_state.json"))
+    try:
+        assert pool.create_connection("rotating", Deadline(30))["status"] == "connected"
+        version = pool.session_store.load("rotating")["version"]
+
+        rotate(pool.drivers["rotating"], "rotated")
+        assert pool.send_message("rotating", "hello", Deadline(30))["status"] == "sent"
+
+        saved = pool.session_store.load("rotating")
+        assert saved["version"] == version + 1
+        assert {cookie["name"]: cookie["value"] for cookie in saved["cookies"]}["sessionid"] == "rotated"
+    finally:
+        pool.close_all(timeout=5)
+
+@pytest.mark.parametrize("key", ["../../package.json", "/etc/passwd", "a/b", "..", "x.json"])
+def test_file_store_keeps_every_key_inside_its_directory(tmp_path, key):
+    store = FileSessionStore(str(tmp_path / "sessions"))
+    path = store.path_for(key)
+    assert os.path.dirname(os.path.abspath(path)) == str(tmp_path / "sessions")
+    assert path.endswith("_session.json")
+
+    store.save(key, {"cookies": []})
+    assert store.load(key)["cookies"] == []
+    assert sorted(os.listdir(tmp_path)) == ["sessions"]
+
+def test_file_store_keeps_existing_file_names(tmp_path):
+    store = FileSessionStore(str(tmp_path))
+    assert store.path_for("user.name_1") == os.path.join(str(tmp_path), "user.name_1_session.json")
+
+@pytest.mark.parametrize("path", ["/connect", "/send", "/disconnect"])
+@pytest.mark.parametrize("unique_id", ["../../package.json", "a/b", "..", "x" * 65])
+def test_api_rejects_unique_ids_that_are_not_names(path, unique_id):
+    client = api_server.app.test_client()
+    response = client.post(path, json={"uniqueId": unique_id, "message": "hello"})
+    assert response.status_code == 400
+
+def test_bulk_api_rejects_unique_ids_that_are_not_names():
+    client = api_server.app.test_client()
+    response = client.post("/connect/bulk", json={"uniqueIds": ["ok", "../x"]})
+    assert response.status_code == 400
@@ -0,0 +1,61 @@
+# test_settings.py - 実行時設定の検証と管理APIからの変更
+import pytest
+import api_server
+from settings import PoolSettings, SettingsError
+
+def defaults(**overrides):
+    values = {"max_connections": 0, "connect_concurrency": 4, "idle_timeout": 0,
+              "cookie_cache_ttl": 0, "send_rate": 0}
+    values.update(overrides)
+    return values
+
+@pytest.mark.parametrize("name, value", [
+    ("idle_timeout", float("nan")),
+    ("idle_timeout", "nan"),
+    ("idle_timeout", float("inf")),
+    ("cookie_cache_ttl", "-inf"),
+    ("max_connections", float("inf")),
+    ("max_connections", 2.5),
+    ("connect_concurrency", 0),
+    ("send_rate", 101),
+    ("send_rate", True),
+    ("send_rate", "fast"),
+])
+def test_invalid_values_are_rejected_without_partial_update(name, value):
+    settings = PoolSettings(**defaults())
+    with pytest.raises(SettingsError):
+        settings.update({"max_connections": 5, name: value})
+    assert settings.as_dict() == PoolSettings(**defaults()).as_dict()
+
+def test_nan_from_environment_fails_at_start_up():
+    with pytest.raises(SettingsError):
+        PoolSettings(**defaults(idle_timeout="NaN"))
+
+def test_update_notifies_only_changed_fields():
+    settings = PoolSettings(**defaults())
+    changes = []
+    settings.on_change(changes.append)
+
+    assert settings.update({"max_connections": "3", "send_rate": 0})["max_connections"] == 3
+    assert changes == [["max_connections"]]
+
+@pytest.fixture
+def admin(monkeypatch):
+    monkeypatch.setattr(api_server, "ADMIN_TOKEN", "secret")
+    original = api_server.connection_pool.settings.as_dict()
+    yield api_server.app.test_client()
+    api_server.connection_pool.settings.update(original)
+
+def test_admin_api_requires_token(admin):
+    assert admin.get("/admin/settings").status_code == 401
+    assert admin.get("/admin/settings", headers={"X-Admin-Token": "wrong"}).status_code == 401
+
+def test_admin_api_applies_valid_settings_and_rejects_nan(admin):
+    headers = {"X-Admin-Token": "secret", "Content-Type": "application/json"}
+    response = admin.patch("/admin/settings", data='{"cookie_cache_ttl": NaN}', headers=headers)
+    assert response.status_code == 400
+
+    response = admin.patch("/admin/settings", json={"cookie_cache_ttl": 30}, headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()["cookie_cache_ttl"] == 30.0
+    assert api_server.connection_pool.settings.cookie_cache_ttl == 30.0
@@ -0,0 +1,66 @@
+# traffic_capture.py - APIリクエストの記録（負荷試験の再生用、書き込みは専用スレッド）
+import os
+import json
+import time
+import queue
+import threading
+from metrics import REGISTRY
+
+# 記録先（未設定なら記録しない）
+TRAFFIC_CAPTURE_PATH = os.getenv('TRAFFIC_CAPTURE_PATH')
+TRAFFIC_CAPTURE_QUEUE_SIZE = int(os.getenv('TRAFFIC_CAPTURE_QUEUE_SIZE', '10000'))
+
+# 記録対象のエンドポイント
+CAPTURED_PATHS = ('/connect', '/send', '/disconnect', '/connect/bulk', '/disconnect/bulk')
+
+CAPTURE_DROPPED = REGISTRY.counter(
+    "tiktok_traffic_capture_dropped_total", "Captured requests dropped because the capture queue was full"
+)
+
+class TrafficRecorder:
+    """リクエストを記録開始からの相対時刻付きでJSONLに追記する
+
+    1行の形式: {"t": 秒, "method": "POST", "path": "/send", "body": {...},
+               "status": 200, "latency": 秒}
+    """
+
+    def __init__(self, path, queue_size=TRAFFIC_CAPTURE_QUEUE_SIZE):
+        self.path = path
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.started = time.monotonic()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.writer = threading.Thread(target=self._write_loop, daemon=True)
+        self.writer.start()
+
+    def record(self, started, method, path, body, status):
+        """リクエスト1件を記録（キューが満杯なら破棄し、呼び出し側は待たない）"""
+        entry = {
+            "t": round(started - self.started, 6),
+            "method": method,
+            "path": path,
+            "body": body,
+            "status": status,
+            "latency": round(time.monotonic() - started, 6)
+        }
+        try:
+            self.queue.put_nowait(entry)
+        except queue.Full:
+            CAPTURE_DROPPED.inc()
+
+    def _write_loop(self):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            while True:
+                entry = self.queue.get()
+                if entry is None:
+                    break
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                # キューが空になった時だけフラッシュ（まとめて書き込む）
+                if self.queue.empty():
+                    f.flush()
+
+    def close(self, timeout=5.0):
+        """残りを書き出して停止"""
+        self.queue.put(None)
+        self.writer.join(timeout)